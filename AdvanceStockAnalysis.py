@@ -5,17 +5,41 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from bs4 import BeautifulSoup
 from datetime import datetime
 from streamlit_autorefresh import st_autorefresh
 import yfinance as yf
 import warnings
+import functools
+import hashlib
+import hmac
 import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from nselib import capital_market
 from nselib import derivatives
 import pandas_market_calendars as mcal
 import urllib.parse
 
+from bars import NSE_SESSION_MINUTES, StreamingResampler, compact_frame, frame_memory_kb, generate_synthetic_ohlcv
+from indicators import (INDICATOR_REGISTRY, OHLCV_FIELDS, PUBLIC_INDICATORS, IncrementalIndicatorEngine,
+                        compute_indicators, required_history, universe_indicator_snapshot)
+from backtest import (BACKTEST_COSTS, DEFAULT_RULE_PARAMS, RULE_HOLDOUT_FRACTION, RULE_WINDOW_KEYS, backtest_panel,
+                      generate_rule_based_trading_signal, rule_feature_frame, rule_history_bars, rule_param_grid,
+                      rule_sma_windows, rule_weights, walk_forward_rank)
+from prompts import (BATCH_INDICATORS, BATCH_MAX_SYMBOLS, GEMINI_SIGNAL_SCHEMA, PROMPT_STYLES, PROMPT_TOKEN_BUDGET,
+                     compile_prompt, feature_snapshot, universe_snapshots)
+from llm import LLMFanout, score_batched
+from benchmarks import show_performance_lab
+
 try:
     from groq import Groq
     GROQ_AVAILABLE = True
@@ -34,6 +58,24 @@ try:
 except ImportError:
     SUPABASE_AVAILABLE = False
 
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+try:
+    import httpx   # installed with the openai / groq SDKs
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401 — lets httpx speak HTTP/2 to the AI providers
+    HTTP2_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 warnings.filterwarnings('ignore')
 
 # --- API Keys — loaded from .streamlit/secrets.toml (local) or Streamlit Cloud Secrets ---
@@ -49,6 +91,21 @@ GROQ_API_KEY    = _secret("GROQ_API_KEY")
 XAI_API_KEY     = _secret("XAI_API_KEY")
 SUPABASE_URL    = _secret("SUPABASE_URL")
 SUPABASE_KEY    = _secret("SUPABASE_KEY")
+REDIS_URL       = _secret("REDIS_URL")   # optional: share caches through Redis instead of CACHE_DIR
+CACHE_DIR       = _secret("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+# optional: keep cached history frames as float32 / narrow ints and trim company info
+COMPACT_FRAMES  = str(_secret("COMPACT_FRAMES", "false")).lower() in ("1", "true", "yes", "on")
+# developer-only: show the sidebar Performance lab (benchmarks allocate hundreds of MB and pin every core)
+# and the per-page load timings / server counters
+PERF_LAB        = str(_secret("PERF_LAB", "false")).lower() in ("1", "true", "yes", "on")
+# admin key for saving tuned rule parameters for every visitor; without it, tuning only affects the session
+RULE_PARAMS_ADMIN_KEY = _secret("RULE_PARAMS_ADMIN_KEY")
+# seconds a page waits for the AI providers (called concurrently) before showing what has arrived
+LLM_FANOUT_DEADLINE_S = float(_secret("LLM_FANOUT_DEADLINE_S", 12))
+# most symbols the batched screener scoring packs into one AI request
+LLM_BATCH_MAX_SYMBOLS = int(_secret("LLM_BATCH_MAX_SYMBOLS", BATCH_MAX_SYMBOLS))
+# estimated-token ceiling for a single-stock AI prompt; rules, then minor indicators, are dropped to fit
+LLM_PROMPT_TOKEN_BUDGET = int(_secret("LLM_PROMPT_TOKEN_BUDGET", PROMPT_TOKEN_BUDGET))
 XAI_MODEL = "grok-3"
 model_name = "gemini-2.0-flash"
 
@@ -315,108 +372,885 @@ def safe_execute(func):
             return None, f"An unexpected error occurred: {e}"
     return wrapper
 
+# --- Shared HTTP Client (pooled keep-alive, per-host limits, jittered retries) ---
+HTTP_POOL_HOSTS = 10               # hosts whose connection pools are kept warm
+HTTP_POOL_MAXSIZE = 8              # keep-alive connections per host
+HTTP_HOST_CONCURRENCY = {          # in-flight request caps for hosts that throttle hard
+    "finnhub.io": 4,
+    "www.nseindia.com": 2,
+    "api.gdeltproject.org": 2,
+}
+HTTP_DEFAULT_HOST_CONCURRENCY = HTTP_POOL_MAXSIZE
+# URL prefixes whose 429s go straight back to the caller instead of being retried by urllib3:
+# these APIs have their own budget (FinnhubClient's token bucket) and hidden retries would bypass it
+HTTP_NO_429_RETRY = ("https://finnhub.io/",)
+
+
+class PooledHTTPClient:
+    """One requests.Session shared by every outbound call in the process.
+
+    Connections are kept alive per host, GETs are retried on connection errors and
+    429/5xx with jittered exponential backoff (POSTs are never replayed), and each
+    host has a cap on concurrent in-flight requests. Hosts in HTTP_NO_429_RETRY get
+    their 429s back unretried, so their callers can back off.
+    """
+
+    def __init__(self):
+        self._adapter = self._make_adapter((429, 500, 502, 503, 504))
+        self._budgeted_adapter = self._make_adapter((500, 502, 503, 504))
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        for prefix in HTTP_NO_429_RETRY:
+            self.session.mount(prefix, self._budgeted_adapter)
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_adapter(status_forcelist):
+        retry_kwargs = dict(total=3, connect=3, read=2, status=3, backoff_factor=0.5,
+                            status_forcelist=status_forcelist,
+                            respect_retry_after_header=False, raise_on_status=False)
+        try:
+            retry = Retry(backoff_jitter=0.5, **retry_kwargs)
+        except TypeError:   # urllib3 < 2 has no jitter option
+            retry = Retry(**retry_kwargs)
+        return HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                           max_retries=retry, pool_block=True)
+
+    def _host_limit(self, host):
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = threading.BoundedSemaphore(
+                    HTTP_HOST_CONCURRENCY.get(host, HTTP_DEFAULT_HOST_CONCURRENCY))
+            return self._limits[host]
+
+    def request(self, method, url, **kwargs):
+        with self._host_limit(urllib.parse.urlsplit(url).hostname):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Per-host request and connection counters; reuse = requests served on an existing socket."""
+        rows = []
+        for adapter in (self._adapter, self._budgeted_adapter):
+            rows.extend(self._pool_stats(adapter.poolmanager.pools))
+        return rows
+
+    @staticmethod
+    def _pool_stats(pools):
+        rows = []
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            rows.append({
+                "Host": pool.host,
+                "Requests": pool.num_requests,
+                "New connections": pool.num_connections,
+                "Reused": pool.num_requests - pool.num_connections,
+                "Reuse %": round(100 * (1 - pool.num_connections / pool.num_requests), 1) if pool.num_requests else None,
+            })
+        return rows
+
+
+@st.cache_resource
+def get_http_client():
+    return PooledHTTPClient()
+
+
+# --- Finnhub Client (shared token bucket, coalesced quotes) ---
+FINNHUB_RATE_PER_MIN = 60       # free-tier budget, shared by every session in the process
+FINNHUB_BURST = 10
+FINNHUB_QUEUE_TIMEOUT_S = 15    # how long a call may wait for a token before giving up
+
+
+class FinnhubRateLimited(requests.exceptions.RequestException):
+    """Raised when the Finnhub budget stays exhausted for the whole queue timeout (or Finnhub says 429)."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() queues the caller until a token is available."""
+
+    def __init__(self, rate_per_s, capacity):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_s = (1 - self._tokens) / self.rate
+                if deadline is not None:
+                    if deadline <= now:
+                        return False
+                    wait_s = min(wait_s, deadline - now)
+                self._cond.wait(wait_s)
+
+    def pause(self, seconds):
+        """Empty the bucket so the next token is ``seconds`` away (the server asked us to back off)."""
+        with self._cond:
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+            self._updated = time.monotonic()
+
+
+class FinnhubClient:
+    """Finnhub API access budgeted by one token bucket, with duplicate in-flight quotes merged."""
+
+    BASE_URL = "https://finnhub.io/api/v1"
+    # The client is cached across script reruns, which redefine FinnhubRateLimited; catch
+    # `get_finnhub_client().RateLimited` to match the class this instance actually raises.
+    RateLimited = FinnhubRateLimited
+
+    def __init__(self, api_key, rate_per_min=FINNHUB_RATE_PER_MIN, burst=FINNHUB_BURST):
+        self.api_key = api_key
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "coalesced": 0, "queued": 0, "rate_limited": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _get(self, path, params, timeout=10):
+        if not self.bucket.acquire(timeout=0):
+            self._count("queued")
+            if not self.bucket.acquire(timeout=FINNHUB_QUEUE_TIMEOUT_S):
+                self._count("rate_limited")
+                raise self.RateLimited("Finnhub request budget exhausted — please retry in a minute.")
+        self._count("requests")
+        response = get_http_client().get(f"{self.BASE_URL}/{path}", params={**params, "token": self.api_key}, timeout=timeout)
+        if response.status_code == 429:
+            self._count("rate_limited")
+            try:
+                retry_after = float(response.headers.get("Retry-After", 60))
+            except ValueError:
+                retry_after = 60.0
+            self.bucket.pause(retry_after)
+            raise self.RateLimited("Finnhub rate limit reached (HTTP 429).")
+        response.raise_for_status()
+        return response.json()
+
+    def _coalesced(self, key, fetch):
+        """Run fetch() once per key at a time; concurrent callers wait for and share its result."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def quote(self, symbol, timeout=10):
+        """Raw quote dict ({'c': price, 'pc': prev close, ...}) for a Finnhub symbol like 'NSE:TCS'."""
+        return self._coalesced(("quote", symbol), lambda: self._get("quote", {"symbol": symbol}, timeout))
+
+    def quotes(self, symbols, max_workers=4):
+        """Quote many symbols under the shared budget; failed symbols map to None."""
+        def one(sym):
+            try:
+                return sym, self.quote(sym)
+            except requests.exceptions.RequestException:
+                return sym, None
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(pool.map(one, dict.fromkeys(symbols)))
+
+    def search(self, query, timeout=5):
+        return self._coalesced(("search", query), lambda: self._get("search", {"q": query}, timeout))
+
+
+@st.cache_resource
+def get_finnhub_client():
+    return FinnhubClient(FINNHUB_API_KEY)
+
+
+# --- Stage Timing ---
+@contextmanager
+def _timed(timings, stage):
+    """Record the wall time of a block, in milliseconds, under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+# --- Local SQLite Helpers (stores under CACHE_DIR) ---
+@contextmanager
+def _sqlite(path):
+    """Short-lived connection that commits on success; safe across threads and processes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+# --- Shared Cache Backend (cross-process layer under st.cache_data) ---
+SHARED_CACHE_PATH = os.path.join(CACHE_DIR, "shared_cache.sqlite3")
+# Lookups return (found, value) rather than a sentinel object: cached singletons outlive
+# script reruns, and a module-level sentinel would be re-created on every rerun.
+
+
+class DiskCacheBackend:
+    """SQLite key/value store with per-entry expiry; every process on the host shares it."""
+
+    name = "disk"
+
+    def __init__(self, path):
+        self.path = path
+        self._writes = 0
+        with _sqlite(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+
+    def get(self, key):
+        with _sqlite(self.path) as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        self._writes += 1
+        with _sqlite(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                         (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+
+class RedisCacheBackend:
+    """Same interface on top of Redis (or any Redis-compatible server) for multi-host deployments."""
+
+    name = "redis"
+
+    def __init__(self, url):
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._redis.get(key)
+        return (False, None) if raw is None else (True, pickle.loads(raw))
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+
+class SharedCache:
+    """Backend plus per-namespace hit/miss counters for this process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace, outcome):
+        with self._lock:
+            self._counts.setdefault(namespace, {"hits": 0, "misses": 0, "errors": 0})[outcome] += 1
+
+    def get(self, namespace, key):
+        try:
+            found, value = self.backend.get(key)
+        except Exception:
+            self._count(namespace, "errors")
+            return False, None
+        self._count(namespace, "hits" if found else "misses")
+        return found, value
+
+    def set(self, namespace, key, value, ttl):
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception:
+            self._count(namespace, "errors")
+
+    def stats(self):
+        with self._lock:
+            return [
+                {"Namespace": ns, "Backend": self.backend.name, **counts,
+                 "Hit %": round(100 * counts["hits"] / (counts["hits"] + counts["misses"]), 1)
+                 if counts["hits"] + counts["misses"] else None}
+                for ns, counts in sorted(self._counts.items())
+            ]
+
+
+@st.cache_resource
+def get_shared_cache():
+    if REDIS_URL and REDIS_AVAILABLE:
+        try:
+            backend = RedisCacheBackend(REDIS_URL)
+            backend._redis.ping()
+            return SharedCache(backend)
+        except Exception:
+            pass   # fall back to the on-disk store
+    return SharedCache(DiskCacheBackend(SHARED_CACHE_PATH))
+
+
+def _worth_sharing(value):
+    """Don't spread failures to other processes: skip None, empty frames and (None, error, None) tuples.
+
+    The AI providers report every failed call (timeouts, rate limits, unparsable
+    replies) as (None, error, None), so none of them reaches other processes.
+    """
+    if value is None or (isinstance(value, pd.DataFrame) and value.empty):
+        return False
+    return not (isinstance(value, tuple) and value and value[0] is None)
+
+
+def shared_cache(namespace, ttl, share_if=_worth_sharing):
+    """Cache results in the cross-process backend, keyed on the pickled arguments.
+
+    Stack it under @st.cache_data: the Streamlit cache stays the fast per-process
+    layer and this one lets other server processes reuse the result until ttl expires.
+    Only results for which ``share_if(value)`` is true are stored.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_shared_cache()
+            digest = hashlib.sha256(pickle.dumps((args, sorted(kwargs.items())), protocol=4)).hexdigest()
+            key = f"{namespace}:{digest}"
+            found, value = cache.get(namespace, key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            if share_if(value):
+                cache.set(namespace, key, value, ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+# --- Scoped Cache Invalidation (generation counters) ---
+def cache_generation(scope):
+    """Current generation of a cache scope such as 'quote:TCS'."""
+    try:
+        found, value = get_shared_cache().backend.get(f"generation:{scope}")
+    except Exception:
+        return 0
+    return value if found else 0
+
+
+def bump_cache_generation(scope):
+    """Retire every cache entry keyed on this scope's generation, in all server processes."""
+    get_shared_cache().backend.set(f"generation:{scope}", time.time_ns(), ttl=30 * 86400)
+
+
+# --- Local Symbol Resolution Index ---
+SYMBOL_INDEX_PATH = os.path.join(CACHE_DIR, "symbols.sqlite3")
+SYMBOL_INDEX_MAX_AGE_DAYS = 7
+
+
+class SymbolIndex:
+    """Persistent symbol → exchange ticker map, held in memory for O(1) lookups."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with _sqlite(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS symbols (symbol TEXT PRIMARY KEY, ticker TEXT, "
+                "source TEXT, updated_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._map = dict(conn.execute("SELECT symbol, ticker FROM symbols").fetchall())
+            row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        self.built_at = float(row[0]) if row else 0.0
+
+    def __len__(self):
+        return len(self._map)
+
+    def lookup(self, symbol):
+        return self._map.get(symbol.upper())
+
+    def add_many(self, entries, source):
+        """Insert or overwrite (symbol, ticker) pairs in memory and on disk."""
+        entries = [(sym.upper(), ticker) for sym, ticker in entries]
+        now = time.time()
+        with self._lock, _sqlite(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?)",
+                [(sym, ticker, source, now) for sym, ticker in entries],
+            )
+            self._map.update(entries)
+
+    def add(self, symbol, ticker, source):
+        self.add_many([(symbol, ticker)], source)
+
+    def is_stale(self):
+        return time.time() - self.built_at > SYMBOL_INDEX_MAX_AGE_DAYS * 86400
+
+    def rebuild(self):
+        """Pull the NSE equity list via nselib; probe-discovered entries are kept."""
+        entries = []
+        if NSELIB_AVAILABLE:
+            try:
+                listing = capital_market.equity_list()
+                listing.columns = listing.columns.str.strip()
+                entries += [(str(sym).strip(), f"{str(sym).strip()}.NS") for sym in listing["SYMBOL"].dropna()]
+            except Exception:
+                pass   # keep whatever we had; probes keep filling gaps
+        # Network probes may have found a better ticker (e.g. BSE-only listings) — don't clobber them
+        entries = [(sym, ticker) for sym, ticker in entries if sym.upper() not in self._map]
+        self.add_many(entries, "nselib")
+        self.built_at = time.time()
+        with _sqlite(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (str(self.built_at),))
+
+
+@st.cache_resource
+def get_symbol_index():
+    index = SymbolIndex(SYMBOL_INDEX_PATH)
+    if index.is_stale():
+        index.add_many([(sym, f"{sym}.NS") for sym in NIFTY50_SYMBOLS if not index.lookup(sym)], "seed")
+        # Build in the background; lookups fall back to the network probe until it lands
+        threading.Thread(target=index.rebuild, daemon=True).start()
+    return index
+
+
 # --- Stock Symbol Validation with multiple sources ---
 def validate_stock_symbol(symbol):
-    """Validate if the stock symbol exists and is tradeable on Yahoo Finance or Finnhub."""
-    
-    # Try Yahoo Finance first (most reliable for Indian stocks)
+    """Resolve a symbol to a tradeable ticker, using the local index before any network probe."""
+    index = get_symbol_index()
+    ticker = index.lookup(symbol)
+    if ticker:
+        return True, ticker
+
+    # Last resort: probe Yahoo Finance suffixes (most reliable for Indian stocks)
     ticker_variants = [f"{symbol}.NS", f"{symbol}.BO", symbol]
     for ticker in ticker_variants:
         try:
             stock = yf.Ticker(ticker)
             hist = stock.history(period="1d")
             if not hist.empty:
+                index.add(symbol, ticker, "yahoo-probe")
                 return True, ticker
         except Exception:
             continue
     
     # Fallback to Finnhub API
     if FINNHUB_API_KEY:
-        url = f"https://finnhub.io/api/v1/search?q={symbol}&token={FINNHUB_API_KEY}"
         try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
+            data = get_finnhub_client().search(symbol)
             if 'result' in data and any(item['symbol'].upper() == f"NSE:{symbol.upper()}" or item['symbol'].upper() == f"BSE:{symbol.upper()}" for item in data['result']):
+                index.add(symbol, f"NSE:{symbol}", "finnhub-probe")
                 return True, f"NSE:{symbol}"
         except (requests.exceptions.RequestException, json.JSONDecodeError):
             pass
             
     return False, f"Stock symbol '{symbol}' not found. Please check the symbol and try again."
 
+# --- Persistent OHLCV Store (incremental delta fetch) ---
+OHLCV_DB_PATH = os.path.join(CACHE_DIR, "ohlcv.sqlite3")
+STORE_MIN_REFRESH_S = 60          # serve purely from disk if the last delta fetch is this fresh
+STORE_FULL_REFRESH_DAYS = 7       # periodic full re-download picks up split/dividend re-adjustments
+
+
+def _normalise_ohlcv(frame):
+    """Keep the OHLCV columns, drop empty rows and strip the exchange timezone."""
+    frame = frame[[c for c in OHLCV_FIELDS if c in frame.columns]].dropna(how="all")
+    if getattr(frame.index, "tz", None) is not None:
+        frame.index = frame.index.tz_localize(None)
+    return frame
+
+
+def _period_start(period):
+    """Translate a yfinance period string ('5d', '3mo', '1y', 'max') into a start timestamp."""
+    now = pd.Timestamp.now().normalize()
+    if period == "max":
+        return pd.Timestamp("1900-01-01")
+    units = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+    for suffix, unit in units.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return now - pd.DateOffset(**{unit: int(period[:-len(suffix)])})
+    raise ValueError(f"Unsupported period: {period}")
+
+
+_INTRADAY_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90, "1h": 60}
+
+
+def bar_timeframe(bar_label):
+    """Prompt wording for the dashboard's bar label: "day" -> "daily", "15m" -> "15-minute"."""
+    return "daily" if bar_label == "day" else f"{_INTRADAY_MINUTES[bar_label]}-minute"
+
+
+@st.cache_resource
+def get_nse_calendar():
+    return mcal.get_calendar("XNSE")
+
+
+@st.cache_data(ttl=3600)
+def history_start(bars, interval="1d"):
+    """Earliest date to request so the download covers the last `bars` bars of `interval`.
+
+    Counts NSE sessions on the exchange calendar; if that is unavailable, falls
+    back to business days plus a margin for exchange holidays.
+    """
+    if interval in _INTRADAY_MINUTES:
+        sessions = -(-bars // (NSE_SESSION_MINUTES // _INTRADAY_MINUTES[interval]))
+    elif interval == "1wk":
+        sessions = bars * 5
+    elif interval == "1mo":
+        sessions = bars * 23
+    else:
+        sessions = bars
+    today = pd.Timestamp.now(tz="Asia/Kolkata").tz_localize(None).normalize()
+    try:
+        days = get_nse_calendar().valid_days(start_date=today - pd.Timedelta(days=2 * sessions + 14), end_date=today)
+        if len(days) >= sessions:
+            return days[-sessions].tz_localize(None)
+    except Exception:
+        pass
+    return today - pd.offsets.BDay(sessions + sessions // 20 + 5)
+
+
+class OHLCVStore:
+    """Per-ticker bar history kept in SQLite under CACHE_DIR, so it survives restarts."""
+
+    def __init__(self, path):
+        self.path = path
+        with _sqlite(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bars (ticker TEXT, interval TEXT, ts TEXT, "
+                "open REAL, high REAL, low REAL, close REAL, volume REAL, "
+                "PRIMARY KEY (ticker, interval, ts))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS coverage (ticker TEXT, interval TEXT, start TEXT, "
+                "full_at REAL, fetched_at REAL, PRIMARY KEY (ticker, interval))"
+            )
+
+    def coverage(self, ticker, interval):
+        """Return (covered_from, last_bar, full_at, fetched_at) or None if nothing is stored."""
+        with _sqlite(self.path) as conn:
+            row = conn.execute(
+                "SELECT c.start, MAX(b.ts), c.full_at, c.fetched_at FROM coverage c "
+                "LEFT JOIN bars b ON b.ticker = c.ticker AND b.interval = c.interval "
+                "WHERE c.ticker = ? AND c.interval = ?", (ticker, interval)
+            ).fetchone()
+        if not row or row[0] is None or row[1] is None:
+            return None
+        return pd.Timestamp(row[0]), pd.Timestamp(row[1]), row[2], row[3]
+
+    def read(self, ticker, interval, start=None):
+        with _sqlite(self.path) as conn:
+            df = pd.read_sql_query(
+                "SELECT ts, open, high, low, close, volume FROM bars "
+                "WHERE ticker = ? AND interval = ? AND ts >= ? ORDER BY ts",
+                conn, params=(ticker, interval, str(start or "")),
+            )
+        df.columns = ["Date"] + OHLCV_FIELDS
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df.set_index("Date")
+
+    def write(self, ticker, interval, frame, covered_from=None, full=False):
+        """Upsert bars (newer values win) and advance the coverage bookkeeping."""
+        rows = []
+        if frame is not None and not frame.empty:
+            frame = _normalise_ohlcv(frame).reindex(columns=OHLCV_FIELDS)
+            rows = [
+                (ticker, interval, ts.strftime("%Y-%m-%d %H:%M:%S"),
+                 *(None if pd.isna(v) else float(v) for v in values))
+                for ts, values in zip(frame.index, frame.itertuples(index=False))
+            ]
+        now = time.time()
+        with _sqlite(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if full:
+                conn.execute(
+                    "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)",
+                    (ticker, interval, str(covered_from), now, now),
+                )
+            else:
+                conn.execute(
+                    "UPDATE coverage SET fetched_at = ? WHERE ticker = ? AND interval = ?",
+                    (now, ticker, interval),
+                )
+
+
+    def expire(self, ticker):
+        """Force the next load_history() for this ticker to fetch a fresh delta."""
+        with _sqlite(self.path) as conn:
+            conn.execute("UPDATE coverage SET fetched_at = 0 WHERE ticker = ?", (ticker,))
+
+
+@st.cache_resource
+def get_ohlcv_store():
+    return OHLCVStore(OHLCV_DB_PATH)
+
+
+def load_history(ticker, period="1y", interval="1d", bars=None):
+    """Return `period` of bars for `ticker`, downloading only what the local store is missing.
+
+    With `bars`, only the last `bars` bars are requested and returned instead
+    (see history_start), so callers can ask for exactly their indicator lookback.
+    The first call downloads the whole window. Later calls re-request from the last
+    stored bar onwards (that bar may still be forming) and serve the rest from disk.
+    """
+    store = get_ohlcv_store()
+    start = history_start(bars, interval) if bars else _period_start(period)
+    cov = store.coverage(ticker, interval)
+    stale = cov is None or cov[0] > start or time.time() - (cov[2] or 0) > STORE_FULL_REFRESH_DAYS * 86400
+
+    if stale:
+        if bars:
+            hist = yf.Ticker(ticker).history(start=start.strftime("%Y-%m-%d"), interval=interval)
+        else:
+            hist = yf.Ticker(ticker).history(period=period, interval=interval)
+        if hist.empty:
+            return hist
+        store.write(ticker, interval, hist, covered_from=start.strftime("%Y-%m-%d %H:%M:%S"), full=True)
+    elif time.time() - (cov[3] or 0) > STORE_MIN_REFRESH_S:
+        try:
+            delta = yf.Ticker(ticker).history(start=cov[1].strftime("%Y-%m-%d"), interval=interval)
+            store.write(ticker, interval, delta)
+        except Exception:
+            pass   # keep serving the stored bars; the next refresh will try again
+
+    hist = store.read(ticker, interval, start.strftime("%Y-%m-%d %H:%M:%S"))
+    return hist.tail(bars) if bars else hist
+
+
+# --- Compact Frame Mode (opt-in via COMPACT_FRAMES) ---
+# Company-info keys kept when COMPACT_FRAMES trims Yahoo's ~150-key `info` dict
+INFO_FIELDS = ("longName", "shortName", "sector", "industry", "currency", "marketCap",
+               "trailingPE", "priceToBook", "dividendYield", "fiftyTwoWeekHigh", "fiftyTwoWeekLow")
+
+
+def compact_info(info):
+    """Company info trimmed to INFO_FIELDS."""
+    return {key: info[key] for key in INFO_FIELDS if key in info}
+
+
+# --- Hedged Data-Source Router ---
+HEDGE_PERCENTILE = 90          # hedge once the leader runs past this percentile of its own latency
+HEDGE_DEFAULT_DELAY_S = 2.0    # hedge delay used until a source has enough latency samples
+SOURCE_RACE_TIMEOUT_S = 25
+
+
+class SourceRouter:
+    """Races market-data sources instead of trying them strictly one after another.
+
+    Sources start in order of observed health. If the running leader is slower than
+    its own HEDGE_PERCENTILE latency (or fails), the next source is started too; the
+    first valid result wins and the others are cancelled. Python threads cannot be
+    interrupted, so a loser that is already running is abandoned — its result is
+    discarded but its latency still feeds the statistics used to reorder the chain.
+    """
+
+    def __init__(self, hedge_percentile=HEDGE_PERCENTILE, window=50, max_workers=8):
+        self.hedge_percentile = hedge_percentile
+        self._window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="source-router")
+
+    def _entry(self, name):
+        return self._stats.setdefault(name, {"latencies": deque(maxlen=self._window), "ok": 0, "fail": 0})
+
+    def record(self, name, latency_s, ok):
+        with self._lock:
+            entry = self._entry(name)
+            entry["ok" if ok else "fail"] += 1
+            if ok:
+                entry["latencies"].append(latency_s)
+
+    def hedge_delay(self, name):
+        with self._lock:
+            latencies = list(self._entry(name)["latencies"])
+        if len(latencies) < 5:
+            return HEDGE_DEFAULT_DELAY_S
+        return float(np.percentile(latencies, self.hedge_percentile))
+
+    def order(self, names):
+        """Healthiest first: smoothed success rate, then median latency."""
+        def score(name):
+            with self._lock:
+                entry = self._entry(name)
+                latencies = list(entry["latencies"])
+                success = (entry["ok"] + 1) / (entry["ok"] + entry["fail"] + 2)
+            return (-round(success, 1), float(np.median(latencies)) if latencies else 0.0)
+        return sorted(names, key=score)
+
+    def stats(self):
+        with self._lock:
+            rows = []
+            for name, entry in self._stats.items():
+                latencies = list(entry["latencies"])
+                calls = entry["ok"] + entry["fail"]
+                rows.append({
+                    "Source": name, "Calls": calls,
+                    "Success %": round(100 * entry["ok"] / calls, 1) if calls else None,
+                    "p50 ms": round(1000 * float(np.median(latencies)), 1) if latencies else None,
+                    "p90 ms": round(1000 * float(np.percentile(latencies, 90)), 1) if latencies else None,
+                })
+        return rows
+
+    def _run(self, name, fn):
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception:
+            self.record(name, time.perf_counter() - start, False)
+            raise
+        self.record(name, time.perf_counter() - start, bool(result))
+        return result
+
+    def race(self, sources, timeout=SOURCE_RACE_TIMEOUT_S):
+        """Run {name: fn} sources hedged; return (winner, result, errors)."""
+        queue = self.order(list(sources))
+        running, errors = {}, {}
+        deadline = time.monotonic() + timeout
+        leader = None
+
+        def launch():
+            nonlocal leader
+            leader = queue.pop(0)
+            running[self._pool.submit(self._run, leader, sources[leader])] = leader
+
+        launch()
+        while running and time.monotonic() < deadline:
+            wait_for = min(self.hedge_delay(leader), deadline - time.monotonic()) if queue else deadline - time.monotonic()
+            done, _ = wait(running, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[name] = str(e)
+                    continue
+                if result:
+                    for loser in running:
+                        loser.cancel()
+                    return name, result, errors
+                errors[name] = "no data"
+            if queue and (not done or not running):
+                launch()   # leader is slow (hedge) or has failed (fall through)
+        for future, name in running.items():
+            future.cancel()
+            errors.setdefault(name, f"timed out after {timeout}s")
+        return None, None, errors
+
+
+@st.cache_resource
+def get_source_router():
+    return SourceRouter()
+
+
+def _source_yahoo(symbol, ticker, bars=None):
+    hist = load_history(ticker, period="1y", bars=bars)
+    return _quote_from_history(symbol, ticker, hist, "Yahoo Finance") if not hist.empty else None
+
+
+def _nse_period_for(bars):
+    """Smallest NSELib period string covering `bars` daily bars (NSELib tops out at 1Y)."""
+    if not bars:
+        return "1Y"
+    days = (pd.Timestamp.now().normalize() - history_start(bars)).days
+    for period, span in (("1M", 28), ("3M", 90), ("6M", 180)):
+        if days <= span:
+            return period
+    return "1Y"
+
+
+def _source_nselib(symbol, bars=None):
+    hist = _fetch_nse_history(symbol, period=_nse_period_for(bars))
+    return _quote_from_history(symbol, f"{symbol}.NS", hist.tail(bars) if bars else hist, "NSE Library")
+
+
+def _quote_from_history(symbol, ticker, hist, source):
+    """Build the stock_data dict from daily bars: price, volume and the day's range."""
+    latest_price = hist['Close'].iloc[-1]
+    return {
+        'symbol': symbol,
+        'ticker': ticker,
+        'price': latest_price,
+        'prev_close': hist['Close'].iloc[-2] if len(hist) > 1 else latest_price,
+        'volume': hist['Volume'].iloc[-1] if 'Volume' in hist.columns else 0,
+        'day_high': hist['High'].iloc[-1],
+        'day_low': hist['Low'].iloc[-1],
+        'historical': compact_frame(hist) if COMPACT_FRAMES else hist,
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'data_source': source
+    }
+
+
 # --- Improved Data Fetching Functions ---
 @st.cache_data(ttl=300) # Cache for 5 minutes
 @safe_execute
-def get_realtime_stock_data(symbol):
-    """Fetch real-time stock data using multiple sources"""
-
-    is_valid, ticker_or_error = validate_stock_symbol(symbol)
+def get_realtime_stock_data(symbol, generation=0, bars=None):
+    """Fetch real-time stock data using multiple sources.
+
+    Price, volume and the day's range all come from a single history fetch;
+    company fundamentals are not loaded here — use get_stock_info() when needed.
+    `bars` limits the history to what the caller will analyse (default: one year).
+    The per-stage wall times are returned under 'timings' (ms). `generation` only
+    feeds the cache key: pass cache_generation(f"quote:{symbol}") so refresh_symbol()
+    can retire this symbol's entry.
+    """
+    timings = {}
+    with _timed(timings, "resolve"):
+        is_valid, ticker_or_error = validate_stock_symbol(symbol)
     if not is_valid:
         return None, ticker_or_error
     
-    # Try Yahoo Finance
-    try:
-        if ".NS" in ticker_or_error or ".BO" in ticker_or_error or "." not in ticker_or_error:
-            stock = yf.Ticker(ticker_or_error)
-            info = stock.info
-            hist = stock.history(period="1y")
-            
-            if not hist.empty and info:
-                latest_price = hist['Close'].iloc[-1]
-                prev_close = hist['Close'].iloc[-2] if len(hist) > 1 else latest_price
-                volume = hist['Volume'].iloc[-1] if 'Volume' in hist.columns else 0
-                day_high = hist['High'].iloc[-1]
-                day_low = hist['Low'].iloc[-1]
-                
-                return {
-                    'symbol': symbol,
-                    'price': latest_price,
-                    'prev_close': prev_close,
-                    'volume': volume,
-                    'day_high': day_high,
-                    'day_low': day_low,
-                    'historical': hist,
-                    'info': info,
-                    'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'data_source': 'Yahoo Finance'
-                }, None
-    except Exception as e:
-        st.warning(f"Yahoo Finance data fetch failed. Trying Finnhub. Details: {e}")
-
-    # Fallback to Finnhub
+    # Race the real-history sources (Yahoo via the local store, NSELib), hedging on slow leaders
+    sources = {}
+    if ".NS" in ticker_or_error or ".BO" in ticker_or_error or "." not in ticker_or_error:
+        sources["Yahoo Finance"] = lambda: _source_yahoo(symbol, ticker_or_error, bars)
+    if NSELIB_AVAILABLE and not ticker_or_error.endswith(".BO"):
+        sources["NSE Library"] = lambda: _source_nselib(symbol, bars)
+    if sources:
+        with _timed(timings, "sources"):
+            winner, result, errors = get_source_router().race(sources)
+        if result:
+            result['timings'] = timings
+            return result, None
+        details = "; ".join(f"{name}: {err}" for name, err in errors.items())
+        st.warning(f"Live data sources failed. Trying Finnhub. Details: {details}")
+
+    # Fallback to Finnhub — synthetic history, so it only runs once every real source has failed
     try:
-        finnhub_symbol = f"NSE:{symbol}"
-        url = f"https://finnhub.io/api/v1/quote?symbol={finnhub_symbol}&token={FINNHUB_API_KEY}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        with _timed(timings, "finnhub_quote"):
+            data = get_finnhub_client().quote(f"NSE:{symbol}")
 
         if data and 'c' in data and data['c'] != 0:
             current_price = data['c']
             prev_close = data.get('pc', current_price)
             
-            # Generate synthetic historical data for analysis since Finnhub's quote endpoint is limited
-            dates = pd.date_range(end=datetime.now(), periods=100, freq='D')
-            np.random.seed(hash(symbol) % 1000)
-            prices = [current_price]
-            for _ in range(99):
-                change = np.random.normal(0, 0.01)
-                prev_price_calc = prices[-1] / (1 + change)
-                prices.append(max(0.01, prev_price_calc))
-            prices.reverse()
-            
-            hist = pd.DataFrame({
-                'Close': prices,
-                'Open': [p * np.random.uniform(0.99, 1.01) for p in prices],
-                'High': [p * np.random.uniform(1.00, 1.02) for p in prices],
-                'Low': [p * np.random.uniform(0.98, 1.00) for p in prices],
-                'Volume': np.random.randint(1000000, 10000000, 100)
-            }, index=dates)
-
-            # Ensure the last day's data matches the real-time quote
-            hist.loc[hist.index[-1], 'Close'] = current_price
-            hist.loc[hist.index[-1], 'High'] = max(current_price, hist.loc[hist.index[-1], 'High'])
-            hist.loc[hist.index[-1], 'Low'] = min(current_price, hist.loc[hist.index[-1], 'Low'])
+            # Generate synthetic historical data for analysis since Finnhub's quote endpoint is limited;
+            # the walk is anchored so the last close is the real-time quote
+            panel = generate_synthetic_ohlcv([symbol], bars or 100, end=datetime.now(), freq='D', drift=0.0,
+                                             volatility=0.01, gap=0.01, wick=0.02, last_price=current_price)
+            hist = panel.xs(symbol, axis=1, level=1)
 
             return {
                 'symbol': symbol,
@@ -425,196 +1259,216 @@ def get_realtime_stock_data(symbol):
                 'volume': "N/A",
                 'day_high': hist['High'].iloc[-1],
                 'day_low': hist['Low'].iloc[-1],
-                'historical': hist,
-                'info': {},
+                'historical': compact_frame(hist) if COMPACT_FRAMES else hist,
+                'timings': timings,
                 'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'data_source': 'Finnhub (Simulated Historical)'
             }, None
+    except get_finnhub_client().RateLimited as e:
+        st.warning(f"Finnhub is busy — {e}")
     except Exception as e:
         st.warning(f"Finnhub data fetch failed. Details: {e}")
         
     return None, "Unable to fetch live or historical data from all sources. Please try again later."
 
 
+def refresh_symbol(symbol):
+    """Refetch one symbol's quote and latest bars on the next load; every other cache stays warm."""
+    is_valid, ticker = validate_stock_symbol(symbol)
+    if is_valid:
+        get_ohlcv_store().expire(ticker)
+    bump_cache_generation(f"quote:{symbol}")
+
+
+@st.cache_data(ttl=3600)
+def get_stock_info(ticker):
+    """Company fundamentals from Yahoo's (slow) `info` endpoint — only call when they are shown."""
+    try:
+        info = yf.Ticker(ticker).info or {}
+    except Exception:
+        return {}
+    return compact_info(info) if COMPACT_FRAMES else info
+
+
+# --- Intraday Bars (streaming resampler in bars.py) ---
+DASHBOARD_TIMEFRAMES = ("1d", "1h", "30m", "15m", "5m", "1m")
+# Each timeframe is rolled up from one base feed, so switching among 5m/15m/30m/1h never refetches
+INTRADAY_BASE = {"1m": "1m", "5m": "5m", "15m": "5m", "30m": "5m", "1h": "5m"}
+# Yahoo serves 1m bars at most 8 calendar days per request and 5m bars for the last 60 days
+INTRADAY_MAX_SESSIONS = {"1m": 5, "5m": 40}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_intraday_history(ticker, base, bars, generation=0):
+    """Last ``bars`` base-interval bars from the local store (one delta fetch per minute at most)."""
+    try:
+        hist = load_history(ticker, interval=base, bars=bars)
+    except Exception:
+        return pd.DataFrame(columns=OHLCV_FIELDS)
+    return compact_frame(hist) if COMPACT_FRAMES else hist
+
+
+def intraday_bars(symbol, ticker, timeframe, bars):
+    """About ``bars`` bars of ``timeframe`` for the dashboard, resampled in session state.
+
+    The base feed always covers the same window (INTRADAY_MAX_SESSIONS), so every
+    timeframe built on it reads the same stored bars. The resampler for
+    (ticker, timeframe) remembers where its first frame started and only grows
+    from there across reruns, so the streaming indicator engine steps the new
+    bars instead of rebuilding.
+    """
+    base = INTRADAY_BASE[timeframe]
+    base_bars = INTRADAY_MAX_SESSIONS[base] * (NSE_SESSION_MINUTES // _INTRADAY_MINUTES[base])
+    base_frame = get_intraday_history(ticker, base, base_bars, cache_generation(f"quote:{symbol}"))
+    if base_frame.empty:
+        return base_frame
+    resamplers = st.session_state.setdefault("resamplers", {})
+    resampler, anchor = resamplers.get((ticker, timeframe), (None, None))
+    if resampler is None or not resampler.extend(base_frame):
+        resampler = StreamingResampler(_INTRADAY_MINUTES[timeframe])
+        resampler.extend(base_frame)
+        anchor = resampler.to_frame().index[-min(bars, len(resampler))] if len(resampler) else None
+        resamplers[(ticker, timeframe)] = (resampler, anchor)
+    frame = resampler.to_frame()
+    return frame[frame.index >= anchor] if anchor is not None else frame
+
+
+SCREENER_INDICATORS = ("RSI", "SMA_20", "SMA_50")
+
+
 # --- Advanced Technical Analysis with Real Mathematics ---
 def calculate_advanced_technical_indicators(data):
     """Calculate comprehensive technical indicators using proven mathematical formulas"""
     if data is None or len(data) < 50:
         st.warning("Not enough data to calculate all technical indicators. Need at least 50 data points.")
         return pd.DataFrame()
-    
-    df = data.copy()
-    
-    # Basic Moving Averages
-    df['SMA_20'] = df['Close'].rolling(window=20).mean()
-    df['SMA_50'] = df['Close'].rolling(window=50).mean()
-    if len(df) >= 200:
-        df['SMA_200'] = df['Close'].rolling(window=200).mean()
-    
-    # Exponential Moving Averages
-    df['EMA_12'] = df['Close'].ewm(span=12, adjust=False).mean()
-    df['EMA_26'] = df['Close'].ewm(span=26, adjust=False).mean()
-    
-    # MACD
-    df['MACD'] = df['EMA_12'] - df['EMA_26']
-    df['MACD_Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-    df['MACD_Histogram'] = df['MACD'] - df['MACD_Signal']
-    
-    # RSI (Relative Strength Index)
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss
-    df['RSI'] = 100 - (100 / (1 + rs))
-    
-    # Bollinger Bands
-    df['BB_Middle'] = df['Close'].rolling(window=20).mean()
-    bb_std = df['Close'].rolling(window=20).std()
-    df['BB_Upper'] = df['BB_Middle'] + (bb_std * 2)
-    df['BB_Lower'] = df['BB_Middle'] - (bb_std * 2)
-    
-    # Stochastic Oscillator
-    low_14 = df['Low'].rolling(window=14).min()
-    high_14 = df['High'].rolling(window=14).max()
-    df['%K'] = 100 * ((df['Close'] - low_14) / (high_14 - low_14))
-    df['%D'] = df['%K'].rolling(window=3).mean()
-    
-    # Volume indicators
-    if 'Volume' in df.columns and not df['Volume'].isnull().all():
-        df['Volume_SMA'] = df['Volume'].rolling(window=20).mean()
-    else:
-        df['Volume_SMA'] = np.nan
 
-    return df.dropna()
+    return compute_indicators(data).dropna()
 
-# --- Rule-based Trading Signal Generator ---
-def generate_rule_based_trading_signal(data):
-    """Generate trading signals using a weighted rule-based system."""
-    
-    if data.empty or len(data) < 50:
-        return "HOLD", "Insufficient data for rule-based analysis.", 0.5
+# --- Streaming Indicators (one engine per symbol and timeframe in the session) ---
+def streaming_technical_indicators(key, data, outputs=None):
+    """calculate_advanced_technical_indicators backed by a per-session engine.
+
+    Reruns that only add (or revise the latest) bar step the engine instead of
+    recomputing every window over the full history. `outputs` limits the returned
+    columns (and so the rows dropped for warm-up), as in compute_indicators().
+    """
+    if data is None or len(data) < IncrementalIndicatorEngine.MIN_BARS:
+        return calculate_advanced_technical_indicators(data)
+    engines = st.session_state.setdefault("indicator_engines", {})
+    engine = engines.get(key)
+    if engine is None or not engine.extend(data):
+        engine = IncrementalIndicatorEngine.from_frame(data)
+        engines[key] = engine
+    return engine.to_frame(outputs)
+
+
+# --- Prompt Size Report (compiler in prompts.py) ---
+def prompt_token_report(symbol, current_price, snapshot, timeframe="daily"):
+    """Rows of compiled prompt tokens, budget and dropped features for each provider, for the load-timings panel."""
+    rows = []
+    for provider in PROMPT_STYLES:
+        prompt = compile_prompt(provider, symbol, current_price, snapshot, LLM_PROMPT_TOKEN_BUDGET, timeframe)
+        rows.append({"Provider": provider, "Prompt tokens": prompt["tokens"],
+                     "Budget": prompt["budget"], "Dropped": ", ".join(prompt["dropped"]) or "—"})
+    return rows
+
+
+# --- Persistent LLM Provider Clients (keep-alive pools, HTTP/2 where available) ---
+XAI_BASE_URL = "https://api.x.ai/v1"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"   # REST calls go through get_http_client()
+LLM_TIMEOUT_S = 20
+LLM_KEEPALIVE_S = 120      # idle provider connections are kept this long between analyses
+
+
+class LLMConnectionStats:
+    """Per-host request, new-connection and handshake-time counters for the LLM clients.
+
+    Installed as an httpx request hook that attaches an httpcore trace callback:
+    a request that opens no connection was served on a kept-alive one, so the
+    handshake it skipped is the average measured for that host.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, host):
+        return self._hosts.setdefault(host, {"requests": 0, "connections": 0, "handshake_s": 0.0})
+
+    def on_request(self, request):
+        host = request.url.host
+        started = []
+
+        def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                started.append(time.perf_counter())
+            elif started and (event == "connection.start_tls.complete"
+                              or (event == "connection.connect_tcp.complete" and request.url.scheme == "http")):
+                with self._lock:
+                    entry = self._entry(host)
+                    entry["connections"] += 1
+                    entry["handshake_s"] += time.perf_counter() - started.pop()
+
+        request.extensions["trace"] = trace
+        with self._lock:
+            self._entry(host)["requests"] += 1
+
+    def stats(self):
+        with self._lock:
+            rows = []
+            for host, entry in self._hosts.items():
+                handshake_ms = 1000 * entry["handshake_s"] / entry["connections"] if entry["connections"] else None
+                reused = entry["requests"] - entry["connections"]
+                rows.append({"Host": host, "Requests": entry["requests"], "New connections": entry["connections"],
+                             "Reused": reused,
+                             "Handshake ms (avg)": round(handshake_ms, 1) if handshake_ms is not None else None,
+                             "Handshake ms saved": round(reused * handshake_ms) if handshake_ms else None})
+        return rows
+
+
+@st.cache_resource
+def get_llm_connection_stats():
+    return LLMConnectionStats()
+
+
+def _llm_http_client():
+    """httpx client with a keep-alive pool, speaking HTTP/2 when the h2 package is installed."""
+    return httpx.Client(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=LLM_KEEPALIVE_S),
+        event_hooks={"request": [get_llm_connection_stats().on_request]},
+    )
+
+
+@st.cache_resource
+def get_grok_client(api_key):
+    """Process-wide xAI client (OpenAI-compatible); its connection pool outlives every rerun."""
+    pool = {"http_client": _llm_http_client()} if HTTPX_AVAILABLE else {}
+    return OpenAIClient(api_key=api_key, base_url=XAI_BASE_URL, timeout=LLM_TIMEOUT_S, **pool)
+
+
+@st.cache_resource
+def get_groq_client(api_key):
+    pool = {"http_client": _llm_http_client()} if HTTPX_AVAILABLE else {}
+    return Groq(api_key=api_key, timeout=LLM_TIMEOUT_S, **pool)
 
-    latest = data.iloc[-1]
-    
-    buy_score = 0
-    sell_score = 0
-    reasons = []
-
-    # 1. Moving Averages Crossover (25 points)
-    # Golden Cross (20-day SMA crosses above 50-day SMA)
-    if latest.get('SMA_20') > latest.get('SMA_50') and data.iloc[-2].get('SMA_20') <= data.iloc[-2].get('SMA_50'):
-        buy_score += 25
-        reasons.append("Golden Cross (SMA 20/50)")
-    # Death Cross (20-day SMA crosses below 50-day SMA)
-    if latest.get('SMA_20') < latest.get('SMA_50') and data.iloc[-2].get('SMA_20') >= data.iloc[-2].get('SMA_50'):
-        sell_score += 25
-        reasons.append("Death Cross (SMA 20/50)")
-
-    # 2. RSI (20 points)
-    rsi = latest.get('RSI', 50)
-    if rsi < 30 and latest['Close'] > latest.get('Low', latest['Close']):
-        buy_score += 20
-        reasons.append(f"RSI oversold ({rsi:.2f})")
-    elif rsi > 70 and latest['Close'] < latest.get('High', latest['Close']):
-        sell_score += 20
-        reasons.append(f"RSI overbought ({rsi:.2f})")
-
-    # 3. MACD Crossover (20 points)
-    if latest.get('MACD', 0) > latest.get('MACD_Signal', 0) and data.iloc[-2].get('MACD') <= data.iloc[-2].get('MACD_Signal'):
-        buy_score += 20
-        reasons.append("MACD bullish crossover")
-    if latest.get('MACD', 0) < latest.get('MACD_Signal', 0) and data.iloc[-2].get('MACD') >= data.iloc[-2].get('MACD_Signal'):
-        sell_score += 20
-        reasons.append("MACD bearish crossover")
-    
-    # 4. Price vs Moving Averages (10 points)
-    if latest['Close'] > latest.get('SMA_20', latest['Close']) and latest['Close'] > latest.get('SMA_50', latest['Close']):
-        buy_score += 10
-        reasons.append("Price above key MAs")
-    elif latest['Close'] < latest.get('SMA_20', latest['Close']) and latest['Close'] < latest.get('SMA_50', latest['Close']):
-        sell_score += 10
-        reasons.append("Price below key MAs")
-
-    # 5. Bollinger Bands (10 points)
-    if latest['Close'] < latest.get('BB_Lower', latest['Close']):
-        buy_score += 10
-        reasons.append("Price below Bollinger Lower Band")
-    elif latest['Close'] > latest.get('BB_Upper', latest['Close']):
-        sell_score += 10
-        reasons.append("Price above Bollinger Upper Band")
-
-    # 6. Stochastic Oscillator (5 points)
-    k_percent = latest.get('%K', 50)
-    d_percent = latest.get('%D', 50)
-    if k_percent < 20 and d_percent < 20 and latest['Close'] > latest['Low']:
-        buy_score += 5
-        reasons.append("Stochastic oversold")
-    elif k_percent > 80 and d_percent > 80 and latest['Close'] < latest['High']:
-        sell_score += 5
-        reasons.append("Stochastic overbought")
-
-    # Calculate final signal and confidence
-    total_score = buy_score + sell_score
-    if total_score == 0:
-        return "HOLD", "No clear signals detected.", 0.5
-    
-    if buy_score > sell_score:
-        signal = "BUY"
-        confidence = min(buy_score / total_score, 1.0)
-        reason = f"Bullish signals detected: {', '.join(reasons[:3])}"
-    elif sell_score > buy_score:
-        signal = "SELL"
-        confidence = min(sell_score / total_score, 1.0)
-        reason = f"Bearish signals detected: {', '.join(reasons[:3])}"
-    else: # Equal scores
-        signal = "HOLD"
-        confidence = 0.5
-        reason = "Mixed signals or weak consensus. Wait for a clearer trend."
-
-    return signal, reason, confidence
 
 # --- Gemini AI Recommendation Function ---
 @st.cache_data(ttl=300) # Cache Gemini responses for 5 minutes
-def get_gemini_recommendation(symbol, current_price, analyzed_data):
+@shared_cache("llm:gemini", ttl=300)
+def get_gemini_recommendation(symbol, current_price, snapshot, timeframe="daily"):
     """
     Gets a stock recommendation from the Gemini AI model based on current price and technical indicators.
+    `snapshot` is feature_snapshot(analyzed_data), so the caches key on the prompt's inputs only;
+    `timeframe` names the bars it was computed on.
     Returns a tuple: (signal, reason, confidence) or (None, error_message, None)
     """
-    if analyzed_data.empty:
+    if not snapshot:
         return "HOLD", "Insufficient data for Gemini analysis.", 0.5
 
-    latest = analyzed_data.iloc[-1]
-
-    # Prepare detailed input for Gemini
-    prompt_text = f"""
-    Analyze the stock {symbol} with the following latest data and provide a trading recommendation (BUY, SELL, or HOLD).
-    Current Price: ₹{current_price:.2f}
-
-    Technical Indicators:
-    - Last Close Price: ₹{latest.get('Close', 'N/A'):.2f}
-    - SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f}
-    - SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
-    - RSI: {latest.get('RSI', 'N/A'):.2f}
-    - MACD: {latest.get('MACD', 'N/A'):.4f}
-    - MACD Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
-    - Bollinger Bands (Upper): ₹{latest.get('BB_Upper', 'N/A'):.2f}
-    - Bollinger Bands (Middle): ₹{latest.get('BB_Middle', 'N/A'):.2f}
-    - Bollinger Bands (Lower): ₹{latest.get('BB_Lower', 'N/A'):.2f}
-    - Stochastic %K: {latest.get('%K', 'N/A'):.2f}
-    - Stochastic %D: {latest.get('%D', 'N/A'):.2f}
-
-    Consider these factors:
-    - RSI below 30 suggests oversold, above 70 suggests overbought.
-    - MACD crossover above signal line is bullish, below is bearish.
-    - Price above moving averages (SMA 20, 50) is bullish, below is bearish.
-    - Price near Bollinger Lower Band is bullish, near Upper Band is bearish.
-    - Stochastic %K and %D below 20 suggest oversold, above 80 suggest overbought.
-
-    Provide your recommendation as a JSON object with the following keys:
-    "signal": "BUY" | "SELL" | "HOLD"
-    "reason": "A brief explanation for the recommendation."
-    "confidence": 0.0 to 1.0 (float, indicating confidence in the recommendation)
-    """
+    prompt_text = compile_prompt("gemini", symbol, current_price, snapshot, LLM_PROMPT_TOKEN_BUDGET, timeframe)["user"]
 
     chat_history = []
     # FIX: Changed .push to .append for Python list
@@ -624,15 +1478,7 @@ def get_gemini_recommendation(symbol, current_price, analyzed_data):
         "contents": chat_history,
         "generationConfig": {
             "responseMimeType": "application/json",
-            "responseSchema": {
-                "type": "OBJECT",
-                "properties": {
-                    "signal": {"type": "STRING", "enum": ["BUY", "SELL", "HOLD"]},
-                    "reason": {"type": "STRING"},
-                    "confidence": {"type": "NUMBER", "format": "float"}
-                },
-                "required": ["signal", "reason", "confidence"]
-            }
+            "responseSchema": GEMINI_SIGNAL_SCHEMA
         }
     }
     
@@ -641,17 +1487,16 @@ def get_gemini_recommendation(symbol, current_price, analyzed_data):
     apiKey = GEMINI_API_KEY
     # url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={apiKey}"
     # url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={apiKey}"
-    apiUrl = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={apiKey}"
-
+    apiUrl = f"{GEMINI_API_BASE}/models/{model_name}:generateContent?key={apiKey}"
 
 
     try:
-        response = requests.post(apiUrl, headers={'Content-Type': 'application/json'}, json=payload, timeout=20)
+        response = get_http_client().post(apiUrl, headers={'Content-Type': 'application/json'}, json=payload, timeout=20)
 
         if response.status_code == 429:
-            return "HOLD", "Gemini AI: API rate limit reached. Please wait a moment and try again.", 0.5
+            return None, "Gemini AI: API rate limit reached. Please wait a moment and try again.", None
         if response.status_code == 404:
-            return "HOLD", "Gemini AI: The selected model is unavailable. Please check your API key and model name.", 0.5
+            return None, "Gemini AI: The selected model is unavailable. Please check your API key and model name.", None
 
         response.raise_for_status()
         
@@ -667,61 +1512,42 @@ def get_gemini_recommendation(symbol, current_price, analyzed_data):
             
             return signal, reason, confidence
         else:
-            return "HOLD", "Gemini AI: No valid response from the model.", 0.5
+            return None, "Gemini AI: No valid response from the model.", None
     except requests.exceptions.HTTPError as e:
         status = e.response.status_code if e.response is not None else "unknown"
         if status == 429:
-            return "HOLD", "Gemini AI: API rate limit reached. Please wait a moment and try again.", 0.5
+            return None, "Gemini AI: API rate limit reached. Please wait a moment and try again.", None
         if status == 403:
-            return "HOLD", "Gemini AI: Access denied. Please check your API key permissions.", 0.5
-        return "HOLD", f"Gemini AI: HTTP error {status}. Please try again later.", 0.5
+            return None, "Gemini AI: Access denied. Please check your API key permissions.", None
+        return None, f"Gemini AI: HTTP error {status}. Please try again later.", None
     except requests.exceptions.RequestException as e:
-        return "HOLD", "Gemini AI: Network error. Please check your internet connection.", 0.5
+        return None, "Gemini AI: Network error. Please check your internet connection.", None
     except json.JSONDecodeError:
-        return "HOLD", "Gemini AI: Could not parse JSON response.", 0.5
+        return None, "Gemini AI: Could not parse JSON response.", None
     except Exception as e:
-        return "HOLD", f"Gemini AI: An unexpected error occurred: {e}", 0.5
+        return None, f"Gemini AI: An unexpected error occurred: {e}", None
 
 
 # --- Grok AI (xAI) Recommendation Function — Top Priority ---
 @st.cache_data(ttl=300)
-def get_grok_recommendation(symbol, current_price, analyzed_data):
-    """Primary AI: xAI Grok — fast reasoning model for Indian stock analysis."""
+@shared_cache("llm:grok", ttl=300)
+def get_grok_recommendation(symbol, current_price, snapshot, timeframe="daily"):
+    """Primary AI: xAI Grok — fast reasoning model for Indian stock analysis (see feature_snapshot)."""
     if not OPENAI_SDK_AVAILABLE:
         return None, "openai SDK not installed. Run: pip install openai", None
     if not XAI_API_KEY:
         return None, "xAI API key not set.", None
-    if analyzed_data.empty:
+    if not snapshot:
         return "HOLD", "Insufficient data for Grok analysis.", 0.5
 
-    latest = analyzed_data.iloc[-1]
-    prompt = f"""You are an expert quantitative analyst specialising in Indian stock markets (NSE/BSE).
-Analyse {symbol} using the technical data below and give a precise trading recommendation.
-
-Current Price: ₹{current_price:.2f}
-Technical Indicators:
-- RSI (14): {latest.get('RSI', 'N/A'):.2f}
-- MACD: {latest.get('MACD', 'N/A'):.4f} | MACD Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
-- SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f} | SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
-- Bollinger Upper: ₹{latest.get('BB_Upper', 'N/A'):.2f} | Lower: ₹{latest.get('BB_Lower', 'N/A'):.2f}
-- Stochastic %K: {latest.get('%K', 'N/A'):.2f} | %D: {latest.get('%D', 'N/A'):.2f}
-
-Rules:
-- RSI < 30 = oversold (bullish), RSI > 70 = overbought (bearish)
-- MACD above signal line = bullish momentum
-- Price above SMA 20 & SMA 50 = bullish trend
-- Price below BB Lower = potential reversal up
-
-Reply ONLY with a JSON object — no extra text:
-{{"signal": "BUY" | "SELL" | "HOLD", "reason": "<one concise sentence>", "confidence": <0.0-1.0>}}"""
+    prompt = compile_prompt("grok", symbol, current_price, snapshot, LLM_PROMPT_TOKEN_BUDGET, timeframe)
 
     try:
-        client = OpenAIClient(api_key=XAI_API_KEY, base_url="https://api.x.ai/v1")
-        response = client.chat.completions.create(
+        response = get_grok_client(XAI_API_KEY).chat.completions.create(
             model=XAI_MODEL,
             messages=[
-                {"role": "system", "content": "You are a precise Indian stock market analyst. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": prompt["system"]},
+                {"role": "user", "content": prompt["user"]}
             ],
             temperature=0.2,
             max_tokens=200,
@@ -738,7 +1564,7 @@ Reply ONLY with a JSON object — no extra text:
         confidence = float(output.get("confidence", 0.5))
         return signal, reason, confidence
     except json.JSONDecodeError:
-        return "HOLD", "Grok AI: Could not parse response as JSON.", 0.5
+        return None, "Grok AI: Could not parse response as JSON — falling back.", None
     except Exception as e:
         err = str(e)
         if "429" in err or "rate" in err.lower():
@@ -754,35 +1580,22 @@ Reply ONLY with a JSON object — no extra text:
 
 # --- Groq AI Recommendation Function (Secondary AI) ---
 @st.cache_data(ttl=300)
-def get_groq_recommendation(symbol, current_price, analyzed_data):
-    """Primary AI: Groq llama3-70b — 14,400 free requests/day."""
+@shared_cache("llm:groq", ttl=300)
+def get_groq_recommendation(symbol, current_price, snapshot, timeframe="daily"):
+    """Primary AI: Groq llama3-70b — 14,400 free requests/day (see feature_snapshot)."""
     if not GROQ_AVAILABLE:
         return None, "Groq library not installed. Run: pip install groq", None
     if not GROQ_API_KEY:
         return None, "Groq API key not set. Get a free key at groq.com", None
-    if analyzed_data.empty:
+    if not snapshot:
         return "HOLD", "Insufficient data for Groq analysis.", 0.5
 
-    latest = analyzed_data.iloc[-1]
-    prompt = f"""You are a professional stock analyst for Indian markets (NSE/BSE).
-Analyze {symbol} and give a trading recommendation.
-
-Current Price: ₹{current_price:.2f}
-Technical Indicators:
-- RSI: {latest.get('RSI', 'N/A'):.2f}
-- MACD: {latest.get('MACD', 'N/A'):.4f} | Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
-- SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f} | SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
-- Bollinger Upper: ₹{latest.get('BB_Upper', 'N/A'):.2f} | Lower: ₹{latest.get('BB_Lower', 'N/A'):.2f}
-- Stochastic %K: {latest.get('%K', 'N/A'):.2f} | %D: {latest.get('%D', 'N/A'):.2f}
-
-Return ONLY a JSON object with keys: signal (BUY/SELL/HOLD), reason (1 sentence), confidence (0.0-1.0)
-Example: {{"signal": "BUY", "reason": "RSI oversold with MACD bullish crossover.", "confidence": 0.72}}"""
+    prompt = compile_prompt("groq", symbol, current_price, snapshot, LLM_PROMPT_TOKEN_BUDGET, timeframe)
 
     try:
-        client = Groq(api_key=GROQ_API_KEY)
-        response = client.chat.completions.create(
+        response = get_groq_client(GROQ_API_KEY).chat.completions.create(
             model="llama3-70b-8192",
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": prompt["user"]}],
             response_format={"type": "json_object"},
             temperature=0.3,
             max_tokens=200,
@@ -797,27 +1610,221 @@ Example: {{"signal": "BUY", "reason": "RSI oversold with MACD bullish crossover.
         return None, f"Groq AI error: {e}", None
 
 
+# --- Concurrent AI Fan-out (one page-level deadline for every provider) ---
+# Priority order for the final decision. Each entry: (name, recommend_fn, enabled, desc when up,
+# desc when down, soft_fail); a soft_fail provider's (None, error, None) answer is shown as a HOLD warning
+AI_PROVIDERS = (
+    ("✨ Grok AI (xAI)", get_grok_recommendation, OPENAI_SDK_AVAILABLE and bool(XAI_API_KEY),
+     "xAI reasoning model — analyses indicators like a professional quant analyst.",
+     "xAI Grok — unavailable (no credits or API error).", False),
+    ("🟣 Groq (llama3-70b)", get_groq_recommendation, GROQ_AVAILABLE and bool(GROQ_API_KEY),
+     "Meta's llama3-70b via Groq — 14,400 free API calls/day.",
+     "Groq llama3 — unavailable.", False),
+    ("🔵 Gemini AI (Google)", get_gemini_recommendation, True,
+     "Google Gemini 2.0 Flash — free fallback AI model.",
+     "Google Gemini 2.0 Flash — free fallback AI model.", True),
+)
+
+
+@st.cache_resource
+def get_llm_fanout():
+    return LLMFanout()
+
+
+def fan_out_recommendations(symbol, current_price, analyzed_data, timeframe="daily",
+                            deadline_s=LLM_FANOUT_DEADLINE_S, providers=AI_PROVIDERS):
+    """Ask every enabled AI provider at once; return {name: model-result dict} in priority order.
+
+    ``timeframe`` labels the bars ``analyzed_data`` holds, for the prompt.
+
+    Whatever has answered when ``deadline_s`` runs out is returned; a provider
+    that has not is reported with status "pending" and its answer is served
+    from cache on the next rerun.
+    """
+    fanout = get_llm_fanout()
+    price, snapshot = round(float(current_price), 2), feature_snapshot(analyzed_data)
+    args = (symbol, price, snapshot, timeframe)
+    futures = {name: fanout.submit((name,) + args, fn, *args)
+               for name, fn, enabled, *_ in providers if enabled}
+    wait(futures.values(), timeout=deadline_s)
+
+    results = {}
+    for name, _, enabled, desc, down_desc, soft_fail in providers:
+        if not enabled:
+            continue
+        future = futures[name]
+        if not future.done():
+            results[name] = {"signal": "N/A", "reason": f"Still waiting after {deadline_s:.0f}s — refresh to see it.",
+                             "confidence": 0, "status": "pending", "desc": desc}
+            continue
+        try:
+            signal, reason, confidence = future.result()
+        except Exception as e:
+            signal, reason, confidence = None, f"{name} failed: {e}", None
+        if signal is None and soft_fail:
+            results[name] = {"signal": "HOLD", "reason": reason, "confidence": 0.5, "status": "warn", "desc": desc}
+        elif signal is None:
+            results[name] = {"signal": "N/A", "reason": reason, "confidence": 0, "status": "error", "desc": down_desc}
+        else:
+            results[name] = {"signal": signal, "reason": reason, "confidence": confidence, "status": "ok",
+                             "desc": desc}
+    return results
+
+
+# --- Batched AI Scoring (prompt and reply checks in prompts.py, chunking in llm.py) ---
+
+
+def _complete_groq(prompt, max_tokens, system=None):
+    messages = [{"role": "system", "content": system}] if system else []
+    response = get_groq_client(GROQ_API_KEY).chat.completions.create(
+        model="llama3-70b-8192",
+        messages=messages + [{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+        temperature=0.3,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content
+
+
+def _complete_grok(prompt, max_tokens, system=None):
+    response = get_grok_client(XAI_API_KEY).chat.completions.create(
+        model=XAI_MODEL,
+        messages=[
+            {"role": "system", "content": system or PROMPT_STYLES["grok"]["system"]},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content
+
+
+def _complete_gemini(prompt, max_tokens, system=None, schema=None):
+    config = {"responseMimeType": "application/json", "maxOutputTokens": max_tokens}
+    if schema:
+        config["responseSchema"] = schema
+    payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": config}
+    if system:
+        payload["systemInstruction"] = {"parts": [{"text": system}]}
+    response = get_http_client().post(f"{GEMINI_API_BASE}/models/{model_name}:generateContent?key={GEMINI_API_KEY}",
+                                      json=payload, timeout=LLM_TIMEOUT_S * 2)
+    response.raise_for_status()
+    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+
+# name -> (complete(prompt, max_tokens) -> reply text, enabled, context window in tokens); Groq first
+# because its free daily quota is the one that per-symbol calls used up
+BATCH_PROVIDERS = {
+    "Groq (llama3-70b)": (_complete_groq, GROQ_AVAILABLE and bool(GROQ_API_KEY), 8192),
+    "Grok AI (xAI)": (_complete_grok, OPENAI_SDK_AVAILABLE and bool(XAI_API_KEY), 131072),
+    "Gemini AI (Google)": (_complete_gemini, bool(GEMINI_API_KEY), 1_000_000),
+}
+
+
+def _complete_batch(value):
+    """Share a batch result only when every symbol was scored without reply problems."""
+    _, stats = value
+    return not stats["problems"] and stats["scored"] == stats["symbols"]
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+@shared_cache("llm:batch", ttl=300, share_if=_complete_batch)
+def get_batch_recommendations(provider, entries):
+    """Batch-score ``entries`` with one of BATCH_PROVIDERS; cached on the snapshots like the single calls."""
+    complete, enabled, context_tokens = BATCH_PROVIDERS[provider]
+    if not enabled:
+        return {}, {"requests": 0, "prompt tokens": 0, "symbols": len(entries), "re-asked": 0, "scored": 0,
+                    "problems": [f"{provider} is not configured."]}
+    return score_batched(list(entries), complete, context_tokens, get_llm_fanout(), LLM_BATCH_MAX_SYMBOLS)
+
+
+# --- Bulk OHLCV Fetch Layer (shared by Heatmap & Screener) ---
+BULK_RETRY_WORKERS = 8   # bounded pool for per-symbol retries of batch misses
+UNIVERSE_GAP_SLACK = 5   # extra bars so a symbol missing a few sessions still has a full lookback
+# Heatmap, screener and the screener's AI column share one panel: enough bars for the
+# screener indicators, converged EMAs in the AI snapshots and the 1-month change
+# (21 bars back), plus slack.
+UNIVERSE_SCAN_BARS = max(required_history(SCREENER_INDICATORS + tuple(name for name in BATCH_INDICATORS
+                                                                      if name in INDICATOR_REGISTRY)),
+                         22) + UNIVERSE_GAP_SLACK
+
+
+def _fetch_single_history(ticker, window, interval):
+    """Per-symbol retry used for tickers missing from the batched download."""
+    try:
+        return ticker, yf.Ticker(ticker).history(interval=interval, **window)
+    except Exception:
+        return ticker, pd.DataFrame()
+
+
+@st.cache_data(ttl=600)
+@shared_cache("universe_ohlcv", ttl=600)
+def fetch_universe_ohlcv(symbols, period="3mo", interval="1d", bars=None):
+    """Fetch OHLCV for a whole universe of NSE symbols as one dates × symbols panel.
+
+    The universe is pulled with a single batched ``yf.download`` call; symbols that
+    come back empty are retried one by one on a bounded thread pool. Columns are a
+    (field, symbol) MultiIndex, so ``panel["Close"]`` is a dates × symbols frame.
+    With ``bars`` only the last ``bars`` sessions are downloaded and kept instead
+    of the whole ``period``.
+    """
+    tickers = {f"{sym}.NS": sym for sym in dict.fromkeys(symbols)}
+    window = {"start": history_start(bars, interval).strftime("%Y-%m-%d")} if bars else {"period": period}
+    frames = {}
+
+    try:
+        batch = yf.download(list(tickers), interval=interval, group_by="ticker",
+                            auto_adjust=True, threads=True, progress=False, **window)
+    except Exception:
+        batch = pd.DataFrame()
+    if isinstance(batch.columns, pd.MultiIndex):
+        batch_tickers = set(batch.columns.get_level_values(0))
+        for ticker, sym in tickers.items():
+            if ticker in batch_tickers:
+                frame = _normalise_ohlcv(batch[ticker])
+                if not frame.empty:
+                    frames[sym] = frame
+
+    failed = [ticker for ticker, sym in tickers.items() if sym not in frames]
+    if failed:
+        with ThreadPoolExecutor(max_workers=min(BULK_RETRY_WORKERS, len(failed))) as pool:
+            futures = [pool.submit(_fetch_single_history, t, window, interval) for t in failed]
+            for future in as_completed(futures):
+                ticker, hist = future.result()
+                if hist is not None and not hist.empty:
+                    frames[tickers[ticker]] = _normalise_ohlcv(hist)
+
+    if not frames:
+        return pd.DataFrame()
+    panel = pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+    if bars:
+        panel = panel.tail(bars)
+    return compact_frame(panel) if COMPACT_FRAMES else panel
+
+
 # --- Nifty 50 Heatmap ---
 @st.cache_data(ttl=600)
 def fetch_nifty50_heatmap_data():
     """Fetch 1-day % change for all Nifty 50 stocks."""
+    panel = fetch_universe_ohlcv(tuple(NIFTY50_SYMBOLS), bars=UNIVERSE_SCAN_BARS)
+    if panel.empty:
+        return pd.DataFrame()
+    snapshot = universe_indicator_snapshot(panel, outputs=())
     results = []
-    for sym in NIFTY50_SYMBOLS:
-        try:
-            ticker = yf.Ticker(f"{sym}.NS")
-            hist = ticker.history(period="2d")
-            if len(hist) >= 2:
-                prev = hist["Close"].iloc[-2]
-                curr = hist["Close"].iloc[-1]
-                chg = ((curr - prev) / prev) * 100
-                results.append({
-                    "Symbol": sym,
-                    "Price": round(curr, 2),
-                    "Change%": round(chg, 2),
-                    "Sector": NIFTY50_SECTORS.get(sym, "Other")
-                })
-        except Exception:
+    for sym in dict.fromkeys(NIFTY50_SYMBOLS):
+        if sym not in snapshot.index:
             continue
+        row = snapshot.loc[sym]
+        if row["Bars"] >= 2:
+            prev = row["Prev_Close"]
+            curr = row["Close"]
+            chg = ((curr - prev) / prev) * 100
+            results.append({
+                "Symbol": sym,
+                "Price": round(curr, 2),
+                "Change%": round(chg, 2),
+                "Sector": NIFTY50_SECTORS.get(sym, "Other")
+            })
     return pd.DataFrame(results)
 
 
@@ -866,26 +1873,26 @@ def show_nifty50_heatmap():
 # --- Stock Screener ---
 @st.cache_data(ttl=600)
 def fetch_screener_data():
-    """Fetch key metrics for all Nifty 50 stocks for screening."""
+    """Key metrics for all Nifty 50 stocks, plus their AI feature snapshots from the same panel."""
+    panel = fetch_universe_ohlcv(tuple(NIFTY50_SYMBOLS), bars=UNIVERSE_SCAN_BARS)
+    if panel.empty:
+        return pd.DataFrame(), ()
+    snapshot = universe_indicator_snapshot(panel, SCREENER_INDICATORS)
     results = []
-    for sym in NIFTY50_SYMBOLS:
+    for sym in dict.fromkeys(NIFTY50_SYMBOLS):
         try:
-            ticker = yf.Ticker(f"{sym}.NS")
-            hist = ticker.history(period="3mo")
-            if len(hist) < 50:
+            if sym not in snapshot.index:
+                continue
+            row = snapshot.loc[sym]
+            if row["Bars"] < 50:
                 continue
-            close = hist["Close"]
-            delta = close.diff()
-            gain = delta.where(delta > 0, 0).rolling(14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-            rs = gain / loss
-            rsi = (100 - (100 / (1 + rs))).iloc[-1]
-            sma20 = close.rolling(20).mean().iloc[-1]
-            sma50 = close.rolling(50).mean().iloc[-1]
-            curr = close.iloc[-1]
-            prev = close.iloc[-2]
+            rsi = row["RSI"]
+            sma20 = row["SMA_20"]
+            sma50 = row["SMA_50"]
+            curr = row["Close"]
+            prev = row["Prev_Close"]
             chg1d = ((curr - prev) / prev) * 100
-            chg1m = ((curr - close.iloc[-21]) / close.iloc[-21]) * 100 if len(close) > 21 else 0
+            chg1m = ((curr - row["Close_21"]) / row["Close_21"]) * 100 if row["Bars"] > 21 else 0
             results.append({
                 "Symbol": sym,
                 "Sector": NIFTY50_SECTORS.get(sym, "Other"),
@@ -898,7 +1905,7 @@ def fetch_screener_data():
             })
         except Exception:
             continue
-    return pd.DataFrame(results)
+    return pd.DataFrame(results), universe_snapshots(panel)
 
 
 def show_stock_screener():
@@ -916,12 +1923,31 @@ def show_stock_screener():
     above_sma50 = st.checkbox("Only stocks above SMA 50")
 
     with st.spinner("Screening Nifty 50 stocks..."):
-        df = fetch_screener_data()
+        df, ai_entries = fetch_screener_data()
 
     if df.empty:
         st.warning("Could not fetch screener data.")
         return
 
+    batch_providers = [name for name, (_, enabled, _) in BATCH_PROVIDERS.items() if enabled]
+    ai_col1, ai_col2 = st.columns([1, 2])
+    with_ai = ai_col1.checkbox("🤖 Add AI signals", disabled=not batch_providers,
+                               help="Scores the whole universe in a few batched AI requests instead of one per stock.")
+    if with_ai:
+        provider = ai_col2.selectbox("AI provider", batch_providers, label_visibility="collapsed")
+        with st.spinner(f"Scoring {len(df)} stocks with {provider}..."):
+            ai_results, ai_stats = get_batch_recommendations(provider, ai_entries)
+        df = df.assign(**{
+            "AI Signal": df["Symbol"].map(lambda sym: ai_results.get(sym, ("—",))[0]),
+            "AI Conf.": df["Symbol"].map(lambda sym: ai_results[sym][2] if sym in ai_results else None),
+            "AI Reason": df["Symbol"].map(lambda sym: ai_results.get(sym, ("", ""))[1]),
+        })
+        st.caption(f"{ai_stats['scored']}/{ai_stats['symbols']} stocks scored in {ai_stats['requests']} request(s), "
+                   f"~{ai_stats['prompt tokens']:,} prompt tokens"
+                   + (f" · {len(ai_stats['problems'])} reply issue(s)" if ai_stats["problems"] else ""))
+    elif not batch_providers:
+        ai_col2.caption("Set GROQ_API_KEY, XAI_API_KEY or GEMINI_API_KEY to add AI signals.")
+
     filtered = df.copy()
     if sector_filter:
         filtered = filtered[filtered["Sector"].isin(sector_filter)]
@@ -1003,6 +2029,7 @@ def show_whatsapp_digest(stock_data, analyzed_data, ai_signal, ai_reason):
 
 # --- News Sentiment via GDELT ---
 @st.cache_data(ttl=900)  # Cache 15 min
+@shared_cache("gdelt_news", ttl=900)
 def fetch_gdelt_news(query, max_articles=8):
     """Fetch recent news articles from GDELT for a given query."""
     try:
@@ -1012,7 +2039,7 @@ def fetch_gdelt_news(query, max_articles=8):
             f"?query={encoded}&mode=artlist&maxrecords={max_articles}"
             f"&format=json&timespan=3d&sort=DateDesc"
         )
-        resp = requests.get(url, timeout=15)
+        resp = get_http_client().get(url, timeout=15)
         resp.raise_for_status()
         data = resp.json()
         return data.get("articles", [])
@@ -1197,19 +2224,12 @@ def hold_stock(symbol):
     })
     st.info(f"📊 Holding position in {symbol}")
 
-def get_nse_data(symbol, period="3M"):
-    if not NSELIB_AVAILABLE: return None
-    
-    # Fetch data using nselib
-    try:
-        data = capital_market.price_volume_and_deliverable_position_data(symbol=symbol, period=period)
-    except Exception as e:
-        st.error(f"Error fetching data from NSELib for {symbol}: {e}")
-        return None
+def _fetch_nse_history(symbol, period="3M"):
+    """Daily OHLCV from NSELib in the Yahoo column layout. Raises ValueError on unusable data."""
+    data = capital_market.price_volume_and_deliverable_position_data(symbol=symbol, period=period)
 
     if data is None or data.empty:
-        st.warning(f"No data available from NSELib for {symbol} for the period {period}.")
-        return None
+        raise ValueError(f"No data available from NSELib for {symbol} for the period {period}.")
     
     data.columns = data.columns.str.strip()
     
@@ -1229,19 +2249,33 @@ def get_nse_data(symbol, period="3M"):
     required_cols = ['Close', 'Open', 'High', 'Low', 'Volume']
     if not all(col in data.columns for col in required_cols):
         missing_cols = [col for col in required_cols if col not in data.columns]
-        st.error(f"NSE Library data for {symbol} is missing required columns: {', '.join(missing_cols)}. Cannot proceed with analysis.")
-        return None
+        raise ValueError(f"NSE Library data for {symbol} is missing required columns: {', '.join(missing_cols)}. Cannot proceed with analysis.")
+    # NSE reports numbers as text with thousands separators
+    for col in required_cols:
+        data[col] = pd.to_numeric(data[col].astype(str).str.replace(",", ""), errors="coerce")
 
     if 'Date' in data.columns:
         data['Date'] = pd.to_datetime(data['Date'])
         data.set_index('Date', inplace=True)
     else:
-        st.error(f"NSE Library data for {symbol} is missing 'Date' column. Cannot set index.")
-        return None
+        raise ValueError(f"NSE Library data for {symbol} is missing 'Date' column. Cannot set index.")
 
     # Ensure there's enough data after processing for calculations
     if data.empty or len(data) < 2: # Need at least 2 data points for prev_close calculation
-        st.warning(f"NSE Library data for {symbol} is insufficient for full analysis after processing.")
+        raise ValueError(f"NSE Library data for {symbol} is insufficient for full analysis after processing.")
+    return data[required_cols]
+
+def get_nse_data(symbol, period="3M"):
+    if not NSELIB_AVAILABLE: return None
+    
+    # Fetch data using nselib
+    try:
+        data = _fetch_nse_history(symbol, period)
+    except ValueError as e:
+        st.warning(str(e))
+        return None
+    except Exception as e:
+        st.error(f"Error fetching data from NSELib for {symbol}: {e}")
         return None
 
     # Fetch current price from Finnhub or another source as NSELib only provides historical data
@@ -1267,38 +2301,23 @@ def _get_realtime_price_finnhub(symbol):
     if not FINNHUB_API_KEY:
         return None, None
     try:
-        finnhub_symbol = f"NSE:{symbol}"
-        url = f"https://finnhub.io/api/v1/quote?symbol={finnhub_symbol}&token={FINNHUB_API_KEY}"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+        data = get_finnhub_client().quote(f"NSE:{symbol}", timeout=5)
         if data and 'c' in data and data['c'] != 0:
             return data['c'], data.get('pc', data['c'])
     except Exception:
         return None, None
     return None, None
 
+# --- Demo Data (synthetic prices from bars.py) ---
+
+
 def create_demo_data(symbol):
-    dates = pd.date_range(end=datetime.now(), periods=100, freq='D')
-    np.random.seed(hash(symbol) % 1000)
-    base_price = 100 + (hash(symbol) % 1000)
-    returns = np.random.normal(0.001, 0.02, 100)
-    prices = [base_price]
-    for ret in returns[1:]:
-        prices.append(prices[-1] * (1 + ret))
-    historical_data = pd.DataFrame({
-        'Date': dates,
-        'Open': [p * np.random.uniform(0.98, 1.02) for p in prices],
-        'High': [p * np.random.uniform(1.00, 1.05) for p in prices],
-        'Low': [p * np.random.uniform(0.95, 1.00) for p in prices],
-        'Close': prices,
-        'Volume': np.random.randint(1000000, 10000000, 100)
-    })
-    historical_data.set_index('Date', inplace=True)
+    historical_data = generate_synthetic_ohlcv([symbol], 100, freq='D', drift=0.001, volatility=0.02).xs(symbol, axis=1, level=1)
+    prices = historical_data['Close']
     return {
         'symbol': symbol,
-        'price': prices[-1],
-        'prev_close': prices[-2] if len(prices) > 1 else prices[-1],
+        'price': prices.iloc[-1],
+        'prev_close': prices.iloc[-2] if len(prices) > 1 else prices.iloc[-1],
         'historical': historical_data,
         'day_high': historical_data['High'].iloc[-1],
         'day_low': historical_data['Low'].iloc[-1],
@@ -1308,6 +2327,13 @@ def create_demo_data(symbol):
     }
 
 # --- Main Dashboard Logic (Equity) ---
+DASHBOARD_CHART_BARS = 130   # the price chart shows the last ~6 months
+DASHBOARD_INDICATORS = PUBLIC_INDICATORS
+# Every charted row needs valid indicators (SMA 200 included), and the latest row needs converged EMAs
+DASHBOARD_HISTORY_BARS = max(DASHBOARD_CHART_BARS - 1 + required_history(DASHBOARD_INDICATORS, converged=False),
+                             required_history(DASHBOARD_INDICATORS))
+
+
 def equity_dashboard():
     st.sidebar.markdown("")
 
@@ -1329,14 +2355,19 @@ def equity_dashboard():
 
     col_refresh, col_auto = st.sidebar.columns(2)
     if col_refresh.button("🔄 Refresh", key="manual_refresh_btn"):
-        st.cache_data.clear()
+        refresh_symbol(symbol_to_fetch)
         st.rerun()
     if col_auto.checkbox("Auto (5m)", value=False):
         st_autorefresh(interval=300000, key="auto_refresh_trigger")
+    timeframe = st.sidebar.selectbox("⏱️ Timeframe", DASHBOARD_TIMEFRAMES, key="timeframe",
+                                     help="Intraday timeframes are rolled up from 1- or 5-minute bars.")
 
     # --- Fetch Data ---
+    rule_params, tuned_rules = active_rule_params()
+    history_bars = max(DASHBOARD_HISTORY_BARS, rule_history_bars(rule_params))
     with st.spinner(f"Loading {symbol_to_fetch}..."):
-        stock_data, error = get_realtime_stock_data(symbol_to_fetch)
+        stock_data, error = get_realtime_stock_data(symbol_to_fetch, cache_generation(f"quote:{symbol_to_fetch}"),
+                                                    history_bars)
 
     if error or not stock_data:
         st.error(f"❌ Could not find **{symbol_to_fetch}**. Check the symbol and try again.\n\nExamples: TCS, RELIANCE, INFY, SBIN, HDFCBANK")
@@ -1382,9 +2413,25 @@ def equity_dashboard():
     st.markdown("---")
 
     # --- Run analysis silently ---
+    page_timings = {}
+    bars_data, bar_label = stock_data['historical'], "day"
+    if timeframe != "1d" and stock_data.get('ticker'):
+        with _timed(page_timings, "intraday"):
+            intraday = intraday_bars(symbol_to_fetch, stock_data['ticker'], timeframe, history_bars)
+        if len(intraday) >= IncrementalIndicatorEngine.MIN_BARS:
+            bars_data, bar_label = intraday, timeframe
+        else:
+            st.info(f"Not enough {timeframe} bars for {symbol_to_fetch} yet — showing daily bars.")
     with st.spinner("🧠 Analysing..."):
-        analyzed_data = calculate_advanced_technical_indicators(stock_data['historical'])
-        model_signal, model_reason, model_confidence = generate_rule_based_trading_signal(analyzed_data)
+        with _timed(page_timings, "indicators"):
+            engine_key = symbol_to_fetch if bar_label == "day" else f"{symbol_to_fetch}@{bar_label}"
+            analyzed_data = streaming_technical_indicators(engine_key, bars_data, DASHBOARD_INDICATORS)
+        with _timed(page_timings, "rule_signal"):
+            rule_data = analyzed_data
+            if any(rule_params[k] != DEFAULT_RULE_PARAMS[k] for k in RULE_WINDOW_KEYS):
+                rule_data = rule_feature_frame(bars_data, rule_params)
+            model_signal, model_reason, model_confidence = generate_rule_based_trading_signal(
+                rule_data, rule_weights(rule_params), rule_sma_windows(rule_params))
 
     # --- Run ALL models and collect individual results ---
     all_model_results = {}
@@ -1394,56 +2441,18 @@ def equity_dashboard():
         "signal": model_signal, "reason": model_reason,
         "confidence": model_confidence, "status": "ok",
         "desc": "Analyses RSI, MACD, Bollinger Bands, Moving Averages using fixed mathematical rules."
+                + (f" Weights and windows tuned by the optimizer ({tuned_rules.get('saved_at', '')})."
+                   if tuned_rules else "")
     }
 
-    # Grok (xAI)
-    if OPENAI_SDK_AVAILABLE and XAI_API_KEY:
-        gk_signal, gk_reason, gk_conf = get_grok_recommendation(
-            stock_data['symbol'], stock_data['price'], analyzed_data)
-        if gk_signal is not None:
-            all_model_results["✨ Grok AI (xAI)"] = {
-                "signal": gk_signal, "reason": gk_reason,
-                "confidence": gk_conf, "status": "ok",
-                "desc": "xAI reasoning model — analyses indicators like a professional quant analyst."
-            }
-        else:
-            all_model_results["✨ Grok AI (xAI)"] = {
-                "signal": "N/A", "reason": gk_reason,
-                "confidence": 0, "status": "error",
-                "desc": "xAI Grok — unavailable (no credits or API error)."
-            }
-
-    # Groq (llama3)
-    if GROQ_AVAILABLE and GROQ_API_KEY:
-        gr_signal, gr_reason, gr_conf = get_groq_recommendation(
-            stock_data['symbol'], stock_data['price'], analyzed_data)
-        if gr_signal is not None:
-            all_model_results["🟣 Groq (llama3-70b)"] = {
-                "signal": gr_signal, "reason": gr_reason,
-                "confidence": gr_conf, "status": "ok",
-                "desc": "Meta's llama3-70b via Groq — 14,400 free API calls/day."
-            }
-        else:
-            all_model_results["🟣 Groq (llama3-70b)"] = {
-                "signal": "N/A", "reason": gr_reason,
-                "confidence": 0, "status": "error",
-                "desc": "Groq llama3 — unavailable."
-            }
-
-    # Gemini
-    gem_signal, gem_reason, gem_conf = get_gemini_recommendation(
-        stock_data['symbol'], stock_data['price'], analyzed_data)
-    status = "ok" if "rate limit" not in gem_reason.lower() and "error" not in gem_reason.lower() else "warn"
-    all_model_results["🔵 Gemini AI (Google)"] = {
-        "signal": gem_signal, "reason": gem_reason,
-        "confidence": gem_conf, "status": status,
-        "desc": "Google Gemini 2.0 Flash — free fallback AI model."
-    }
+    # Grok, Groq and Gemini run concurrently under one deadline; late answers are cached for the next rerun
+    with _timed(page_timings, "ai_fanout"):
+        all_model_results.update(fan_out_recommendations(stock_data['symbol'], stock_data['price'], analyzed_data,
+                                                         bar_timeframe(bar_label)))
 
     # --- Pick best AI for the final decision (first working non-rule model) ---
     ai_signal, ai_reason, ai_confidence, ai_source = model_signal, model_reason, model_confidence, "⚙️ Rule-Based Model"
-    priority = ["✨ Grok AI (xAI)", "🟣 Groq (llama3-70b)", "🔵 Gemini AI (Google)"]
-    for name in priority:
+    for name, *_ in AI_PROVIDERS:
         if name in all_model_results and all_model_results[name]["status"] == "ok":
             r = all_model_results[name]
             ai_signal, ai_reason, ai_confidence, ai_source = r["signal"], r["reason"], r["confidence"], name
@@ -1514,6 +2523,8 @@ def equity_dashboard():
                 status_badge = "<span style='background:#fef2f2;color:#dc2626;padding:2px 8px;border-radius:10px;font-size:0.75rem'>Unavailable</span>"
             elif res["status"] == "warn":
                 status_badge = "<span style='background:#fffbeb;color:#d97706;padding:2px 8px;border-radius:10px;font-size:0.75rem'>Rate Limited</span>"
+            elif res["status"] == "pending":
+                status_badge = "<span style='background:#eff6ff;color:#2563eb;padding:2px 8px;border-radius:10px;font-size:0.75rem'>⏳ Pending</span>"
             else:
                 status_badge = "<span style='background:#f0fdf4;color:#16a34a;padding:2px 8px;border-radius:10px;font-size:0.75rem'>✓ Active</span>"
 
@@ -1600,9 +2611,10 @@ def equity_dashboard():
         st.markdown(h1 + h2 + h3 + h4, unsafe_allow_html=True)
 
     # --- Simple Price Chart ---
-    st.markdown("#### 📈 Price Chart (Last 6 Months)")
+    st.markdown("#### 📈 Price Chart (Last 6 Months)" if bar_label == "day"
+                else f"#### 📈 Price Chart (Last {DASHBOARD_CHART_BARS} × {bar_label} bars)")
     if not analyzed_data.empty:
-        chart_data = analyzed_data.tail(130)
+        chart_data = analyzed_data.tail(DASHBOARD_CHART_BARS)
         fig = go.Figure()
         fig.add_trace(go.Candlestick(
             x=chart_data.index, open=chart_data['Open'], high=chart_data['High'],
@@ -1612,10 +2624,10 @@ def equity_dashboard():
         ))
         if 'SMA_20' in chart_data.columns:
             fig.add_trace(go.Scatter(x=chart_data.index, y=chart_data['SMA_20'],
-                name='20-day Avg', line=dict(color='#f59e0b', width=2)))
+                name=f'20-{bar_label} Avg', line=dict(color='#f59e0b', width=2)))
         if 'SMA_50' in chart_data.columns:
             fig.add_trace(go.Scatter(x=chart_data.index, y=chart_data['SMA_50'],
-                name='50-day Avg', line=dict(color='#6366f1', width=2)))
+                name=f'50-{bar_label} Avg', line=dict(color='#6366f1', width=2)))
         fig.update_layout(
             height=400, template='plotly_white',
             xaxis_rangeslider_visible=False,
@@ -1624,13 +2636,17 @@ def equity_dashboard():
             yaxis_title="Price (₹)"
         )
         st.plotly_chart(fig, use_container_width=True)
-        st.caption("🟡 20-day Average  ·  🟣 50-day Average  ·  Green candle = price went up that day  ·  Red = went down")
+        st.caption(f"🟡 20-{bar_label} Average  ·  🟣 50-{bar_label} Average  ·  "
+                   f"Green candle = price went up that {bar_label if bar_label == 'day' else 'bar'}  ·  Red = went down")
 
     # --- Advanced Details (hidden by default) ---
     with st.expander("🔬 See detailed technical indicators (for advanced users)"):
         if not analyzed_data.empty:
             adv_chart = create_comprehensive_chart(analyzed_data, stock_data['symbol'])
             st.plotly_chart(adv_chart, use_container_width=True)
+            skipped = analyzed_data.attrs.get("skipped_indicators")
+            if skipped:
+                st.caption(f"Not enough history ({len(bars_data)} bars) for: {', '.join(skipped)}")
             latest = analyzed_data.iloc[-1]
             det_df = pd.DataFrame({
                 "Indicator": ["RSI (14)", "MACD", "MACD Signal", "SMA 20", "SMA 50", "BB Upper", "BB Lower", "Stoch %K", "Stoch %D"],
@@ -1692,6 +2708,46 @@ def equity_dashboard():
     st.markdown("---")
     show_whatsapp_digest(stock_data, analyzed_data, final_signal, ai_reason)
 
+    # --- Load timing breakdown (operator diagnostics, shown with the Performance lab) ---
+    if PERF_LAB:
+        with st.expander("⏱️ Load timings (ms)"):
+            fetch_timings = stock_data.get('timings', {})
+            st.caption("Fetch stages are measured when the data was last fetched (cached for 5 minutes); analysis stages on this run.")
+            st.dataframe(pd.DataFrame(
+                [{"Stage": f"fetch · {k}", "ms": v} for k, v in fetch_timings.items()]
+                + [{"Stage": f"analysis · {k}", "ms": v} for k, v in page_timings.items()]
+            ), use_container_width=True, hide_index=True)
+            source_stats = get_source_router().stats()
+            if source_stats:
+                st.caption("Data-source health on this server (drives the hedged source order)")
+                st.dataframe(pd.DataFrame(source_stats), use_container_width=True, hide_index=True)
+            http_stats = get_http_client().stats()
+            if http_stats:
+                st.caption("HTTP connection reuse on this server (shared keep-alive pool)")
+                st.dataframe(pd.DataFrame(http_stats), use_container_width=True, hide_index=True)
+            llm_stats = get_llm_connection_stats().stats()
+            if llm_stats:
+                st.caption(f"Grok / Groq connections (persistent clients, HTTP/2 {'on' if HTTP2_AVAILABLE else 'off'}); "
+                           "Gemini is in the HTTP table above")
+                st.dataframe(pd.DataFrame(llm_stats), use_container_width=True, hide_index=True)
+            st.caption(f"AI prompt size per provider (estimated tokens, budget {LLM_PROMPT_TOKEN_BUDGET})")
+            st.dataframe(pd.DataFrame(prompt_token_report(stock_data['symbol'], stock_data['price'],
+                                                          feature_snapshot(analyzed_data),
+                                                          bar_timeframe(bar_label))),
+                         use_container_width=True, hide_index=True)
+            cache_stats = get_shared_cache().stats()
+            if cache_stats:
+                st.caption("Shared cache hit/miss counters for this server process")
+                st.dataframe(pd.DataFrame(cache_stats), use_container_width=True, hide_index=True)
+            st.caption(f"Frame memory (compact mode {'on' if COMPACT_FRAMES else 'off'})")
+            st.dataframe(pd.DataFrame([{"history KB": frame_memory_kb(stock_data['historical']),
+                                        "indicators KB": frame_memory_kb(analyzed_data),
+                                        "bars": len(stock_data['historical'])}]),
+                         use_container_width=True, hide_index=True)
+            if FINNHUB_API_KEY:
+                st.caption("Finnhub budget (shared token bucket)")
+                st.dataframe(pd.DataFrame([get_finnhub_client().counters]), use_container_width=True, hide_index=True)
+
     st.markdown(f"<div style='text-align:center;color:#94a3b8;font-size:0.8rem;margin-top:1rem'>⚠️ For educational purposes only — not financial advice · Last updated {stock_data.get('last_updated','')[:16]}</div>", unsafe_allow_html=True)
 
 # --- Derivatives Dashboard Logic ---
@@ -1962,15 +3018,16 @@ NSE_HEADERS = {
 }
 
 @st.cache_data(ttl=180)
+@shared_cache("option_chain", ttl=180)
 def fetch_option_chain(symbol: str = "NIFTY"):
     """Fetch live option chain from NSE India (free, no API key)."""
-    session = requests.Session()
+    client = get_http_client()   # shared pool keeps the NSE cookies warm between calls
     try:
-        session.get("https://www.nseindia.com", headers=NSE_HEADERS, timeout=10)
+        client.get("https://www.nseindia.com", headers=NSE_HEADERS, timeout=10)
         url = f"https://www.nseindia.com/api/option-chain-indices?symbol={symbol}"
         if symbol not in ("NIFTY", "BANKNIFTY", "FINNIFTY", "MIDCPNIFTY"):
             url = f"https://www.nseindia.com/api/option-chain-equities?symbol={symbol}"
-        resp = session.get(url, headers=NSE_HEADERS, timeout=15)
+        resp = client.get(url, headers=NSE_HEADERS, timeout=15)
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
@@ -2127,6 +3184,176 @@ def show_fno_dashboard():
         )
 
 
+# --- Rule-Strategy Backtester (Nifty 50 runs; the engine lives in backtest.py) ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def backtest_universe(symbols, period="5y"):
+    panel = fetch_universe_ohlcv(symbols, period=period)
+    if panel.empty:
+        return pd.DataFrame(), pd.Series(dtype=float), {}, ""
+    return backtest_panel(panel)
+
+
+def show_rule_backtest():
+    st.caption("Long when the rule model says BUY, flat on SELL, filled at the next day's open "
+               f"with {sum(BACKTEST_COSTS.values()):.0f} bps per trade for brokerage, STT and slippage.")
+    period = st.selectbox("History", ["1y", "3y", "5y", "10y"], index=2, key="backtest_period")
+    if not st.button("▶️ Run backtest", key="backtest_run"):
+        return
+    with st.spinner("Backtesting Nifty 50..."):
+        table, equity, summary, mode = backtest_universe(tuple(dict.fromkeys(NIFTY50_SYMBOLS)), period)
+    failed = table.attrs.get("failed", {})
+    if failed:
+        st.warning(f"Backtest failed for {len(failed)} symbol(s): "
+                   + "; ".join(f"{sym} ({error})" for sym, error in sorted(failed.items())[:5]))
+    if table.empty:
+        st.warning("Could not load price history for the backtest.")
+        return
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Portfolio CAGR", f"{summary['CAGR %']:.1f}%")
+    c2.metric("Sharpe", f"{summary['Sharpe']:.2f}")
+    c3.metric("Max drawdown", f"{summary['Max DD %']:.1f}%")
+    st.line_chart(equity.rename("Equal-weight equity (start = 1)"))
+    st.dataframe(table, use_container_width=True)
+    st.caption(f"{len(table)} symbols, run on {mode}.")
+
+
+# --- Rule Parameter Optimizer (saved parameters and the tuning panel) ---
+RULE_PARAMS_PATH = os.path.join(CACHE_DIR, "rule_params.json")
+RULE_PARAM_METRICS = ("CAGR %", "Sharpe", "Max DD %", "Hold-out CAGR %", "Hold-out Sharpe", "Hold-out Max DD %")
+# Without the admin key (or PERF_LAB) the search is capped: history, combinations, pool workers
+RULE_SEARCH_PUBLIC = ("3y", 250, 1)
+
+
+def load_rule_params():
+    """(params, record): saved optimizer parameters over the defaults; record is None when nothing is saved."""
+    try:
+        with open(RULE_PARAMS_PATH) as fh:
+            record = json.load(fh)
+    except (OSError, ValueError):
+        return dict(DEFAULT_RULE_PARAMS), None
+    saved = {k: type(DEFAULT_RULE_PARAMS[k])(v) for k, v in record.get("params", {}).items()
+             if k in DEFAULT_RULE_PARAMS}
+    return {**DEFAULT_RULE_PARAMS, **saved}, record
+
+
+def rule_params_record(row, universe, saved_at=None):
+    """(params, record) for an optimizer result row, ready to try in a session or to save."""
+    # DataFrame rows upcast windows to float; keep them with the defaults' types
+    params = {k: type(v)(row[k]) for k, v in DEFAULT_RULE_PARAMS.items()}
+    metrics = {m: float(row[m]) for m in RULE_PARAM_METRICS if m in row and pd.notna(row[m])}
+    return params, {"params": params, "metrics": metrics, "universe": universe,
+                    "saved_at": saved_at or datetime.now().strftime("%Y-%m-%d %H:%M")}
+
+
+def save_rule_params(record):
+    os.makedirs(os.path.dirname(RULE_PARAMS_PATH), exist_ok=True)
+    tmp_path = f"{RULE_PARAMS_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(record, fh, indent=2, default=float)
+    os.replace(tmp_path, RULE_PARAMS_PATH)   # readers never see a half-written file
+
+
+def reset_rule_params():
+    try:
+        os.remove(RULE_PARAMS_PATH)
+    except FileNotFoundError:
+        pass
+
+
+def active_rule_params():
+    """(params, record) for this visitor: parameters tried in the session, else the saved ones."""
+    return st.session_state.get("rule_params_trial") or load_rule_params()
+
+
+def rule_admin_unlocked(entered):
+    return bool(RULE_PARAMS_ADMIN_KEY) and hmac.compare_digest(str(entered), str(RULE_PARAMS_ADMIN_KEY))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def optimize_universe_rules(symbols, period, n_combos, seed=0, workers=None):
+    panel = fetch_universe_ohlcv(symbols, period=period)
+    if panel.empty:
+        return pd.DataFrame()
+    return walk_forward_rank(panel, rule_param_grid(n_random=n_combos, seed=seed), workers=workers)
+
+
+def show_rule_optimizer():
+    _, record = active_rule_params()
+    _, saved = load_rule_params()
+    trying = "rule_params_trial" in st.session_state
+    if record:
+        scope = "tried in this session only" if trying else f"saved {record.get('saved_at', '')}"
+        st.caption(f"Your dashboard uses tuned parameters {scope} ({record.get('universe', '')}, "
+                   f"hold-out Sharpe {record.get('metrics', {}).get('Hold-out Sharpe', 'n/a')}).")
+    else:
+        st.caption("Dashboard uses the default rule parameters.")
+
+    # The admin key unlocks the full search (every core, up to 10 years) and saving for every visitor
+    entered = ""
+    if RULE_PARAMS_ADMIN_KEY:
+        entered = st.text_input("Admin key (full search, save for every visitor)", type="password",
+                                key="optimizer_admin_key")
+        if entered and not rule_admin_unlocked(entered):
+            st.error("Wrong admin key.")
+    admin = rule_admin_unlocked(entered)
+    if admin or PERF_LAB:
+        c1, c2 = st.columns(2)
+        period = c1.selectbox("History", ["3y", "5y", "10y"], index=1, key="optimizer_period")
+        n_combos = c2.select_slider("Combinations", [250, 500, 1000, 2000, 5000], value=1000, key="optimizer_combos")
+        workers = None
+    else:
+        period, n_combos, workers = RULE_SEARCH_PUBLIC
+        st.caption(f"Quick search: {n_combos:,} parameter sets on {period} of history, one worker. "
+                   "The admin key unlocks longer histories and more combinations.")
+    if st.button("🔎 Search parameters", key="optimizer_run"):
+        with st.spinner(f"Backtesting {n_combos:,} parameter sets on Nifty 50..."):
+            st.session_state["rule_optimizer"] = (period, optimize_universe_rules(
+                tuple(dict.fromkeys(NIFTY50_SYMBOLS)), period, n_combos, workers=workers))
+    period_run, ranked = st.session_state.get("rule_optimizer", (None, pd.DataFrame()))
+    if ranked.attrs.get("failed_combinations"):
+        st.warning(f"{ranked.attrs['failed_combinations']:,} combinations failed: "
+                   + "; ".join(ranked.attrs.get("errors", [])[:3]))
+
+    best = None
+    if not ranked.empty and "Hold-out Sharpe" in ranked.columns:
+        st.caption(f"{len(ranked):,} combinations in {ranked.attrs.get('seconds', 0):.1f}s "
+                   f"({ranked.attrs.get('mode', '')}, {ranked.attrs.get('workers', 1)} workers), ranked on the "
+                   f"bars before {ranked.attrs['split']:%d %b %Y}. The leaders and the defaults were then "
+                   f"re-tested on the last {RULE_HOLDOUT_FRACTION:.0%} of dates, which the search never saw.")
+        st.dataframe(ranked.head(20), use_container_width=True)
+        top = ranked.iloc[0]
+        default_sharpe = ranked.attrs.get("holdout_default", {}).get("Hold-out Sharpe", np.nan)
+        if pd.notna(top["Hold-out Sharpe"]) and not top["Hold-out Sharpe"] <= default_sharpe:
+            best = top
+            st.caption(f"Top row on the held-out dates: Sharpe {top['Hold-out Sharpe']} "
+                       f"vs {default_sharpe} for the default parameters.")
+        else:
+            st.info(f"The top row's hold-out Sharpe ({top['Hold-out Sharpe']}) does not beat the default "
+                    f"parameters' ({default_sharpe}), so it is not offered for the dashboard.")
+    if best is not None and st.button("🧪 Use the top row on my dashboard", key="optimizer_try"):
+        st.session_state["rule_params_trial"] = rule_params_record(best, f"Nifty 50, {period_run}",
+                                                                    saved_at="this session")
+        st.rerun()
+    if trying and st.button("↩️ Back to the shared parameters", key="optimizer_untry"):
+        st.session_state.pop("rule_params_trial", None)
+        st.rerun()
+
+    # Saving changes the dashboard for every visitor of the deployment, so it needs the admin key
+    if not RULE_PARAMS_ADMIN_KEY:
+        st.caption("Set `RULE_PARAMS_ADMIN_KEY` in secrets to let an admin save parameters for every visitor.")
+        return
+    if not admin:
+        return
+    c1, c2 = st.columns(2)
+    if best is not None and c1.button("💾 Save the top row for every visitor", key="optimizer_save"):
+        save_rule_params(rule_params_record(best, f"Nifty 50, {period_run}")[1])
+        st.session_state.pop("rule_params_trial", None)
+        st.success("Saved — the Stock Analysis tab now uses these parameters for everyone.")
+    if saved and c2.button("↩️ Restore default parameters", key="optimizer_reset"):
+        reset_rule_params()
+        st.rerun()
+
+
 # --- Final Main App Flow ---
 market_type = st.sidebar.radio("Market Type", ["Equity", "Derivatives"])
 
@@ -2145,6 +3372,10 @@ if market_type == "Equity":
         show_nifty50_heatmap()
     with tab3:
         show_stock_screener()
+        with st.expander("📈 Backtest the rule-based strategy on Nifty 50"):
+            show_rule_backtest()
+        with st.expander("🎛️ Tune rule weights and indicator windows"):
+            show_rule_optimizer()
     with tab4:
         news_symbol = st.text_input("Enter company name or symbol for news", "Reliance", key="news_sym")
         if news_symbol:
@@ -2156,18 +3387,8 @@ if market_type == "Equity":
 else:
     derivatives_dashboard()
 
-
-
-
-
-
-
-
-
-
-
-
-
-
+if PERF_LAB:
+    with st.sidebar.expander("🧪 Performance lab"):
+        show_performance_lab()
 
 
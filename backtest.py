@@ -0,0 +1,596 @@
+"""Rule-strategy backtester and parameter optimizer for the app's rule model.
+
+The latest-bar rule signal, rule votes, the vectorised backtest and the
+optimizer kernels live here, away from Streamlit, so a spawn/forkserver
+process pool can import them in clean worker processes instead of forking
+the (multi-threaded) app server.
+"""
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from indicators import (OHLCV_FIELDS, compute_indicators, panel_macd, panel_rsi, panel_sma, panel_stochastic,
+                        required_history, rolling_std)
+
+
+# --- Rule Signal (the dashboard's weighted rules on the latest bar) ---
+# Points per rule; a bar's signal is whichever side scores more
+RULE_WEIGHTS = {"ma_cross": 25, "rsi": 20, "macd_cross": 20, "price_vs_ma": 10, "bollinger": 10, "stochastic": 5}
+
+
+def generate_rule_based_trading_signal(data, weights=None, sma_windows=(20, 50)):
+    """Generate trading signals using a weighted rule-based system.
+
+    ``sma_windows`` names the fast / slow averages (columns SMA_<n>) the crossover rules compare.
+    """
+    w = {**RULE_WEIGHTS, **(weights or {})}
+    fast, slow = sma_windows
+    fast_col, slow_col = f"SMA_{fast}", f"SMA_{slow}"
+
+    if data.empty or len(data) < 50:
+        return "HOLD", "Insufficient data for rule-based analysis.", 0.5
+
+    latest = data.iloc[-1]
+    
+    buy_score = 0
+    sell_score = 0
+    reasons = []
+
+    # 1. Moving Averages Crossover (25 points)
+    # Golden Cross (fast SMA crosses above slow SMA)
+    if latest.get(fast_col) > latest.get(slow_col) and data.iloc[-2].get(fast_col) <= data.iloc[-2].get(slow_col):
+        buy_score += w["ma_cross"]
+        reasons.append(f"Golden Cross (SMA {fast}/{slow})")
+    # Death Cross (fast SMA crosses below slow SMA)
+    if latest.get(fast_col) < latest.get(slow_col) and data.iloc[-2].get(fast_col) >= data.iloc[-2].get(slow_col):
+        sell_score += w["ma_cross"]
+        reasons.append(f"Death Cross (SMA {fast}/{slow})")
+
+    # 2. RSI (20 points)
+    rsi = latest.get('RSI', 50)
+    if rsi < 30 and latest['Close'] > latest.get('Low', latest['Close']):
+        buy_score += w["rsi"]
+        reasons.append(f"RSI oversold ({rsi:.2f})")
+    elif rsi > 70 and latest['Close'] < latest.get('High', latest['Close']):
+        sell_score += w["rsi"]
+        reasons.append(f"RSI overbought ({rsi:.2f})")
+
+    # 3. MACD Crossover (20 points)
+    if latest.get('MACD', 0) > latest.get('MACD_Signal', 0) and data.iloc[-2].get('MACD') <= data.iloc[-2].get('MACD_Signal'):
+        buy_score += w["macd_cross"]
+        reasons.append("MACD bullish crossover")
+    if latest.get('MACD', 0) < latest.get('MACD_Signal', 0) and data.iloc[-2].get('MACD') >= data.iloc[-2].get('MACD_Signal'):
+        sell_score += w["macd_cross"]
+        reasons.append("MACD bearish crossover")
+    
+    # 4. Price vs Moving Averages (10 points)
+    if latest['Close'] > latest.get(fast_col, latest['Close']) and latest['Close'] > latest.get(slow_col, latest['Close']):
+        buy_score += w["price_vs_ma"]
+        reasons.append("Price above key MAs")
+    elif latest['Close'] < latest.get(fast_col, latest['Close']) and latest['Close'] < latest.get(slow_col, latest['Close']):
+        sell_score += w["price_vs_ma"]
+        reasons.append("Price below key MAs")
+
+    # 5. Bollinger Bands (10 points)
+    if latest['Close'] < latest.get('BB_Lower', latest['Close']):
+        buy_score += w["bollinger"]
+        reasons.append("Price below Bollinger Lower Band")
+    elif latest['Close'] > latest.get('BB_Upper', latest['Close']):
+        sell_score += w["bollinger"]
+        reasons.append("Price above Bollinger Upper Band")
+
+    # 6. Stochastic Oscillator (5 points)
+    k_percent = latest.get('%K', 50)
+    d_percent = latest.get('%D', 50)
+    if k_percent < 20 and d_percent < 20 and latest['Close'] > latest['Low']:
+        buy_score += w["stochastic"]
+        reasons.append("Stochastic oversold")
+    elif k_percent > 80 and d_percent > 80 and latest['Close'] < latest['High']:
+        sell_score += w["stochastic"]
+        reasons.append("Stochastic overbought")
+
+    # Calculate final signal and confidence
+    total_score = buy_score + sell_score
+    if total_score == 0:
+        return "HOLD", "No clear signals detected.", 0.5
+    
+    if buy_score > sell_score:
+        signal = "BUY"
+        confidence = min(buy_score / total_score, 1.0)
+        reason = f"Bullish signals detected: {', '.join(reasons[:3])}"
+    elif sell_score > buy_score:
+        signal = "SELL"
+        confidence = min(sell_score / total_score, 1.0)
+        reason = f"Bearish signals detected: {', '.join(reasons[:3])}"
+    else: # Equal scores
+        signal = "HOLD"
+        confidence = 0.5
+        reason = "Mixed signals or weak consensus. Wait for a clearer trend."
+
+    return signal, reason, confidence
+
+
+# --- Rule Votes (vectorised twin of generate_rule_based_trading_signal) ---
+def _shift_down(values):
+    """values one bar later along axis 0, with NaN in the first row."""
+    return np.concatenate([np.full((1,) + values.shape[1:], np.nan), values[:-1]])
+
+
+def rule_votes(close, low, high, sma20, sma50, rsi, macd, macd_signal, bb_upper, bb_lower, k_percent, d_percent,
+               low_or_close=None, high_or_close=None):
+    """Which rules vote BUY and which vote SELL on every bar, before weighting.
+
+    Takes aligned 1-D series or dates × symbols panels and returns two boolean
+    arrays stacked in RULE_WEIGHTS order. ``low_or_close`` / ``high_or_close``
+    confirm the RSI rule and default to the low / high.
+    """
+    low_or_close = low if low_or_close is None else low_or_close
+    high_or_close = high if high_or_close is None else high_or_close
+    prev_sma20, prev_sma50 = _shift_down(sma20), _shift_down(sma50)
+    prev_macd, prev_macd_signal = _shift_down(macd), _shift_down(macd_signal)
+    rsi_buy = (rsi < 30) & (close > low_or_close)
+    above = (close > sma20) & (close > sma50)
+    below_band = close < bb_lower
+    stoch_buy = (k_percent < 20) & (d_percent < 20) & (close > low)
+    buy = [(sma20 > sma50) & (prev_sma20 <= prev_sma50),                      # golden cross
+           rsi_buy,                                                           # RSI oversold
+           (macd > macd_signal) & (prev_macd <= prev_macd_signal),            # MACD bullish cross
+           above,                                                             # price above both MAs
+           below_band,                                                        # below lower band
+           stoch_buy]                                                         # stochastic oversold
+    sell = [(sma20 < sma50) & (prev_sma20 >= prev_sma50),
+            ~rsi_buy & (rsi > 70) & (close < high_or_close),
+            (macd < macd_signal) & (prev_macd >= prev_macd_signal),
+            ~above & (close < sma20) & (close < sma50),
+            ~below_band & (close > bb_upper),
+            ~stoch_buy & (k_percent > 80) & (d_percent > 80) & (close < high)]
+    return np.stack(buy), np.stack(sell)
+
+
+def generate_rule_signal_series(data, weights=None, sma_windows=(20, 50)):
+    """Rule-based signal, scores and confidence for every bar, in one array pass.
+
+    Row i holds what generate_rule_based_trading_signal(data.iloc[:i + 1]) returns,
+    so the last row matches the scalar function. Rows with fewer than 50 bars of
+    history are HOLD at 0.5 with zero scores, like the scalar's insufficient-data case.
+    ``sma_windows`` picks the SMA_<fast> / SMA_<slow> columns the crossover rules read.
+    """
+    w = {**RULE_WEIGHTS, **(weights or {})}
+    n = len(data)
+    if n == 0:
+        return pd.DataFrame(columns=["Signal", "Buy_Score", "Sell_Score", "Score", "Confidence"])
+
+    def col(name, default=np.nan):
+        return data[name].to_numpy(dtype=float) if name in data.columns else np.full(n, default)
+
+    close, low, high = col('Close'), col('Low'), col('High')
+    fast, slow = sma_windows
+    buy_votes, sell_votes = rule_votes(
+        close, low, high, col(f'SMA_{fast}'), col(f'SMA_{slow}'), col('RSI', 50.0), col('MACD', 0.0), col('MACD_Signal', 0.0),
+        col('BB_Upper'), col('BB_Lower'), col('%K', 50.0), col('%D', 50.0),
+        low_or_close=low if 'Low' in data.columns else close,
+        high_or_close=high if 'High' in data.columns else close)
+    buy = np.zeros(n)
+    sell = np.zeros(n)
+    for i, rule in enumerate(RULE_WEIGHTS):
+        buy += w[rule] * buy_votes[i]
+        sell += w[rule] * sell_votes[i]
+
+    warm = np.arange(n) < 49
+    buy[warm] = 0
+    sell[warm] = 0
+    total = buy + sell
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence = np.where(buy > sell, np.minimum(buy / total, 1.0),
+                              np.where(sell > buy, np.minimum(sell / total, 1.0), 0.5))
+    signal = np.where(buy > sell, "BUY", np.where(sell > buy, "SELL", "HOLD"))
+    return pd.DataFrame({"Signal": signal, "Buy_Score": buy, "Sell_Score": sell,
+                         "Score": buy - sell, "Confidence": confidence}, index=data.index)
+
+
+# --- Rule-Strategy Backtester (vectorised over bars, process pool across symbols) ---
+# Indian equity delivery costs per side, in basis points of traded value
+BACKTEST_COSTS = {"brokerage_bps": 3.0, "stt_bps": 10.0, "slippage_bps": 5.0}
+BACKTEST_WORKERS = os.cpu_count() or 2
+BARS_PER_YEAR = 252
+RULE_INDICATORS = ("SMA_20", "SMA_50", "RSI", "MACD", "MACD_Signal", "BB_Upper", "BB_Lower", "%K", "%D")
+
+
+def _pool_context():
+    """forkserver where the platform has it, else spawn; never a fork of the threaded app server."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _collect(futures, results, errors):
+    """Fill results/errors from {index: future}; returns the indexes lost to a dead worker."""
+    lost = []
+    for i, future in futures.items():
+        try:
+            results[i] = future.result()
+        except BrokenProcessPool:
+            lost.append(i)
+        except Exception as exc:
+            errors[i] = f"{type(exc).__name__}: {exc}"
+    return lost
+
+
+def parallel_map(fn, items, workers=None):
+    """fn(item) for every item on a spawn/forkserver process pool, in item order.
+
+    Workers import ``fn`` from its module rather than inherit the caller's
+    memory, so it must be a module-level function of an importable module such
+    as this one. An item whose call raises is reported in ``errors`` instead of
+    failing the run. If the pool cannot start, or a worker dies, the unfinished
+    items run on threads. Returns (results, errors, "processes" | "threads"),
+    where results[i] is None for every i in errors.
+    """
+    items = list(items)
+    workers = max(1, min(workers or BACKTEST_WORKERS, len(items) or 1))
+    results, errors = [None] * len(items), {}
+    pending, mode = list(range(len(items))), "threads"
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                pending = _collect({i: pool.submit(fn, items[i]) for i in pending}, results, errors)
+            mode = "processes"
+        except (BrokenProcessPool, OSError):
+            pending = [i for i in pending if results[i] is None and i not in errors]
+    if pending:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            _collect({i: pool.submit(fn, items[i]) for i in pending}, results, errors)
+        mode = "threads"
+    return results, errors, mode
+
+
+def _equity_stats(growth):
+    """CAGR, annualised Sharpe (rf = 0) and max drawdown of a per-bar growth-factor array."""
+    equity = np.cumprod(growth)
+    returns = growth - 1
+    years = len(growth) / BARS_PER_YEAR
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    return {
+        "CAGR %": round(float(equity[-1] ** (1 / years) - 1) * 100, 2) if years and equity[-1] > 0 else np.nan,
+        "Sharpe": round(float(returns.mean() / std) * math.sqrt(BARS_PER_YEAR), 2) if std else np.nan,
+        "Max DD %": round(float((equity / np.maximum.accumulate(equity) - 1).min()) * 100, 2),
+        "Return %": round(float(equity[-1] - 1) * 100, 2),
+    }
+
+
+def backtest_rule_strategy(ohlcv, weights=None, costs=None):
+    """Long/flat backtest of the rule signal on one symbol's daily OHLCV.
+
+    The position decided at a bar's close (BUY → long, SELL → flat, HOLD → keep)
+    is filled at the next bar's open. Every change of position pays brokerage,
+    STT and slippage on the traded value. Returns (per-bar growth Series, stats dict).
+    """
+    costs = {**BACKTEST_COSTS, **(costs or {})}
+    analyzed = compute_indicators(ohlcv, RULE_INDICATORS).dropna()
+    if len(analyzed) < 2:
+        return pd.Series(dtype=float), {}
+    signals = generate_rule_signal_series(analyzed, weights)["Signal"].to_numpy()
+    target = pd.Series(np.where(signals == "BUY", 1.0, np.where(signals == "SELL", 0.0, np.nan))).ffill().fillna(0.0).to_numpy()
+    held = np.concatenate([[0.0], target[:-1]])           # position after each bar's open
+    held_overnight = np.concatenate([[0.0], held[:-1]])   # position carried into each bar's open
+
+    opens = analyzed["Open"].to_numpy(dtype=float)
+    closes = analyzed["Close"].to_numpy(dtype=float)
+    prev_close = np.concatenate([[opens[0]], closes[:-1]])
+    turnover = np.abs(held - held_overnight)
+    cost_rate = (costs["brokerage_bps"] + costs["stt_bps"] + costs["slippage_bps"]) / 1e4
+    growth = ((1 + held_overnight * (opens / prev_close - 1)) * (1 - turnover * cost_rate)
+              * (1 + held * (closes / opens - 1)))
+    stats = _equity_stats(growth)
+    stats.update({"Trades": int(turnover.sum()), "Exposure %": round(float(held.mean()) * 100, 1), "Bars": len(growth)})
+    return pd.Series(growth, index=analyzed.index), stats
+
+
+def _backtest_chunk(job):
+    """(results, failed) for one chunk: symbol -> (growth, stats), and symbol -> error text."""
+    frames, weights, costs = job
+    results, failed = {}, {}
+    for sym, frame in frames.items():
+        try:
+            results[sym] = backtest_rule_strategy(frame, weights, costs)
+        except Exception as exc:
+            failed[sym] = f"{type(exc).__name__}: {exc}"
+    return results, failed
+
+
+def backtest_panel(panel, weights=None, costs=None, workers=None):
+    """Backtest the rule strategy on every symbol of a (field, symbol) OHLCV panel.
+
+    Symbols are split into one chunk per worker and run in parallel. Returns
+    (per-symbol stats DataFrame, equal-weight portfolio equity Series, stats dict, mode).
+    The portfolio rebalances daily across the symbols with data on that bar.
+    Symbols whose backtest raised are left out of both and listed, with the
+    error, in the table's ``attrs["failed"]``.
+    """
+    symbols = list(panel["Close"].columns)
+    frames = {sym: panel.xs(sym, axis=1, level=1)[OHLCV_FIELDS].dropna(subset=["Close"]) for sym in symbols}
+    workers = max(1, min(workers or BACKTEST_WORKERS, len(symbols)))
+    chunks = [dict(list(frames.items())[i::workers]) for i in range(workers)]
+    outputs, errors, mode = parallel_map(_backtest_chunk, [(chunk, weights, costs) for chunk in chunks], workers)
+
+    per_symbol, growths, failed = {}, {}, {}
+    for i, output in enumerate(outputs):
+        if i in errors:
+            failed.update(dict.fromkeys(chunks[i], errors[i]))
+            continue
+        results, chunk_failed = output
+        failed.update(chunk_failed)
+        for sym, (growth, stats) in results.items():
+            if stats:
+                per_symbol[sym] = stats
+                growths[sym] = growth
+    if not growths:
+        table = pd.DataFrame()
+        table.attrs["failed"] = failed
+        return table, pd.Series(dtype=float), {}, mode
+    portfolio_growth = pd.DataFrame(growths).sort_index().mean(axis=1, skipna=True)
+    summary = _equity_stats(portfolio_growth.to_numpy())
+    table = pd.DataFrame.from_dict(per_symbol, orient="index").sort_values("CAGR %", ascending=False)
+    table.attrs["failed"] = failed
+    return table, portfolio_growth.cumprod(), summary, mode
+
+
+# --- Rule Parameter Optimizer (grid / random search, shared-memory panel) ---
+# Indicator windows the rules read; MACD 12/26/9 and Stochastic 14/3 stay fixed
+RULE_WINDOW_KEYS = ("rsi_period", "sma_fast", "sma_slow", "bb_window", "bb_std")
+DEFAULT_RULE_PARAMS = {"rsi_period": 14, "sma_fast": 20, "sma_slow": 50, "bb_window": 20, "bb_std": 2.0, **RULE_WEIGHTS}
+RULE_PARAM_SPACE = {
+    "rsi_period": (7, 14, 21),
+    "sma_fast": (10, 20, 50),
+    "sma_slow": (50, 100, 200),
+    "bb_window": (10, 20, 30),
+    "bb_std": (1.5, 2.0, 2.5),
+    **{rule: (0, 5, 10, 20, 30) for rule in RULE_WEIGHTS},
+}
+SHARED_PANEL_FIELDS = ("Open", "High", "Low", "Close")
+# Share of the most recent dates kept out of the search, and how many leaders are re-tested on them
+RULE_HOLDOUT_FRACTION = 0.3
+RULE_HOLDOUT_TOP = 20
+
+
+def rule_weights(params):
+    return {rule: params[rule] for rule in RULE_WEIGHTS}
+
+
+def rule_history_bars(params):
+    """Bars of history the rules need to give a signal with these windows."""
+    lookback = max(params["sma_slow"], params["sma_fast"], params["bb_window"], params["rsi_period"] + 1,
+                   required_history(("%D",)))
+    return lookback - 1 + 50
+
+
+def rule_feature_arrays(high, low, close, params, memo=None):
+    """Rule inputs for dates × symbols panels with the given windows.
+
+    "SMA_fast" / "SMA_slow" hold the two averages the crossover rules compare;
+    the other keys are the column names the rules read. Passing the same ``memo``
+    dict across calls on one panel reuses every indicator already computed.
+    """
+    memo = {} if memo is None else memo
+
+    def cached(key, fn, *args):
+        if key not in memo:
+            memo[key] = fn(*args)
+        return memo[key]
+
+    macd, macd_signal, _ = cached("macd", panel_macd, close)
+    pct_k, pct_d = cached("stochastic", panel_stochastic, high, low, close)
+    middle = cached(("sma", params["bb_window"]), panel_sma, close, params["bb_window"])
+    std = cached(("std", params["bb_window"]), rolling_std, close, params["bb_window"])
+    return {"SMA_fast": cached(("sma", params["sma_fast"]), panel_sma, close, params["sma_fast"]),
+            "SMA_slow": cached(("sma", params["sma_slow"]), panel_sma, close, params["sma_slow"]),
+            "RSI": cached(("rsi", params["rsi_period"]), panel_rsi, close, params["rsi_period"]),
+            "MACD": macd, "MACD_Signal": macd_signal,
+            "BB_Upper": middle + std * params["bb_std"], "BB_Lower": middle - std * params["bb_std"],
+            "%K": pct_k, "%D": pct_d}
+
+
+def rule_feature_frame(ohlcv, params):
+    """One symbol's OHLC plus rule inputs computed with tuned windows, warm-up rows dropped.
+
+    The averages are labelled by their windows (SMA_10, SMA_100, ...); pass
+    rule_sma_windows(params) to the signal functions so they read those columns.
+    """
+    frame = ohlcv[["Open", "High", "Low", "Close"]].astype(float)
+    arrays = {field: frame[field].to_numpy()[:, None] for field in ("High", "Low", "Close")}
+    features = rule_feature_arrays(arrays["High"], arrays["Low"], arrays["Close"], params)
+    labels = {"SMA_fast": f"SMA_{params['sma_fast']}", "SMA_slow": f"SMA_{params['sma_slow']}"}
+    features = {labels.get(name, name): values[:, 0] for name, values in features.items()}
+    return frame.assign(**features).dropna(subset=list(features))
+
+
+def rule_sma_windows(params):
+    return params["sma_fast"], params["sma_slow"]
+
+
+def rule_param_grid(space=None, n_random=None, seed=0):
+    """Parameter combinations to try: the full grid, or ``n_random`` distinct draws from it.
+
+    Combinations whose fast average is not shorter than the slow one are skipped.
+    """
+    space = {**{k: (v,) for k, v in DEFAULT_RULE_PARAMS.items()}, **(space or RULE_PARAM_SPACE)}
+    keys = list(space)
+    sizes = [len(space[k]) for k in keys]
+    total = math.prod(sizes)
+    if n_random is None or n_random >= total:
+        flat = range(total)
+    else:
+        rng = np.random.default_rng(seed)
+        flat = rng.choice(total, size=n_random, replace=False)
+    combos = []
+    for index in flat:
+        params = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            index, pos = divmod(int(index), size)
+            params[key] = space[key][pos]
+        if params["sma_fast"] < params["sma_slow"]:
+            combos.append({k: params[k] for k in keys})
+    return combos
+
+
+class SharedPanel:
+    """Open/High/Low/Close of a panel copied once into a named shared-memory block.
+
+    Workers attach by name and read the same pages instead of each receiving
+    a pickled copy of the panel. Use as a context manager; the block is
+    unlinked on exit.
+    """
+
+    def __init__(self, panel):
+        arrays = np.stack([panel[field].to_numpy(dtype=np.float64) for field in SHARED_PANEL_FIELDS])
+        self.shape = arrays.shape
+        self.symbols = list(panel["Close"].columns)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(arrays.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.float64, buffer=self._shm.buf)[:] = arrays
+        self.name = self._shm.name
+        self.nbytes = arrays.nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _attach_shared(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # 3.13+: the creator owns cleanup
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _evaluate_rule_params(ohlc, combos, cost_rate, score_from=0):
+    """Backtest metrics for each combination on a (field, dates, symbols) OHLC array.
+
+    Same fills and costs as backtest_rule_strategy, vectorised across symbols.
+    Indicators and rule votes are computed once per set of windows and reused
+    for every weighting that shares them. Metrics count only rows from
+    ``score_from`` on; earlier rows warm up the indicators and the position.
+    """
+    opens, highs, lows, closes = ohlc
+    prev_close = _shift_down(closes)
+    rows = []
+    memo = {}
+    by_windows = {}
+    for params in combos:
+        by_windows.setdefault(tuple(params[k] for k in RULE_WINDOW_KEYS), []).append(params)
+    for group in by_windows.values():
+        f = rule_feature_arrays(highs, lows, closes, group[0], memo)
+        valid = ~np.isnan(closes)
+        for values in f.values():
+            valid &= ~np.isnan(values)
+        seen = np.cumsum(valid, axis=0)
+        active = valid & (seen >= 50)
+        buy_votes, sell_votes = rule_votes(closes, lows, highs, f["SMA_fast"], f["SMA_slow"], f["RSI"], f["MACD"],
+                                           f["MACD_Signal"], f["BB_Upper"], f["BB_Lower"], f["%K"], f["%D"])
+        # BUY wins a bar when the weighted sum of (buy vote - sell vote) is positive
+        net_votes = buy_votes.astype(np.float64) - sell_votes
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gap = np.where(valid, opens / prev_close - 1, 0.0)
+            intraday = np.where(valid, closes / opens - 1, 0.0)
+        row_index = np.where(active, np.arange(len(closes))[:, None], -1)
+        scored = valid & (np.arange(len(closes)) >= score_from)[:, None]
+        bars_traded = scored.sum(axis=1)
+        traded = bars_traded > 0
+        n_symbols = max(int(scored.any(axis=0).sum()), 1)
+        for params in group:
+            score = np.tensordot([params[rule] for rule in RULE_WEIGHTS], net_votes, axes=1)
+            last = np.maximum.accumulate(np.where(score != 0, row_index, -1), axis=0)
+            target = (last >= 0) & np.take_along_axis(score > 0, np.maximum(last, 0), axis=0)
+            held = np.zeros(closes.shape)
+            held[1:] = target[:-1]
+            held_overnight = np.zeros(closes.shape)
+            held_overnight[1:] = held[:-1]
+            turnover = np.abs(held - held_overnight)
+            growth = (1 + held_overnight * gap) * (1 - turnover * cost_rate) * (1 + held * intraday)
+            portfolio = np.where(scored, growth, 0.0).sum(axis=1)[traded] / bars_traded[traded]
+            stats = _equity_stats(portfolio) if len(portfolio) > 1 else {}
+            stats.update({"Trades": round(float(turnover[scored].sum()) / n_symbols, 1),
+                          "Exposure %": round(float(held[scored].mean()) * 100, 1) if traded.any() else 0.0})
+            rows.append({**params, **stats})
+    return rows
+
+
+def _evaluate_shared_chunk(job):
+    name, shape, combos, cost_rate, score_from = job
+    shm = _attach_shared(name)
+    try:
+        return _evaluate_rule_params(np.ndarray(shape, dtype=np.float64, buffer=shm.buf), combos, cost_rate,
+                                     score_from)
+    finally:
+        shm.close()
+
+
+def optimize_rule_params(panel, combos=None, objective="Sharpe", costs=None, workers=None, score_from=0):
+    """Backtest every parameter combination on a (field, symbol) OHLCV panel and rank them.
+
+    The panel goes into shared memory once and combinations are split across
+    worker processes, keeping combinations with the same windows together.
+    Returns one row per combination, best ``objective`` first; combinations in
+    a chunk that raised are counted in ``attrs["failed_combinations"]``.
+    Metrics cover the rows from ``score_from`` on.
+    """
+    combos = rule_param_grid() if combos is None else combos
+    costs = {**BACKTEST_COSTS, **(costs or {})}
+    cost_rate = (costs["brokerage_bps"] + costs["stt_bps"] + costs["slippage_bps"]) / 1e4
+    groups = {}
+    for params in combos:
+        groups.setdefault(tuple(params[k] for k in RULE_WINDOW_KEYS), []).append(params)
+    workers = max(1, min(workers or BACKTEST_WORKERS, len(groups)))
+    chunks = [[p for group in list(groups.values())[i::workers] for p in group] for i in range(workers)]
+    start = time.perf_counter()
+    with SharedPanel(panel) as shared:
+        results, errors, mode = parallel_map(_evaluate_shared_chunk,
+                                             [(shared.name, shared.shape, chunk, cost_rate, score_from)
+                                              for chunk in chunks],
+                                             workers)
+    ranked = pd.DataFrame([row for rows in results if rows is not None for row in rows])
+    if objective in ranked.columns:
+        ranked = ranked.sort_values(objective, ascending=False, na_position="last").reset_index(drop=True)
+    ranked.attrs.update({"mode": mode, "workers": workers, "seconds": time.perf_counter() - start,
+                         "shared_mb": shared.nbytes / 1e6,
+                         "failed_combinations": sum(len(chunks[i]) for i in errors),
+                         "errors": sorted(set(errors.values()))})
+    return ranked
+
+
+def walk_forward_rank(panel, combos=None, holdout=RULE_HOLDOUT_FRACTION, top=RULE_HOLDOUT_TOP, objective="Sharpe",
+                      costs=None, workers=None):
+    """Rank combinations on the older bars, then re-test the leaders on the held-out recent bars.
+
+    The search sees only the first ``1 - holdout`` of the panel's dates. The
+    ``top`` best rows and the default parameters are then backtested over the
+    whole panel with metrics counted from the split on, so the held-out bars
+    never influence the ranking. Returns the training ranking with
+    "Hold-out <metric>" columns filled for those rows; ``attrs["holdout_default"]``
+    holds the defaults' hold-out metrics and ``attrs["split"]`` the first held-out date.
+    """
+    split = int(len(panel) * (1 - holdout))
+    ranked = optimize_rule_params(panel.iloc[:split], combos, objective, costs, workers)
+    if ranked.empty or split >= len(panel):
+        return ranked
+    leaders = [{k: ranked.at[i, k] for k in DEFAULT_RULE_PARAMS} for i in ranked.index[:top]]
+    tested = optimize_rule_params(panel, leaders + [dict(DEFAULT_RULE_PARAMS)], objective, costs, workers,
+                                  score_from=split)
+    keys = list(DEFAULT_RULE_PARAMS)
+    metrics = [m for m in ("CAGR %", "Sharpe", "Max DD %") if m in tested.columns]
+    held_out = tested.set_index(keys)[metrics].add_prefix("Hold-out ")
+    held_out = held_out[~held_out.index.duplicated()]
+    default_key = tuple(DEFAULT_RULE_PARAMS[k] for k in keys)
+    attrs = dict(ranked.attrs)
+    ranked = ranked.join(held_out, on=keys)
+    ranked.attrs.update(attrs, split=panel.index[split],
+                        holdout_default=held_out.loc[default_key].to_dict() if default_key in held_out.index else {})
+    return ranked
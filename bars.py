@@ -0,0 +1,165 @@
+"""Bar-data helpers shared by the app: the synthetic OHLCV generator, compact
+frame dtypes and the streaming intraday resampler.
+
+Everything here is plain NumPy/pandas with no Streamlit calls, so it can be
+imported by tests, benchmarks and offline scripts.
+"""
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from indicators import OHLCV_FIELDS
+
+NSE_SESSION_MINUTES = 375   # 09:15–15:30 IST
+NSE_SESSION_OPEN = pd.Timedelta(hours=9, minutes=15)
+
+
+# --- Synthetic Price Generator (demo data, Finnhub fallback & load tests) ---
+def _symbol_seed(symbol):
+    """Stable per-symbol seed — Python's hash() is salted per process."""
+    return zlib.crc32(symbol.encode())
+
+
+def generate_synthetic_ohlcv(symbols, n_bars, end=None, freq="B", seed=None, drift=0.0005, volatility=0.02,
+                             gap=0.02, wick=0.05, start_price=None, last_price=None):
+    """Vectorised random-walk OHLCV panel for many symbols at once.
+
+    Closes are geometric random walks built with a single cumulative product over a
+    (bars × symbols) return matrix drawn from a numpy Generator; open, high, low and
+    volume are drawn as whole matrices too. Output has (field, symbol) columns like
+    fetch_universe_ohlcv. The walk starts at start_price (default: a per-symbol
+    level in 100–1100) or, if last_price is given, is scaled to end there.
+    """
+    symbols = list(symbols)
+    n = len(symbols)
+    rng = np.random.default_rng(seed if seed is not None else [_symbol_seed(s) for s in symbols])
+
+    returns = rng.normal(drift, volatility, size=(n_bars, n))
+    returns[0] = 0.0
+    close = np.cumprod(1.0 + returns, axis=0)
+    if last_price is not None:
+        close *= np.asarray(last_price, dtype=float) / close[-1]
+    else:
+        close *= start_price if start_price is not None else 100 + np.array([_symbol_seed(s) % 1000 for s in symbols])
+    # Fill one preallocated block in OHLCV_FIELDS order so the frame wraps it without copying
+    out = np.empty((n_bars, 5 * n))
+    open_, high, low, close_out, volume = (out[:, i * n:(i + 1) * n] for i in range(5))
+    np.multiply(close, rng.uniform(1 - gap, 1 + gap, size=close.shape), out=open_)
+    np.multiply(np.maximum(open_, close), rng.uniform(1.0, 1 + wick, size=close.shape), out=high)
+    np.multiply(np.minimum(open_, close), rng.uniform(1 - wick, 1.0, size=close.shape), out=low)
+    close_out[:] = close
+    volume[:] = rng.integers(1_000_000, 10_000_000, size=close.shape)
+
+    index = pd.date_range(end=pd.Timestamp(end or datetime.now()).normalize(), periods=n_bars, freq=freq, name="Date")
+    columns = pd.MultiIndex.from_product([OHLCV_FIELDS, symbols])
+    return pd.DataFrame(out, index=index, columns=columns, copy=False)
+
+
+# --- Compact Frames (float32 prices, narrow integer volumes) ---
+def _narrow_volume(values):
+    """int32 when every volume fits, uint64 otherwise; None if the column has gaps or fractions."""
+    if values.isna().any() or not np.all(np.mod(values.to_numpy(dtype=float), 1) == 0):
+        return None
+    int32 = np.iinfo(np.int32)
+    if int32.min <= values.min() and values.max() <= int32.max:
+        return np.int32
+    return np.uint64 if values.min() >= 0 else None
+
+
+def compact_frame(frame):
+    """float32 prices/indicators and the narrowest safe integer dtype for Volume.
+
+    Works on single-symbol frames and on (field, symbol) panels. Indicator maths
+    still runs in float64 on the result; only what is held in memory shrinks.
+    """
+    if frame is None or frame.empty:
+        return frame
+    dtypes = {}
+    for col in frame.columns:
+        field = col[0] if isinstance(col, tuple) else col
+        values = frame[col]
+        if field == "Volume":
+            narrow = _narrow_volume(values)
+            if narrow is not None:
+                dtypes[col] = narrow
+        elif pd.api.types.is_float_dtype(values.dtype):
+            dtypes[col] = np.float32
+    return frame.astype(dtypes) if dtypes else frame
+
+
+def frame_memory_kb(frame):
+    return round(frame.memory_usage(deep=True).sum() / 1024, 1) if frame is not None else 0.0
+
+
+# --- Streaming Resampler (base bars or ticks -> NSE-aligned intraday bars) ---
+class StreamingResampler:
+    """Rolls base bars (or ticks) up into ``minutes``-long bars aligned to the 09:15 NSE open.
+
+    Finished bars are frozen as soon as a base bar lands in a later bucket, so
+    each update is O(1); only the still-forming bar is re-aggregated, from the
+    base bars it holds. Feeding the latest base bar again (same timestamp)
+    replaces it, which is how a refetched, still-forming minute is revised.
+    """
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self._step = pd.Timedelta(minutes=minutes)
+        self._closed = []      # (label, open, high, low, close, volume)
+        self._bucket = None    # label of the forming bar
+        self._parts = []       # base bars inside the forming bar
+        self.last_ts = None
+
+    def bucket_of(self, ts):
+        session_open = ts.normalize() + NSE_SESSION_OPEN
+        return session_open + self._step * max((ts - session_open) // self._step, 0)
+
+    def update(self, ts, open_, high, low, close, volume=0.0, revise=True):
+        if self.last_ts is not None and ts < self.last_ts:
+            return   # already rolled into a bar
+        bucket = self.bucket_of(ts)
+        if bucket != self._bucket:
+            if self._bucket is not None:
+                self._closed.append(self._aggregate())
+            self._bucket, self._parts = bucket, []
+        elif revise and ts == self.last_ts:
+            self._parts.pop()
+        self._parts.append((open_, high, low, close, volume))
+        self.last_ts = ts
+
+    def add_tick(self, ts, price, volume=0.0):
+        """Fold one trade into the forming bar; ticks sharing a timestamp all count."""
+        self.update(ts, price, price, price, price, volume, revise=False)
+
+    def _aggregate(self):
+        parts = self._parts
+        return (self._bucket, parts[0][0], max(p[1] for p in parts), min(p[2] for p in parts), parts[-1][3],
+                sum(p[4] for p in parts if p[4] == p[4]))   # NaN volumes count as zero
+
+    def extend(self, frame):
+        """Feed the rows of a base-bar frame that are new since the last call.
+
+        The last bar already seen is fed again, as a refetch may have revised it.
+        Returns False if ``frame`` no longer contains that bar although it covers
+        its time (the base history changed); the caller should start a new resampler.
+        """
+        if self.last_ts is not None:
+            if len(frame) and frame.index[0] <= self.last_ts and self.last_ts not in frame.index:
+                return False
+            frame = frame[frame.index >= self.last_ts]
+        elif len(frame):
+            # Start on a bucket boundary so the first bar is not a partial one
+            first_bucket = self.bucket_of(frame.index[0])
+            if first_bucket != frame.index[0]:
+                frame = frame[frame.index >= first_bucket + self._step]
+        for ts, values in zip(frame.index, frame[OHLCV_FIELDS].itertuples(index=False, name=None)):
+            self.update(ts, *values)
+        return True
+
+    def __len__(self):
+        return len(self._closed) + bool(self._parts)
+
+    def to_frame(self):
+        rows = self._closed + ([self._aggregate()] if self._parts else [])
+        return pd.DataFrame(rows, columns=["Date"] + OHLCV_FIELDS).set_index("Date")
@@ -0,0 +1,409 @@
+"""Performance lab: benchmarks for the app's data, indicator, AI and backtest paths.
+
+Everything runs on synthetic bars and mock providers, so no network or API keys
+are needed. The app only imports ``show_performance_lab`` (shown in the sidebar
+when ``PERF_LAB`` is set); the benchmark functions can also be called directly
+from a shell or notebook.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from concurrent.futures import wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+
+from bars import (NSE_SESSION_MINUTES, NSE_SESSION_OPEN, StreamingResampler, compact_frame, frame_memory_kb,
+                  generate_synthetic_ohlcv)
+from backtest import (BACKTEST_WORKERS, BARS_PER_YEAR, DEFAULT_RULE_PARAMS, RULE_WINDOW_KEYS, backtest_panel,
+                      generate_rule_based_trading_signal, generate_rule_signal_series, optimize_rule_params,
+                      rule_param_grid)
+from indicators import (OHLCV_FIELDS, PUBLIC_INDICATORS, compute_indicators, required_history, rolling_max,
+                        rolling_min, rolling_std, universe_indicator_snapshot)
+from llm import LLMFanout, score_batched
+from prompts import (BATCH_MAX_SYMBOLS, PROMPT_STYLES, MockBatchProvider, compile_prompt, feature_snapshot,
+                     universe_snapshots)
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401 — HTTP/2 support for httpx, reported by the client-reuse benchmark
+    HTTP2_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# --- Baselines ---
+def _screener_metrics_loop(close_panel):
+    """The original one-symbol-at-a-time screener maths, kept as the benchmark baseline."""
+    rows = {}
+    for sym in close_panel.columns:
+        close = close_panel[sym].dropna()
+        if len(close) < 50:
+            continue
+        delta = close.diff()
+        gain = delta.where(delta > 0, 0).rolling(14).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+        rs = gain / loss
+        rows[sym] = {"RSI": (100 - (100 / (1 + rs))).iloc[-1],
+                     "SMA_20": close.rolling(20).mean().iloc[-1],
+                     "SMA_50": close.rolling(50).mean().iloc[-1]}
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+# --- Benchmarks ---
+def benchmark_compact_mode(n_symbols=200, n_bars=330):
+    """Memory of float64 vs compact history + indicator frames, and rule-signal agreement.
+
+    330 bars is about the dashboard's history window (six months charted, SMA 200 warmed up).
+    """
+    symbols = [f"SYM{i}" for i in range(n_symbols)]
+    panel = generate_synthetic_ohlcv(symbols, n_bars, seed=5)
+    wide = {"history": 0, "indicators": 0}
+    narrow = {"history": 0, "indicators": 0}
+    changed = []
+    for sym in symbols:
+        hist = panel.xs(sym, axis=1, level=1)[OHLCV_FIELDS]
+        hist = hist.astype({"Volume": np.int64})
+        small = compact_frame(hist)
+        full_ind = compute_indicators(hist, PUBLIC_INDICATORS).dropna()
+        small_ind = compute_indicators(small, PUBLIC_INDICATORS).dropna()
+        wide["history"] += frame_memory_kb(hist)
+        wide["indicators"] += frame_memory_kb(full_ind)
+        narrow["history"] += frame_memory_kb(small)
+        narrow["indicators"] += frame_memory_kb(compact_frame(small_ind))
+        if generate_rule_based_trading_signal(full_ind)[0] != generate_rule_based_trading_signal(small_ind)[0]:
+            changed.append(sym)
+    before, after = sum(wide.values()), sum(narrow.values())
+    return {"symbols": n_symbols, "bars": n_bars,
+            "history KB (float64 → compact)": f"{wide['history']:.0f} → {narrow['history']:.0f}",
+            "indicators KB (float64 → compact)": f"{wide['indicators']:.0f} → {narrow['indicators']:.0f}",
+            "saved": f"{(1 - after / before) * 100:.0f}%",
+            "rule signals changed": f"{len(changed)} / {n_symbols}" + (f" ({', '.join(changed[:5])})" if changed else "")}
+
+
+def benchmark_resampler(n_sessions=20, timeframe_minutes=15):
+    """Minute bars fed one at a time vs pandas resample of the whole history per new bar."""
+    days = pd.bdate_range(end="2026-01-30", periods=n_sessions)
+    index = pd.DatetimeIndex([d + NSE_SESSION_OPEN + pd.Timedelta(minutes=m)
+                              for d in days for m in range(NSE_SESSION_MINUTES)])
+    minutes = generate_synthetic_ohlcv(["SYM"], len(index), seed=31).xs("SYM", axis=1, level=1)
+    minutes.index = index
+    resampler = StreamingResampler(timeframe_minutes)
+    start = time.perf_counter()
+    for ts, values in zip(minutes.index, minutes[OHLCV_FIELDS].itertuples(index=False, name=None)):
+        resampler.update(ts, *values)
+    stream_us = (time.perf_counter() - start) / len(minutes) * 1e6
+    streamed = resampler.to_frame()
+
+    rule = f"{timeframe_minutes}min"
+    agg = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+    reference = pd.concat([day.resample(rule, origin=day.index[0]).agg(agg)
+                           for _, day in minutes.groupby(minutes.index.normalize())])
+    sample = minutes.iloc[-200:]
+    start = time.perf_counter()
+    for i in range(len(sample)):
+        minutes.iloc[:len(minutes) - len(sample) + i + 1].resample(rule).agg(agg)
+    pandas_us = (time.perf_counter() - start) / len(sample) * 1e6
+    return {"minute bars": len(minutes), f"{timeframe_minutes}m bars": len(streamed),
+            "stream µs / bar": round(stream_us, 2), "pandas full resample µs / bar": round(pandas_us),
+            "max diff vs pandas": float((streamed - reference.loc[streamed.index]).abs().max().max()),
+            "bars equal": streamed.index.equals(reference.index)}
+
+
+def benchmark_panel_kernels(n_symbols=2000, n_bars=250):
+    """Screener maths for n_symbols: per-symbol pandas loop vs one panel-kernel call."""
+    panel = generate_synthetic_ohlcv([f"SYM{i}" for i in range(n_symbols)], n_bars, seed=7)
+    start = time.perf_counter()
+    baseline = _screener_metrics_loop(panel["Close"])
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    snapshot = universe_indicator_snapshot(panel)
+    panel_s = time.perf_counter() - start
+    drift = (snapshot.loc[baseline.index, baseline.columns] - baseline).abs().max().max()
+    return {"symbols": n_symbols, "bars": n_bars, "loop_ms (RSI+SMA)": round(loop_s * 1000, 1),
+            "panel_ms (all indicators)": round(panel_s * 1000, 1), "speedup": f"{loop_s / panel_s:.1f}x",
+            "max_abs_diff": f"{drift:.2e}"}
+
+
+def benchmark_rolling_kernels(n_rows=1_000_000, n_symbols=500):
+    """Throughput and accuracy of rolling_min/max/std against pandas on a long series.
+
+    Also times the 2-D path on an (n_rows / n_symbols) × n_symbols panel. Errors are
+    measured against pandas and, for std, against an exact per-window np.std.
+    """
+    rng = np.random.default_rng(11)
+    series = 1000 + np.cumsum(rng.normal(0, 1, n_rows))
+    pd_series = pd.Series(series)
+    report = {"rows": n_rows}
+    for name, kernel, reference in (
+            ("min_14", lambda: rolling_min(series, 14), lambda: pd_series.rolling(14).min()),
+            ("max_14", lambda: rolling_max(series, 14), lambda: pd_series.rolling(14).max()),
+            ("std_20", lambda: rolling_std(series, 20), lambda: pd_series.rolling(20).std())):
+        start = time.perf_counter()
+        ours = kernel()
+        ours_s = time.perf_counter() - start
+        start = time.perf_counter()
+        theirs = reference().to_numpy()
+        theirs_s = time.perf_counter() - start
+        report[f"{name} ms (kernel / pandas)"] = f"{ours_s * 1000:.1f} / {theirs_s * 1000:.1f}"
+        report[f"{name} max diff vs pandas"] = f"{np.nanmax(np.abs(ours - theirs)):.2e}"
+        report[f"{name} NaN mask equal"] = bool(np.array_equal(np.isnan(ours), np.isnan(theirs)))
+    exact = np.full(n_rows, np.nan)
+    exact[19:] = np.lib.stride_tricks.sliding_window_view(series, 20).std(axis=-1, ddof=1)
+    report["std_20 max err vs exact (kernel / pandas)"] = (
+        f"{np.nanmax(np.abs(rolling_std(series, 20) - exact)):.2e} / "
+        f"{np.nanmax(np.abs(pd_series.rolling(20).std().to_numpy() - exact)):.2e}")
+    panel = series[: n_rows - n_rows % n_symbols].reshape(n_symbols, -1).T.copy()
+    start = time.perf_counter()
+    rolling_std(panel, 20), rolling_min(panel, 14), rolling_max(panel, 14)
+    report[f"panel {panel.shape[0]}×{n_symbols} ms (all three)"] = round((time.perf_counter() - start) * 1000, 1)
+    return report
+
+
+def benchmark_signal_series(n_bars=5000):
+    """Whole-history rule signals over n_bars (5000 ≈ 20 years): series vs the scalar per bar."""
+    hist = generate_synthetic_ohlcv(["SYM"], n_bars + required_history(PUBLIC_INDICATORS), seed=17).xs("SYM", axis=1, level=1)
+    analyzed = compute_indicators(hist, PUBLIC_INDICATORS).dropna()
+    start = time.perf_counter()
+    series = generate_rule_signal_series(analyzed)
+    series_s = time.perf_counter() - start
+    start = time.perf_counter()
+    scalar = [generate_rule_based_trading_signal(analyzed.iloc[:i + 1]) for i in range(len(analyzed))]
+    scalar_s = time.perf_counter() - start
+    mismatches = sum(sig != row.Signal or conf != row.Confidence
+                     for (sig, _, conf), row in zip(scalar, series.itertuples()))
+    counts = series["Signal"].value_counts()
+    return {"bars": len(analyzed), "series_ms": round(series_s * 1000, 2), "scalar_loop_ms": round(scalar_s * 1000, 1),
+            "speedup": f"{scalar_s / series_s:.0f}x", "mismatches vs scalar": mismatches,
+            "BUY / SELL / HOLD": f"{counts.get('BUY', 0)} / {counts.get('SELL', 0)} / {counts.get('HOLD', 0)}"}
+
+
+def benchmark_snapshot_keys(n_rows=250, reruns=20):
+    """st.cache_data lookups for one analysis (three providers): indicator frame vs feature snapshot.
+
+    Each rerun revises one old row (as a refetch with a split or late print
+    would) but keeps the latest bar, so every prompt is identical.
+    """
+    @st.cache_data(ttl=60, show_spinner=False)
+    def probe(provider, symbol, current_price, features):
+        return provider
+
+    hist = generate_synthetic_ohlcv(["SYM"], n_rows + required_history(PUBLIC_INDICATORS), seed=37).xs("SYM", axis=1, level=1)
+    analyzed = compute_indicators(hist, PUBLIC_INDICATORS).dropna()
+    frame_keys, snapshot_keys = set(), set()
+    frame_s = snapshot_s = 0.0
+    for i in range(reruns):
+        revised = analyzed.copy()
+        revised.iloc[i % (len(revised) - 1), revised.columns.get_loc("Volume")] += 1
+        start = time.perf_counter()
+        for provider in ("gemini", "grok", "groq"):
+            probe(provider, "SYM", 100.0, revised)
+        frame_s += time.perf_counter() - start
+        frame_keys.add(hashlib.sha256(pickle.dumps(revised)).hexdigest())
+        start = time.perf_counter()
+        snapshot = feature_snapshot(revised)
+        for provider in ("gemini", "grok", "groq"):
+            probe(provider, "SYM", 100.0, snapshot)
+        snapshot_s += time.perf_counter() - start
+        snapshot_keys.add(snapshot)
+    probe.clear()
+    return {"rows": len(analyzed), "reruns": reruns,
+            "frame keys ms": round(frame_s / reruns * 1000, 2), "snapshot keys ms": round(snapshot_s / reruns * 1000, 2),
+            "key bytes (frame / snapshot)": f"{len(pickle.dumps(analyzed)):,} / {len(pickle.dumps(snapshot))}",
+            "cache hits (frame / snapshot)": f"{reruns - len(frame_keys)} / {reruns - len(snapshot_keys)}"}
+
+
+def benchmark_prompt_compiler(n_cases=20):
+    """Compiled prompts for every provider: tokens, compile time and budget trimming."""
+    entries = universe_snapshots(generate_synthetic_ohlcv([f"SYM{i:02d}" for i in range(n_cases)], 150, seed=43))
+    cases = [(symbol, dict(snapshot)["Close"], snapshot) for symbol, snapshot in entries]
+    start = time.perf_counter()
+    compiled = [compile_prompt(provider, *case) for case in cases for provider in PROMPT_STYLES]
+    compile_us = (time.perf_counter() - start) / len(compiled) * 1e6
+    tight = [compile_prompt("groq", *case, budget=60) for case in cases]
+    result = {"cases": len(cases), "compile µs / prompt": round(compile_us, 1),
+              "over default budget": sum(prompt["over_budget"] for prompt in compiled),
+              "budget 60 (groq): tokens / dropped": f"{max(p['tokens'] for p in tight)} / {', '.join(tight[0]['dropped'])}"}
+    for provider in PROMPT_STYLES:
+        tokens = [prompt["tokens"] for prompt in compiled if prompt["provider"] == provider]
+        result[f"{provider}: mean tokens"] = round(sum(tokens) / len(tokens), 1)
+    return result
+
+
+def benchmark_llm_client_reuse(n_calls=40):
+    """Per-call client construction vs one persistent client, against a local keep-alive HTTP server.
+
+    Plain HTTP on loopback, so this measures client setup plus the TCP connect only;
+    over the internet each avoided connection also skips a TLS handshake and a round trip.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        wbufsize = 64 * 1024   # headers and body leave in one segment
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"signal": "HOLD", "reason": "ok", "confidence": 0.5}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    payload = {"messages": [{"role": "user", "content": "ping"}]}
+    if HTTPX_AVAILABLE:
+        kind, new_client = "httpx", lambda: httpx.Client(timeout=5)
+    else:
+        kind, new_client = "requests", requests.Session
+    try:
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            with new_client() as client:
+                client.post(url, json=payload)
+        fresh_ms = (time.perf_counter() - start) / n_calls * 1000
+        with new_client() as client:
+            client.post(url, json=payload)   # open the connection once
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                client.post(url, json=payload)
+            pooled_ms = (time.perf_counter() - start) / n_calls * 1000
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {"client": kind, "calls": n_calls, "new client per call ms": round(fresh_ms, 2),
+            "persistent client ms": round(pooled_ms, 2), "saved per call ms": round(fresh_ms - pooled_ms, 2),
+            "HTTP/2 for providers": HTTP2_AVAILABLE}
+
+
+def benchmark_llm_fanout(latencies=(1.5, 0.8, 2.5), deadline_s=2.0):
+    """Sequential vs concurrent provider calls, with sleeps standing in for the LLM round trips."""
+    def recommend(seconds):
+        time.sleep(seconds)
+        return "HOLD", f"simulated {seconds}s", 0.5
+
+    start = time.perf_counter()
+    for seconds in latencies:
+        recommend(seconds)
+    sequential_s = time.perf_counter() - start
+    fanout = LLMFanout(max_workers=len(latencies))
+    start = time.perf_counter()
+    futures = [fanout.submit(("bench", i), recommend, seconds) for i, seconds in enumerate(latencies)]
+    done, pending = wait(futures, timeout=deadline_s)
+    fanout_s = time.perf_counter() - start
+    return {"provider latencies s": ", ".join(map(str, latencies)), "deadline s": deadline_s,
+            "sequential s": round(sequential_s, 2), "fan-out s": round(fanout_s, 2),
+            "answered / pending": f"{len(done)} / {len(pending)}"}
+
+
+def benchmark_batch_scoring(n_symbols=50, latency_s=0.3, corrupt_rate=0.1):
+    """Nifty-50-sized universe against the mock provider: one request per symbol vs chunked batches.
+
+    Both go through one fan-out pool, so the per-symbol run already gets the
+    pool's concurrency; what batching saves beyond that is requests and tokens.
+    """
+    panel = generate_synthetic_ohlcv([f"SYM{i:02d}" for i in range(n_symbols)], 150, seed=41)
+    entries = universe_snapshots(panel)
+    expected = {symbol: MockBatchProvider.answer(dict((name, str(value)) for name, value in snapshot))[0]
+                for symbol, snapshot in entries}
+
+    fanout = LLMFanout()
+    runs = {}
+    for label, max_symbols in (("per symbol", 1), ("batched", BATCH_MAX_SYMBOLS)):
+        mock = MockBatchProvider(latency_s=latency_s, corrupt_rate=corrupt_rate, seed=7)
+        start = time.perf_counter()
+        results, stats = score_batched(list(entries), mock, 8192, fanout, max_symbols=max_symbols)
+        runs[label] = (time.perf_counter() - start, results, stats)
+
+    row = {"symbols": len(entries), "mock latency s": latency_s, "corrupted items": f"{corrupt_rate:.0%}"}
+    for label, (seconds, results, stats) in runs.items():
+        agree = sum(results.get(symbol, ("",))[0] == signal for symbol, signal in expected.items())
+        row[f"{label}: requests / prompt tokens"] = f"{stats['requests']} / {stats['prompt tokens']:,}"
+        row[f"{label}: wall s"] = round(seconds, 2)
+        row[f"{label}: scored / correct"] = f"{len(results)} / {agree}"
+    row["batched: re-asked"] = runs["batched"][2]["re-asked"]
+    return row
+
+
+def benchmark_synthetic_generator(n_symbols=2000, n_bars=5000):
+    """Time generate_synthetic_ohlcv for an n_symbols × n_bars panel (5000 bars ≈ 20 years)."""
+    start = time.perf_counter()
+    panel = generate_synthetic_ohlcv([f"SYM{i}" for i in range(n_symbols)], n_bars, seed=42)
+    elapsed = time.perf_counter() - start
+    return {"symbols": n_symbols, "bars": n_bars, "ms": round(elapsed * 1000, 1),
+            "bars_per_s": int(n_symbols * n_bars / elapsed), "panel_mb": round(panel.values.nbytes / 1e6, 1)}
+
+
+def benchmark_backtest(n_symbols=500, years=10, workers=None):
+    """Nifty-500-sized backtest on synthetic bars: wall time on the pool vs one worker."""
+    panel = generate_synthetic_ohlcv([f"SYM{i}" for i in range(n_symbols)], years * BARS_PER_YEAR, seed=23)
+    start = time.perf_counter()
+    table, _, summary, mode = backtest_panel(panel, workers=workers)
+    pool_s = time.perf_counter() - start
+    sample = panel.loc[:, (slice(None), [f"SYM{i}" for i in range(min(50, n_symbols))])]
+    start = time.perf_counter()
+    backtest_panel(sample, workers=1)
+    serial_per_symbol = (time.perf_counter() - start) / min(50, n_symbols)
+    return {"symbols": n_symbols, "bars": years * BARS_PER_YEAR, "mode": mode,
+            "workers": min(workers or BACKTEST_WORKERS, n_symbols), "wall_s": round(pool_s, 2),
+            "serial_s (extrapolated)": round(serial_per_symbol * n_symbols, 2),
+            "portfolio CAGR % / Sharpe / MaxDD %": f"{summary['CAGR %']} / {summary['Sharpe']} / {summary['Max DD %']}",
+            "avg trades per symbol": round(float(table["Trades"].mean()), 1)}
+
+
+def benchmark_rule_optimizer(n_symbols=50, years=10, n_combos=1000, workers=None):
+    """Random search on synthetic bars, plus a check that default parameters reproduce backtest_panel."""
+    panel = generate_synthetic_ohlcv([f"SYM{i}" for i in range(n_symbols)], years * BARS_PER_YEAR, seed=29)
+    ranked = optimize_rule_params(panel, rule_param_grid(n_random=n_combos, seed=1), workers=workers)
+    default = optimize_rule_params(panel, [dict(DEFAULT_RULE_PARAMS)], workers=1).iloc[0]
+    _, _, summary, _ = backtest_panel(panel, workers=workers)
+    best = ranked.iloc[0]
+    return {"symbols × bars": f"{n_symbols} × {years * BARS_PER_YEAR}", "combinations": len(ranked),
+            "mode": ranked.attrs["mode"], "workers": ranked.attrs["workers"],
+            "shared panel MB": round(ranked.attrs["shared_mb"], 1), "wall_s": round(ranked.attrs["seconds"], 2),
+            "combinations / s": round(len(ranked) / ranked.attrs["seconds"]),
+            "best Sharpe (default params)": f"{best['Sharpe']} ({default['Sharpe']})",
+            "default params vs backtest_panel Sharpe": f"{default['Sharpe']} vs {summary['Sharpe']}",
+            "best windows": ", ".join(f"{k}={best[k]:g}" for k in RULE_WINDOW_KEYS)}
+
+
+# --- Lab UI ---
+PERF_BENCHMARKS = {
+    "Synthetic OHLCV — 2,000 symbols × 20 years": lambda: benchmark_synthetic_generator(2000, 5000),
+    "Screener indicators — 2,000 symbols, loop vs panel": lambda: benchmark_panel_kernels(2000, 250),
+    "Rolling min/max/std kernels — 1M rows": lambda: benchmark_rolling_kernels(1_000_000),
+    "Compact frames — memory & signal check, 200 symbols": lambda: benchmark_compact_mode(200),
+    "Rule signal series — 20 years, series vs scalar": lambda: benchmark_signal_series(5000),
+    "Intraday resampler — 20 sessions of 1m → 15m": lambda: benchmark_resampler(20, 15),
+    "AI fan-out — simulated providers": lambda: benchmark_llm_fanout(),
+    "AI client reuse — local keep-alive server": lambda: benchmark_llm_client_reuse(),
+    "AI cache keys — indicator frame vs feature snapshot": lambda: benchmark_snapshot_keys(),
+    "Batched AI scoring — 50 symbols, mock provider": lambda: benchmark_batch_scoring(),
+    "Prompt compiler — tokens & budget trimming": lambda: benchmark_prompt_compiler(),
+    "Backtest — 500 symbols × 10 years": lambda: benchmark_backtest(500, 10),
+    "Rule optimizer — 1,000 combinations": lambda: benchmark_rule_optimizer(50, 10, 1000),
+}
+
+
+def show_performance_lab():
+    """Benchmark picker and result table for the app's sidebar lab."""
+    choice = st.selectbox("Benchmark", list(PERF_BENCHMARKS), key="perf_lab_choice")
+    if st.button("▶️ Run", key="perf_lab_run", use_container_width=True):
+        with st.spinner("Running benchmark..."):
+            result = PERF_BENCHMARKS[choice]()
+        st.dataframe(pd.DataFrame({"Metric": list(result), "Result": [str(v) for v in result.values()]}),
+                     use_container_width=True, hide_index=True)
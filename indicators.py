@@ -0,0 +1,720 @@
+"""Indicator maths shared by the app: the indicator registry, the streaming
+per-bar engine and the NumPy panel kernels.
+
+Everything here is plain NumPy/pandas with no Streamlit calls, so it can be
+imported by tests, offline scripts and worker processes.
+"""
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+OHLCV_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+# --- Indicator Registry (declared inputs, lookback and dependencies) ---
+INDICATOR_REGISTRY = {}
+
+
+def register_indicator(name, inputs=("Close",), lookback=1, deps=(), warmup=0):
+    """Register ``fn(df) -> Series`` as the producer of column ``name``.
+
+    ``lookback`` is the number of rows one value reads from its inputs/deps and
+    ``warmup`` the extra rows a recursive indicator (EMA) needs before its value
+    no longer depends on where the data starts. Dependencies must already be
+    registered, so registry order is a valid computation order. Names starting
+    with "_" are intermediates and are dropped from results.
+    """
+    missing = [dep for dep in deps if dep not in INDICATOR_REGISTRY]
+    if missing:
+        raise ValueError(f"{name} depends on unregistered indicators: {', '.join(missing)}")
+
+    def decorator(fn):
+        INDICATOR_REGISTRY[name] = {"fn": fn, "inputs": tuple(inputs), "lookback": lookback,
+                                    "deps": tuple(deps), "warmup": warmup}
+        return fn
+    return decorator
+
+
+def _ema_warmup(span, tolerance=1e-3):
+    """Bars after which the seed's weight in an adjust=False EMA drops below ``tolerance``."""
+    return math.ceil(math.log(tolerance) / math.log(1 - 2 / (span + 1)))
+
+
+@register_indicator("SMA_20", lookback=20)
+def _sma_20(df):
+    return df['Close'].rolling(window=20).mean()
+
+
+@register_indicator("SMA_50", lookback=50)
+def _sma_50(df):
+    return df['Close'].rolling(window=50).mean()
+
+
+@register_indicator("SMA_200", lookback=200)
+def _sma_200(df):
+    return df['Close'].rolling(window=200).mean()
+
+
+@register_indicator("EMA_12", warmup=_ema_warmup(12))
+def _ema_12(df):
+    return df['Close'].ewm(span=12, adjust=False).mean()
+
+
+@register_indicator("EMA_26", warmup=_ema_warmup(26))
+def _ema_26(df):
+    return df['Close'].ewm(span=26, adjust=False).mean()
+
+
+@register_indicator("MACD", inputs=(), deps=("EMA_12", "EMA_26"))
+def _macd(df):
+    return df['EMA_12'] - df['EMA_26']
+
+
+@register_indicator("MACD_Signal", inputs=(), deps=("MACD",), warmup=_ema_warmup(9))
+def _macd_signal(df):
+    return df['MACD'].ewm(span=9, adjust=False).mean()
+
+
+@register_indicator("MACD_Histogram", inputs=(), deps=("MACD", "MACD_Signal"))
+def _macd_histogram(df):
+    return df['MACD'] - df['MACD_Signal']
+
+
+@register_indicator("RSI", lookback=15)  # 14 deltas need 15 closes
+def _rsi(df):
+    delta = df['Close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+@register_indicator("BB_Middle", lookback=20)
+def _bb_middle(df):
+    return df['Close'].rolling(window=20).mean()
+
+
+@register_indicator("_BB_Std", lookback=20)
+def _bb_std(df):
+    return df['Close'].rolling(window=20).std()
+
+
+@register_indicator("BB_Upper", inputs=(), deps=("BB_Middle", "_BB_Std"))
+def _bb_upper(df):
+    return df['BB_Middle'] + (df['_BB_Std'] * 2)
+
+
+@register_indicator("BB_Lower", inputs=(), deps=("BB_Middle", "_BB_Std"))
+def _bb_lower(df):
+    return df['BB_Middle'] - (df['_BB_Std'] * 2)
+
+
+@register_indicator("%K", inputs=("High", "Low", "Close"), lookback=14)
+def _stochastic_k(df):
+    low_14 = pd.Series(rolling_min(df['Low'].to_numpy(dtype=float), 14), index=df.index)
+    high_14 = pd.Series(rolling_max(df['High'].to_numpy(dtype=float), 14), index=df.index)
+    return 100 * ((df['Close'] - low_14) / (high_14 - low_14))
+
+
+@register_indicator("%D", inputs=(), lookback=3, deps=("%K",))
+def _stochastic_d(df):
+    return df['%K'].rolling(window=3).mean()
+
+
+@register_indicator("Volume_SMA", inputs=("Volume",), lookback=20)
+def _volume_sma(df):
+    if 'Volume' in df.columns and not df['Volume'].isnull().all():
+        return df['Volume'].rolling(window=20).mean()
+    return pd.Series(np.nan, index=df.index)
+
+
+PUBLIC_INDICATORS = tuple(name for name in INDICATOR_REGISTRY if not name.startswith("_"))
+
+
+def indicator_closure(outputs):
+    """``outputs`` plus everything they depend on, in computation order."""
+    needed = set()
+    pending = list(outputs)
+    while pending:
+        name = pending.pop()
+        if name not in INDICATOR_REGISTRY:
+            raise KeyError(f"Unknown indicator: {name}")
+        if name not in needed:
+            needed.add(name)
+            pending.extend(INDICATOR_REGISTRY[name]["deps"])
+    return [name for name in INDICATOR_REGISTRY if name in needed]
+
+
+def indicator_inputs(outputs):
+    """Raw OHLCV columns the given outputs read."""
+    return sorted({col for name in indicator_closure(outputs) for col in INDICATOR_REGISTRY[name]["inputs"]})
+
+
+def _indicator_history(name, converged):
+    spec = INDICATOR_REGISTRY[name]
+    own = spec["lookback"] + (spec["warmup"] if converged else 0)
+    return own - 1 + max((_indicator_history(dep, converged) for dep in spec["deps"]), default=1)
+
+
+def required_history(outputs, converged=True):
+    """Bars needed for the latest row of every output to be valid.
+
+    With ``converged`` the EMA-based outputs also get enough warm-up that their
+    latest value matches what a much longer history would give (within 0.1%).
+    """
+    return max((_indicator_history(name, converged) for name in outputs), default=1)
+
+
+def compute_indicators(data, outputs=None, strict=False):
+    """Add ``outputs`` (default: every public indicator) to a copy of ``data``.
+
+    Only the dependency closure of ``outputs`` is computed. Outputs needing more
+    rows than ``data`` has are left out and listed in
+    ``df.attrs["skipped_indicators"]``; with ``strict`` they raise ValueError.
+    """
+    outputs = PUBLIC_INDICATORS if outputs is None else tuple(outputs)
+    skipped = [name for name in outputs if len(data) < _indicator_history(name, converged=False)]
+    if skipped and strict:
+        raise ValueError(f"Not enough history for {', '.join(skipped)}: have {len(data)} rows, "
+                         f"need {required_history(skipped, converged=False)}")
+    closure = indicator_closure(name for name in outputs if name not in skipped)
+    df = data.copy()
+    for name in closure:
+        df[name] = INDICATOR_REGISTRY[name]["fn"](df)
+    df = df.drop(columns=[name for name in closure if name.startswith("_")])
+    df.attrs["skipped_indicators"] = skipped
+    return df
+
+
+# --- Streaming Indicator Engine (O(1) work per appended bar) ---
+INDICATOR_COLUMNS = ["SMA_20", "SMA_50", "SMA_200", "EMA_12", "EMA_26", "MACD", "MACD_Signal",
+                     "MACD_Histogram", "RSI", "BB_Middle", "BB_Upper", "BB_Lower", "%K", "%D", "Volume_SMA"]
+
+
+def _ieee_div(num, den):
+    """num / den with NumPy's inf/NaN results instead of ZeroDivisionError."""
+    if den:
+        return num / den
+    if num != num or num == 0:
+        return np.nan
+    return math.copysign(np.inf, num) * math.copysign(1.0, den)
+
+
+class _RollingMean:
+    """Fixed-window mean from a running sum; NaN until the window is full and while it holds a NaN.
+
+    The sum is rebuilt from the window every ``window`` pushes, so rounding
+    error cannot build up over a long session, and a window of identical
+    values returns that value exactly (a flat run of zero gains stays 0.0).
+    """
+    __slots__ = ("window", "values", "total", "nans", "pushes", "same_run")
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self.nans = self.pushes = self.same_run = 0
+
+    def push(self, val):
+        values = self.values
+        self.same_run = self.same_run + 1 if values and val == values[-1] else 1
+        values.append(val)
+        if val == val:
+            self.total += val
+        else:
+            self.nans += 1
+        if len(values) > self.window:
+            old = values.popleft()
+            if old == old:
+                self.total -= old
+            else:
+                self.nans -= 1
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            self.total = math.fsum(v for v in values if v == v)
+        if len(values) < self.window or self.nans:
+            return np.nan
+        if self.same_run >= self.window:
+            return val
+        return self.total / self.window
+
+
+class _RollingStd:
+    """Fixed-window sample std (ddof=1) by Welford add/remove updates over the valid values,
+    re-anchored with a two-pass sum every ``window`` pushes."""
+    __slots__ = ("window", "values", "count", "mean", "m2", "nans", "pushes", "same_run")
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.count = self.nans = self.pushes = self.same_run = 0
+        self.mean = self.m2 = 0.0
+
+    def push(self, val):
+        values = self.values
+        self.same_run = self.same_run + 1 if values and val == values[-1] else 1
+        values.append(val)
+        if val == val:
+            self.count += 1
+            delta = val - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (val - self.mean)
+        else:
+            self.nans += 1
+        if len(values) > self.window:
+            old = values.popleft()
+            if old != old:
+                self.nans -= 1
+            elif self.count == 1:
+                self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            else:
+                delta = old - self.mean
+                self.mean -= delta / (self.count - 1)
+                self.m2 -= delta * (old - self.mean)
+                self.count -= 1
+        self.pushes += 1
+        if self.pushes % self.window == 0 and self.count:
+            valid = [v for v in values if v == v]
+            self.mean = math.fsum(valid) / len(valid)
+            self.m2 = math.fsum((v - self.mean) ** 2 for v in valid)
+        if len(values) < self.window or self.nans or self.window < 2:
+            return np.nan
+        if self.same_run >= self.window:
+            return 0.0
+        return math.sqrt(max(self.m2, 0.0) / (self.window - 1))
+
+
+class _RollingExtreme:
+    """Fixed-window min or max via a monotonic deque (amortised O(1))."""
+    __slots__ = ("window", "keep_max", "queue", "seen", "last_nan")
+
+    def __init__(self, window, keep_max):
+        self.window = window
+        self.keep_max = keep_max
+        self.queue = deque()
+        self.seen = 0
+        self.last_nan = -1
+
+    def push(self, val):
+        pos = self.seen
+        self.seen += 1
+        queue = self.queue
+        if val == val:
+            if self.keep_max:
+                while queue and queue[-1][1] <= val:
+                    queue.pop()
+            else:
+                while queue and queue[-1][1] >= val:
+                    queue.pop()
+            queue.append((pos, val))
+        else:
+            self.last_nan = pos
+        while queue and queue[0][0] <= pos - self.window:
+            queue.popleft()
+        if pos - self.last_nan < self.window:
+            return np.nan
+        return queue[0][1]
+
+
+class _EWMean:
+    """ewm(span, adjust=False).mean() one observation at a time; NaN inputs are skipped."""
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = np.nan
+
+    def push(self, cur):
+        if cur == cur:
+            self.value = cur if self.value != self.value else self.value + self.alpha * (cur - self.value)
+        return self.value
+
+
+class IncrementalIndicatorEngine:
+    """Running-state twin of compute_indicators(data).dropna() for a growing bar history.
+
+    Each accumulator keeps only its window, so a new bar costs a constant number
+    of float updates. Bars and indicator rows live in NumPy buffers that grow by
+    doubling; to_frame() wraps them in one vectorised constructor and only the
+    index is extended with the stamps appended since its last call.
+    The bars, RSI, %K and Volume_SMA match the pandas batch kernels bit for
+    bit; the running sums and EMAs behind the SMAs, MACD, Bollinger bands and
+    %D add in a different order and agree to within 1e-9 (relative or
+    absolute), not exactly. The last bar may be re-sent with the same
+    timestamp (today's candle still forming); the engine rewinds to a
+    checkpoint taken before it.
+    """
+
+    MIN_BARS = 50
+
+    def __init__(self, columns=OHLCV_FIELDS, dtypes=None, index_name=None):
+        self.columns = list(columns)
+        self._dtypes = dict(dtypes or {})
+        self._index_name = index_name
+        self._freq = None
+        self._close_col = self.columns.index("Close")
+        self._high_col = self.columns.index("High")
+        self._low_col = self.columns.index("Low")
+        self._volume_col = self.columns.index("Volume") if "Volume" in self.columns else None
+        self._stamps = []
+        self._raw = np.empty((0, len(self.columns)))
+        self._rows = np.empty((0, len(INDICATOR_COLUMNS)))
+        self._state = self._fresh_state()
+        self._checkpoint = None
+        self._index = None      # DatetimeIndex of the first _built stamps
+        self._built = 0
+        self._frames = {}       # outputs -> frame for the current _built rows
+
+    @staticmethod
+    def _fresh_state():
+        return {
+            "prev_close": np.nan,
+            "sma_20": _RollingMean(20), "sma_50": _RollingMean(50), "sma_200": _RollingMean(200),
+            "ema_12": _EWMean(12), "ema_26": _EWMean(26), "macd_signal": _EWMean(9),
+            "avg_gain": _RollingMean(14), "avg_loss": _RollingMean(14), "bb_std": _RollingStd(20),
+            "low_14": _RollingExtreme(14, keep_max=False), "high_14": _RollingExtreme(14, keep_max=True),
+            "pct_d": _RollingMean(3), "volume_sma": _RollingMean(20),
+        }
+
+    def _snapshot(self):
+        """Copy of the running state; slot-wise so only the small window deques are duplicated."""
+        snapshot = {}
+        for name, acc in self._state.items():
+            if not hasattr(acc, "__slots__"):
+                snapshot[name] = acc
+                continue
+            dup = object.__new__(type(acc))
+            for slot in acc.__slots__:
+                value = getattr(acc, slot)
+                setattr(dup, slot, value.copy() if isinstance(value, deque) else value)
+            snapshot[name] = dup
+        return snapshot
+
+    def _reserve(self, rows):
+        if rows <= len(self._raw):
+            return
+        capacity = max(rows, 2 * len(self._raw), 256)
+        for name in ("_raw", "_rows"):
+            old = getattr(self, name)
+            grown = np.empty((capacity, old.shape[1]))
+            grown[:len(self)] = old[:len(self)]
+            setattr(self, name, grown)
+
+    def _append(self, timestamp, raw):
+        n = len(self)
+        self._reserve(n + 1)
+        self._raw[n] = raw
+        volume = raw[self._volume_col] if self._volume_col is not None else np.nan
+        self._rows[n] = self._step(raw[self._close_col], raw[self._high_col], raw[self._low_col], volume)
+        self._stamps.append(timestamp)
+
+    @classmethod
+    def from_frame(cls, data):
+        """Bulk-initialise from an OHLCV frame (one pass, no per-bar checkpoints)."""
+        engine = cls(data.columns, data.dtypes.to_dict(), data.index.name)
+        engine._freq = getattr(data.index, "freq", None)
+        if data.empty:
+            return engine
+        raw = data.to_numpy(dtype=float)
+        last = len(data) - 1
+        for i, ts in enumerate(data.index):
+            if i == last:
+                engine._checkpoint = engine._snapshot()
+            engine._append(ts, raw[i])
+        return engine
+
+    def _step(self, close, high, low, volume):
+        s = self._state
+        delta = close - s["prev_close"]
+        s["prev_close"] = close
+        # Same as the batch RSI: the first (NaN) delta counts as a zero gain and loss
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+
+        sma_20 = s["sma_20"].push(close)
+        sma_50 = s["sma_50"].push(close)
+        sma_200 = s["sma_200"].push(close)
+        ema_12 = s["ema_12"].push(close)
+        ema_26 = s["ema_26"].push(close)
+        macd = ema_12 - ema_26
+        signal = s["macd_signal"].push(macd)
+        rs = _ieee_div(s["avg_gain"].push(gain), s["avg_loss"].push(loss))
+        rsi = 100 - (100 / (1 + rs))
+        bb_std = s["bb_std"].push(close)
+        low_14 = s["low_14"].push(low)
+        high_14 = s["high_14"].push(high)
+        pct_k = 100 * _ieee_div(close - low_14, high_14 - low_14)
+        pct_d = s["pct_d"].push(pct_k)
+        volume_sma = s["volume_sma"].push(volume) if self._volume_col is not None else np.nan
+        return (sma_20, sma_50, sma_200, ema_12, ema_26, macd, signal, macd - signal, rsi,
+                sma_20, sma_20 + (bb_std * 2), sma_20 - (bb_std * 2), pct_k, pct_d, volume_sma)
+
+    def _push(self, timestamp, raw):
+        if self._stamps and timestamp == self._stamps[-1]:
+            self._state = self._checkpoint
+            self._stamps.pop()
+            self._built = min(self._built, len(self))
+        elif self._stamps and timestamp < self._stamps[-1]:
+            raise ValueError(f"Bar at {timestamp} is older than the last bar {self._stamps[-1]}")
+        self._checkpoint = self._snapshot()
+        self._append(timestamp, raw)
+
+    def update(self, timestamp, bar):
+        """Append one bar (mapping of column -> value) and return its indicator values."""
+        self._push(timestamp, np.array([bar.get(col, np.nan) for col in self.columns], dtype=float))
+        return dict(zip(INDICATOR_COLUMNS, self._rows[len(self) - 1]))
+
+    def extend(self, data):
+        """Step only the rows of ``data`` past what the engine has seen.
+
+        Returns False when ``data`` is not a continuation of the engine's history
+        (different columns, or any close other than the last one changed, e.g. a
+        split adjustment); the caller should rebuild with from_frame().
+        """
+        seen = len(self)
+        if not seen or len(data) < seen or list(data.columns) != self.columns:
+            return False
+        if data.index[seen - 1] != self._stamps[-1]:
+            return False
+        raw = data.to_numpy(dtype=float)
+        if not np.array_equal(raw[:seen - 1, self._close_col], self._raw[:seen - 1, self._close_col], equal_nan=True):
+            return False
+        start = seen if np.array_equal(raw[seen - 1], self._raw[seen - 1], equal_nan=True) else seen - 1
+        for i in range(start, len(data)):
+            self._push(data.index[i], raw[i])
+        return True
+
+    def __len__(self):
+        return len(self._stamps)
+
+    def _sync_index(self):
+        """Extend the cached index by the stamps appended (or revised) since the last call."""
+        n = len(self)
+        if self._built == n and self._index is not None:
+            return
+        kept = self._index[:self._built] if self._index is not None else None
+        fresh = pd.Index(self._stamps[self._built:n], name=self._index_name)
+        index = fresh if kept is None or not len(kept) else kept.append(fresh)
+        if self._freq is not None:
+            try:
+                index = pd.DatetimeIndex(index, freq=self._freq)
+            except ValueError:
+                pass  # bars appended off the original calendar
+        self._index = index.rename(self._index_name)
+        self._built = n
+        self._frames = {}
+
+    def to_frame(self, outputs=None):
+        """The frame compute_indicators(data).dropna() would return for the bars seen.
+
+        With `outputs`, only those indicator columns are included, like
+        compute_indicators(data, outputs).dropna(). Repeated calls without new
+        bars return the cached frame (a shallow copy).
+        """
+        if len(self) < self.MIN_BARS:
+            return pd.DataFrame()
+        self._sync_index()
+        key = None if outputs is None else tuple(outputs)
+        df = self._frames.get(key)
+        if df is None:
+            n = len(self)
+            wanted = [j for j, col in enumerate(INDICATOR_COLUMNS) if outputs is None or col in outputs]
+            skipped = [INDICATOR_COLUMNS[j] for j in wanted
+                       if n < required_history([INDICATOR_COLUMNS[j]], converged=False)]
+            wanted = [j for j in wanted if INDICATOR_COLUMNS[j] not in skipped]
+            values = np.concatenate([self._raw[:n], self._rows[:n, wanted]], axis=1)
+            df = pd.DataFrame(values, index=self._index,
+                              columns=self.columns + [INDICATOR_COLUMNS[j] for j in wanted])
+            df = df[~np.isnan(values).any(axis=1)]
+            for col, dtype in self._dtypes.items():
+                if dtype != np.float64:
+                    df[col] = df[col].astype(dtype)
+            df.attrs["skipped_indicators"] = skipped
+            self._frames[key] = df
+        return df.copy(deep=False)
+
+
+# --- Panel Indicator Kernels (dates × symbols NumPy arrays) ---
+def _right_align_order(values):
+    """Row order that moves each column's NaNs to the top, keeping valid rows in sequence."""
+    return np.argsort(~np.isnan(values), axis=0, kind="stable")
+
+
+def _window_blocks(values, window):
+    """View ``values`` as (blocks, window, ...) for the block-prefix/suffix rolling kernels.
+
+    The tail is padded with NaN; the padding only ever reaches rows past the input.
+    """
+    pad = -len(values) % window
+    if pad:
+        values = np.concatenate([values, np.full((pad,) + values.shape[1:], np.nan)])
+    return values.reshape((-1, window) + values.shape[1:])
+
+
+def _unblock(blocks, n_rows, window):
+    out = blocks.reshape((-1,) + blocks.shape[2:])[:n_rows]
+    out[:window - 1] = np.nan
+    return out
+
+
+def _rolling_extreme(values, window, ufunc):
+    # van Herk / Gil-Werman: a trailing window spans the suffix of one block and
+    # the prefix of the next, so its extreme is one ufunc() of two running scans.
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.full(values.shape, np.nan)
+    blocks = _window_blocks(values, window)
+    prefix = ufunc.accumulate(blocks, axis=1)
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    prefix[1:, :-1] = ufunc(prefix[1:, :-1], suffix[:-1, 1:])
+    return _unblock(prefix, len(values), window)
+
+
+def rolling_max(values, window):
+    """Trailing max along axis 0 of a 1-D array or 2-D panel, O(n) in rows.
+
+    NaN inside a window gives NaN, matching ``rolling(window).max()``.
+    """
+    return _rolling_extreme(values, window, np.maximum)
+
+
+def rolling_min(values, window):
+    """Trailing min along axis 0; the counterpart of rolling_max()."""
+    return _rolling_extreme(values, window, np.minimum)
+
+
+def rolling_std(values, window, ddof=1):
+    """Trailing standard deviation along axis 0, O(n) and numerically stable.
+
+    Sums are taken over deviations from the first value of each block, and each
+    prefix/suffix sum covers at most ``window`` rows, so nothing accumulates
+    over the whole history and large price levels do not cancel out.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.full(values.shape, np.nan)
+    blocks = _window_blocks(values, window)
+    shift = blocks[:, :1]
+    dev = blocks - shift
+    sum1 = np.cumsum(dev, axis=1)
+    sum2 = np.cumsum(dev * dev, axis=1)
+    tail = blocks[:-1] - shift[1:]
+    sum1[1:, :-1] += np.cumsum(tail[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    sum2[1:, :-1] += np.cumsum((tail * tail)[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    var = (sum2 - sum1 * sum1 / window) / (window - ddof)
+    return _unblock(np.sqrt(np.maximum(var, 0.0)), len(values), window)
+
+
+def panel_sma(values, window):
+    """Trailing simple moving average of every column; needs a full window of valid values."""
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    zero_row = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate([zero_row, np.cumsum(np.where(valid, values, 0.0), axis=0)])
+    counts = np.concatenate([zero_row, np.cumsum(valid, axis=0)])
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        full = (counts[window:] - counts[:-window]) == window
+        out[window - 1:] = np.where(full, (sums[window:] - sums[:-window]) / window, np.nan)
+    return out
+
+
+def panel_ema(values, span):
+    """ewm(span, adjust=False).mean() for every column; one time loop, vectorised across symbols."""
+    values = np.asarray(values, dtype=float)
+    alpha = 2.0 / (span + 1.0)
+    out = np.empty(values.shape)
+    state = np.full(values.shape[1:], np.nan)
+    for t, row in enumerate(values):
+        stepped = state + alpha * (row - state)
+        state = np.where(np.isnan(state), row, np.where(np.isnan(row), state, stepped))
+        out[t] = state
+    return out
+
+
+def panel_rsi(values, period=14):
+    """Simple-average RSI, same definition as calculate_advanced_technical_indicators."""
+    values = np.asarray(values, dtype=float)
+    delta = np.diff(values, axis=0, prepend=np.nan)
+    missing = np.isnan(values)
+    gain = np.where(missing, np.nan, np.where(delta > 0, delta, 0.0))
+    loss = np.where(missing, np.nan, np.where(delta < 0, -delta, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = panel_sma(gain, period) / panel_sma(loss, period)
+        return 100 - (100 / (1 + rs))
+
+
+def panel_macd(values, fast=12, slow=26, signal=9):
+    """(MACD, signal line, histogram) for every column."""
+    macd = panel_ema(values, fast) - panel_ema(values, slow)
+    macd_signal = panel_ema(macd, signal)
+    return macd, macd_signal, macd - macd_signal
+
+
+def panel_bollinger(values, window=20, num_std=2):
+    """(middle, upper, lower) bands with the sample (ddof=1) standard deviation."""
+    values = np.asarray(values, dtype=float)
+    middle = panel_sma(values, window)
+    std = rolling_std(values, window)
+    return middle, middle + std * num_std, middle - std * num_std
+
+
+def panel_stochastic(high, low, close, k_window=14, d_window=3):
+    """(%K, %D) for every column of aligned high/low/close panels."""
+    low_k = rolling_min(low, k_window)
+    high_k = rolling_max(high, k_window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_k = 100 * ((np.asarray(close, dtype=float) - low_k) / (high_k - low_k))
+    return pct_k, panel_sma(pct_k, d_window)
+
+
+PANEL_INDICATORS = ("RSI", "SMA_20", "SMA_50", "MACD", "MACD_Signal", "MACD_Histogram",
+                    "BB_Middle", "BB_Upper", "BB_Lower", "%K", "%D")
+
+
+def universe_indicator_snapshot(panel, outputs=None):
+    """Latest values of ``outputs`` (default: all panel indicators) for every symbol.
+
+    ``panel`` is a (field, symbol) OHLCV frame. Each symbol's bars are right-aligned
+    first (its own missing days dropped, as a per-symbol ``dropna()`` would), then
+    only the kernels behind the requested outputs run, once, over the whole panel.
+    Bars, Close, Prev_Close and Close_21 are always included.
+    """
+    if panel is None or panel.empty:
+        return pd.DataFrame()
+    wanted = set(PANEL_INDICATORS if outputs is None else outputs)
+    close_frame = panel["Close"]
+    symbols = close_frame.columns
+    close = close_frame.to_numpy(dtype=float)
+    order = _right_align_order(close)
+    close = np.take_along_axis(close, order, axis=0)
+
+    def latest(values, back=1):
+        return values[-back] if len(values) >= back else np.full(len(symbols), np.nan)
+
+    columns = {
+        "Bars": (~np.isnan(close)).sum(axis=0),
+        "Close": latest(close),
+        "Prev_Close": latest(close, 2),
+        "Close_21": latest(close, 21),
+    }
+    if "RSI" in wanted:
+        columns["RSI"] = latest(panel_rsi(close))
+    for window in (20, 50):
+        if f"SMA_{window}" in wanted:
+            columns[f"SMA_{window}"] = latest(panel_sma(close, window))
+    if wanted & {"MACD", "MACD_Signal", "MACD_Histogram"}:
+        macd, macd_signal, macd_hist = panel_macd(close)
+        columns.update(MACD=latest(macd), MACD_Signal=latest(macd_signal), MACD_Histogram=latest(macd_hist))
+    if wanted & {"BB_Middle", "BB_Upper", "BB_Lower"}:
+        bb_middle, bb_upper, bb_lower = panel_bollinger(close)
+        columns.update(BB_Middle=latest(bb_middle), BB_Upper=latest(bb_upper), BB_Lower=latest(bb_lower))
+    if wanted & {"%K", "%D"}:
+        high = np.take_along_axis(panel["High"].reindex(columns=symbols).to_numpy(dtype=float), order, axis=0)
+        low = np.take_along_axis(panel["Low"].reindex(columns=symbols).to_numpy(dtype=float), order, axis=0)
+        pct_k, pct_d = panel_stochastic(high, low, close)
+        columns.update({"%K": latest(pct_k), "%D": latest(pct_d)})
+    return pd.DataFrame({name: values for name, values in columns.items()
+                         if name in wanted or name in ("Bars", "Close", "Prev_Close", "Close_21")}, index=symbols)
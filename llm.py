@@ -0,0 +1,83 @@
+"""AI request plumbing shared by the app: the de-duplicating fan-out pool and
+batched scoring on top of it.
+
+No Streamlit calls here, so benchmarks and tests can run the same code the
+pages do against mock providers.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prompts import (BATCH_MAX_SYMBOLS, BATCH_PROMPT, BATCH_REPLY_TOKENS, batch_rows, estimate_tokens, plan_batches,
+                     validate_batch_reply)
+
+
+# --- Concurrent AI Fan-out (one pool for every provider call) ---
+class LLMFanout:
+    """Shared pool that runs provider calls concurrently and never starts the same call twice.
+
+    A call still running when its page's deadline passes is not cancelled: it
+    finishes in the background, its result is stored by the provider's caches,
+    and a rerun that asks for the same call meanwhile waits on the same future.
+    """
+
+    def __init__(self, max_workers=6):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-fanout")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._pool.submit(fn, *args)
+            self._inflight[key] = future
+        # outside the lock: a call that already finished (a cache hit) runs the callback right here
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+# --- Batched AI Scoring (chunks in parallel, one follow-up round) ---
+def score_batched(entries, complete, context_tokens, fanout, max_symbols=BATCH_MAX_SYMBOLS):
+    """Score (symbol, snapshot) entries with one ``complete`` request per chunk, chunks in parallel.
+
+    Requests go through ``fanout`` (an LLMFanout). Symbols whose items are
+    missing or invalid are asked for once more, together, in a follow-up round;
+    a request that failed outright (quota, network) is not repeated. Returns
+    ({symbol: (signal, reason, confidence)}, stats).
+    """
+    results, problems, failed = {}, [], set()
+    stats = {"requests": 0, "prompt tokens": 0, "symbols": len(entries), "re-asked": 0}
+    pending = list(entries)
+    for attempt in range(2):
+        chunks = plan_batches(pending, context_tokens, max_symbols)
+        futures = []
+        for chunk in chunks:
+            prompt = BATCH_PROMPT.format(rows=batch_rows(chunk))
+            max_tokens = BATCH_REPLY_TOKENS * len(chunk) + 20
+            futures.append((chunk, fanout.submit(("batch", complete, prompt), complete, prompt, max_tokens)))
+            stats["requests"] += 1
+            stats["prompt tokens"] += estimate_tokens(prompt)
+        for chunk, future in futures:
+            try:
+                answered, issues = validate_batch_reply(future.result(), [symbol for symbol, _ in chunk])
+            except Exception as e:
+                answered, issues = {}, [f"request failed: {str(e)[:80]}"]
+                failed.update(symbol for symbol, _ in chunk)
+            results.update(answered)
+            problems.extend(issues)
+        pending = [entry for entry in pending if entry[0] not in results and entry[0] not in failed]
+        if not pending or attempt:
+            break
+        stats["re-asked"] = len(pending)
+    stats.update(scored=len(results), problems=problems)
+    return results, stats
@@ -0,0 +1,275 @@
+"""Prompt building shared by the app: feature snapshots, the per-provider prompt
+compiler, the batched scoring prompt and the reply schema/parsing.
+
+Everything here is plain Python/pandas with no Streamlit calls, so it can be
+imported by tests, benchmarks and offline scripts (see scripts/prompt_regression.py).
+"""
+import json
+import math
+import random
+import threading
+import time
+
+from indicators import universe_indicator_snapshot
+
+# --- LLM Feature Snapshots (compact cache keys for the AI providers) ---
+# The prompts only read the latest bar, printed at these decimals; rounding the same
+# way makes two snapshots equal exactly when they would render the same prompt
+SNAPSHOT_DECIMALS = {"Close": 2, "SMA_20": 2, "SMA_50": 2, "RSI": 2, "MACD": 4, "MACD_Signal": 4,
+                     "BB_Upper": 2, "BB_Middle": 2, "BB_Lower": 2, "%K": 2, "%D": 2}
+
+
+def feature_snapshot(analyzed_data):
+    """Latest indicator values as a small, hashable ((name, value), ...) tuple; () without data."""
+    if analyzed_data is None or analyzed_data.empty:
+        return ()
+    return tuple((name, round(float(analyzed_data[name].iat[-1]), decimals))
+                 for name, decimals in SNAPSHOT_DECIMALS.items() if name in analyzed_data.columns)
+
+
+def universe_snapshots(panel, min_bars=50):
+    """(symbol, feature snapshot) pairs for every symbol in an OHLCV panel with enough history."""
+    frame = universe_indicator_snapshot(panel, tuple(SNAPSHOT_DECIMALS))
+    entries = []
+    for symbol, row in frame.iterrows():
+        if row["Bars"] < min_bars:
+            continue
+        entries.append((symbol, tuple((name, round(float(row[name]), decimals))
+                                      for name, decimals in SNAPSHOT_DECIMALS.items() if name in row.index)))
+    return tuple(entries)
+
+
+# --- Prompt Compiler (one feature snapshot -> compact, provider-specific prompts) ---
+# The indicator rules every provider is told, written once; the batch prompt reuses them
+PROMPT_RULES = ("Rules: RSI<30 oversold, >70 overbought; MACD>signal bullish; Close>SMA_20 & SMA_50 bullish; "
+                "near BB_Lower bullish, BB_Upper bearish; %K,%D<20 oversold, >80 overbought.")
+PROMPT_REPLY = 'JSON only: {"signal":"BUY|SELL|HOLD","reason":"<one sentence>","confidence":0-1}'
+# provider -> system message and reply instructions; Gemini's reply shape is fixed by its
+# responseSchema and Groq's by response_format, but the xAI request has neither, so Grok's
+# system message keeps the JSON-only instruction
+PROMPT_STYLES = {
+    "gemini": {"system": None, "reply": None},
+    "grok": {"system": "You are a precise analyst of Indian (NSE/BSE) stocks. Always respond with valid JSON only.",
+             "reply": PROMPT_REPLY},
+    "groq": {"system": None, "reply": PROMPT_REPLY},
+}
+# BB_Middle is the 20-day SMA again, so it is never sent; when a prompt is over budget
+# the rules go first, then these features in order
+PROMPT_FEATURES = tuple(name for name in SNAPSHOT_DECIMALS if name != "BB_Middle")
+PROMPT_DROP_ORDER = ("%D", "BB_Upper", "BB_Lower", "%K", "SMA_50")
+PROMPT_TOKEN_BUDGET = 160      # default estimated-token ceiling for a single-stock prompt
+CHAT_MESSAGE_TOKENS = 4        # per-message framing the chat APIs add around the text
+
+GEMINI_SIGNAL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "signal": {"type": "STRING", "enum": ["BUY", "SELL", "HOLD"]},
+        "reason": {"type": "STRING"},
+        "confidence": {"type": "NUMBER", "format": "float"}
+    },
+    "required": ["signal", "reason", "confidence"]
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English and numbers)."""
+    return len(text) // 4 + 1
+
+
+def prompt_tokens(system, user):
+    """Estimated prompt tokens for a (system, user) pair as a chat request sends it."""
+    return sum(estimate_tokens(text) + CHAT_MESSAGE_TOKENS for text in (system, user) if text)
+
+
+def compile_prompt(provider, symbol, current_price, snapshot, budget=PROMPT_TOKEN_BUDGET, timeframe="daily"):
+    """Render the prompt for ``provider`` from a feature snapshot, trimmed to ``budget`` tokens.
+
+    ``timeframe`` names the bars the snapshot was computed on ("daily", "15-minute", ...).
+
+    Returns a dict with the system and user text, the estimated token count, the
+    budget, what was dropped to meet it, and ``over_budget`` when even the
+    smallest prompt (Close, SMA_20, RSI, MACD and its signal) does not fit.
+    """
+    style = PROMPT_STYLES[provider]
+    latest = dict(snapshot)
+    features = [name for name in PROMPT_FEATURES if name in latest and not math.isnan(latest[name])]
+    dropped = []
+
+    def render(with_rules):
+        lines = [f"BUY/SELL/HOLD for NSE stock {symbol} at ₹{current_price:.2f}; latest {timeframe} indicators:",
+                 " ".join(f"{name}={latest[name]:.{SNAPSHOT_DECIMALS[name]}f}" for name in features)]
+        if with_rules:
+            lines.append(PROMPT_RULES)
+        if style["reply"]:
+            lines.append(style["reply"])
+        return "\n".join(lines)
+
+    user = render(True)
+    tokens = prompt_tokens(style["system"], user)
+    if tokens > budget:
+        dropped.append("rules")
+        user = render(False)
+        tokens = prompt_tokens(style["system"], user)
+    for name in PROMPT_DROP_ORDER:
+        if tokens <= budget:
+            break
+        if name in features:
+            features.remove(name)
+            dropped.append(name)
+            user = render(False)
+            tokens = prompt_tokens(style["system"], user)
+    return {"provider": provider, "system": style["system"], "user": user, "tokens": tokens, "budget": budget,
+            "dropped": tuple(dropped), "over_budget": tokens > budget}
+
+
+# --- Batched Scoring Prompt (many symbols per structured request) ---
+# One request scores a whole chunk of the universe: the indicator rules are sent once,
+# each symbol adds one CSV row, and the reply is a JSON array validated item by item
+BATCH_INDICATORS = tuple(SNAPSHOT_DECIMALS)
+BATCH_SIGNALS = ("BUY", "SELL", "HOLD")
+BATCH_REPLY_TOKENS = 45        # budget for one {"symbol", "signal", "reason", "confidence"} item
+BATCH_MAX_SYMBOLS = 25         # default cap on symbols per request, so one bad reply costs little
+BATCH_PROMPT = ("""You are a professional stock analyst for Indian markets (NSE/BSE).
+Give a trading recommendation for every stock in the CSV below (latest daily bar; prices in ₹).
+""" + PROMPT_RULES + """
+Reply ONLY with JSON: {{"results": [{{"symbol": "<symbol>", "signal": "BUY"|"SELL"|"HOLD", "reason": "<one short sentence>", "confidence": <0.0-1.0>}}, ...]}}
+with exactly one item per symbol.
+
+{rows}""")
+
+
+def batch_rows(entries):
+    """CSV block for a chunk: a header naming the features once, then one row per (symbol, snapshot)."""
+    lines = ["symbol," + ",".join(BATCH_INDICATORS)]
+    for symbol, snapshot in entries:
+        latest = dict(snapshot)
+        lines.append(symbol + "," + ",".join(
+            "" if name not in latest or math.isnan(latest[name]) else f"{latest[name]:.{SNAPSHOT_DECIMALS[name]}f}"
+            for name in BATCH_INDICATORS))
+    return "\n".join(lines)
+
+
+def plan_batches(entries, context_tokens, max_symbols=BATCH_MAX_SYMBOLS):
+    """Split (symbol, snapshot) entries into chunks whose prompt plus reply fits ``context_tokens``.
+
+    A tenth of the window is kept as headroom, since ``estimate_tokens`` is only
+    an estimate; ``max_symbols`` caps a chunk so one bad reply costs little.
+    """
+    budget = int(context_tokens * 0.9) - estimate_tokens(BATCH_PROMPT + batch_rows([]))
+    chunks, chunk, used = [], [], 0
+    for entry in entries:
+        cost = estimate_tokens(batch_rows([entry]).split("\n", 1)[1]) + BATCH_REPLY_TOKENS
+        if chunk and (used + cost > budget or len(chunk) >= max_symbols):
+            chunks.append(chunk)
+            chunk, used = [], 0
+        chunk.append(entry)
+        used += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def json_payload(content):
+    """Parse a model reply as JSON, tolerating a ```json fence around it."""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("```")[1]
+        if content.startswith("json"):
+            content = content[4:]
+    return json.loads(content)
+
+
+def validate_batch_reply(content, symbols):
+    """Check a batch reply against the schema; returns ({symbol: (signal, reason, confidence)}, problems).
+
+    A bare array or an object holding the array (under "results" or any other
+    single key) are both accepted. Items for symbols that were not asked for,
+    repeats, unknown signals and non-numeric confidences are dropped and listed
+    in ``problems``; confidences are clipped to [0, 1].
+    """
+    try:
+        payload = json_payload(content)
+    except (json.JSONDecodeError, IndexError, AttributeError):
+        return {}, ["reply is not valid JSON"]
+    if isinstance(payload, dict):
+        payload = payload.get("results", next(iter(payload.values()), None) if len(payload) == 1 else None)
+    if not isinstance(payload, list):
+        return {}, ["reply has no results array"]
+
+    wanted = set(symbols)
+    results, problems = {}, []
+    for item in payload:
+        if not isinstance(item, dict):
+            problems.append(f"non-object item {item!r:.40}")
+            continue
+        symbol = str(item.get("symbol", "")).strip().upper()
+        signal = str(item.get("signal", "")).strip().upper()
+        if symbol not in wanted:
+            problems.append(f"unexpected symbol {symbol or '?'}")
+            continue
+        if symbol in results:
+            problems.append(f"{symbol} answered twice")
+            continue
+        if signal not in BATCH_SIGNALS:
+            problems.append(f"{symbol}: invalid signal {signal or '?'}")
+            continue
+        try:
+            confidence = min(max(float(item.get("confidence", 0.5)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            problems.append(f"{symbol}: invalid confidence")
+            continue
+        reason = str(item.get("reason") or "No reason provided.").strip()
+        results[symbol] = (signal, reason, confidence)
+    return results, problems
+
+
+# --- Mock Providers (offline stand-ins for benchmarks and the prompt regression script) ---
+def mock_signal(row):
+    """The RSI / MACD rule the offline mock providers answer with; ``row`` maps names to text values."""
+    rsi, macd, macd_signal = (float(row[name]) if row.get(name) else math.nan for name in ("RSI", "MACD", "MACD_Signal"))
+    if rsi < 35 and macd > macd_signal:
+        return "BUY", "RSI is low and MACD has turned up.", round(min(0.5 + (35 - rsi) / 50, 0.95), 2)
+    if rsi > 65 and macd < macd_signal:
+        return "SELL", "RSI is stretched and MACD has rolled over.", round(min(0.5 + (rsi - 65) / 50, 0.95), 2)
+    return "HOLD", "Indicators are mixed.", 0.5
+
+
+class MockBatchProvider:
+    """Offline stand-in for a batch provider, so chunking and parsing can be benchmarked.
+
+    It reads the CSV rows back out of the prompt and answers with a simple RSI /
+    MACD rule after sleeping ``latency_s`` plus ``per_token_s`` for each reply
+    token, like a model streaming its answer. ``corrupt_rate`` garbles that
+    share of items on their first request (bad signal or missing item), so the
+    follow-up request for the leftovers is exercised too.
+    """
+
+    def __init__(self, latency_s=0.3, per_token_s=0.002, corrupt_rate=0.0, seed=0):
+        self.latency_s, self.per_token_s, self.corrupt_rate = latency_s, per_token_s, corrupt_rate
+        self._rng = random.Random(seed)
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.calls = self.prompt_tokens = 0
+
+    answer = staticmethod(mock_signal)
+
+    def __call__(self, prompt, max_tokens):
+        header, *lines = prompt[prompt.index("symbol,"):].splitlines()
+        columns = header.split(",")
+        items = []
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+            for line in lines:
+                row = dict(zip(columns, line.split(",")))
+                signal, reason, confidence = self.answer(row)
+                first_time = row["symbol"] not in self._seen
+                self._seen.add(row["symbol"])
+                if first_time and self._rng.random() < self.corrupt_rate:
+                    if self._rng.random() < 0.5:
+                        continue
+                    signal = "STRONG " + signal
+                items.append({"symbol": row["symbol"], "signal": signal, "reason": reason, "confidence": confidence})
+        content = json.dumps({"results": items})
+        time.sleep(self.latency_s + self.per_token_s * min(estimate_tokens(content), max_tokens))
+        return content
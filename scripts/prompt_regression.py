@@ -0,0 +1,305 @@
+"""Offline prompt regression: the legacy hand-written prompts vs compile_prompt.
+
+Replays both prompt versions for the same stocks and compares prompt tokens,
+latency and signal agreement per provider. Nothing here runs from the app.
+
+    # free, offline: both prompts against MockPromptModel (no network, no keys)
+    python scripts/prompt_regression.py --mock RELIANCE.NS TCS.NS INFY.NS
+
+    # live, paid: 2 calls per stock per configured provider, appended to --out
+    GROQ_API_KEY=... python scripts/prompt_regression.py --record --out fixtures.jsonl RELIANCE.NS TCS.NS
+
+    # compare everything recorded so far
+    python scripts/prompt_regression.py --compare fixtures.jsonl
+
+The mock answers with a fixed RSI / MACD rule read back out of the prompt, so
+its agreement only shows that both prompts carry the same values; how often the
+real models agree is unknown until fixtures are recorded with --record.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indicators import INDICATOR_REGISTRY, OHLCV_FIELDS, compute_indicators, required_history  # noqa: E402
+from prompts import (GEMINI_SIGNAL_SCHEMA, PROMPT_STYLES, PROMPT_TOKEN_BUDGET, SNAPSHOT_DECIMALS,  # noqa: E402
+                     compile_prompt, feature_snapshot, json_payload, mock_signal, prompt_tokens)
+
+MAX_LIVE_CASES = 20       # stocks per --record run: at most 20 × 3 providers × 2 prompts = 120 paid calls
+LLM_TIMEOUT_S = 40
+XAI_MODEL = "grok-3"
+GROQ_MODEL = "llama3-70b-8192"
+GEMINI_MODEL = "gemini-2.0-flash"
+PROMPT_INDICATORS = tuple(name for name in SNAPSHOT_DECIMALS if name in INDICATOR_REGISTRY)
+
+
+# --- Live Transports (API keys from the environment) ---
+def _chat_completion(url, key, model, prompt, max_tokens, system=None, json_mode=False, temperature=0.2):
+    messages = [{"role": "system", "content": system}] if system else []
+    payload = {"model": model, "messages": messages + [{"role": "user", "content": prompt}],
+               "temperature": temperature, "max_tokens": max_tokens}
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    response = requests.post(url, json=payload, headers={"Authorization": f"Bearer {key}"}, timeout=LLM_TIMEOUT_S)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def complete_grok(prompt, max_tokens, system=None):
+    # the app's xAI request sends no response_format either, so neither does this one
+    return _chat_completion("https://api.x.ai/v1/chat/completions", os.environ["XAI_API_KEY"], XAI_MODEL,
+                            prompt, max_tokens, system or PROMPT_STYLES["grok"]["system"])
+
+
+def complete_groq(prompt, max_tokens, system=None):
+    return _chat_completion("https://api.groq.com/openai/v1/chat/completions", os.environ["GROQ_API_KEY"],
+                            GROQ_MODEL, prompt, max_tokens, system, json_mode=True, temperature=0.3)
+
+
+def complete_gemini(prompt, max_tokens, system=None, schema=None):
+    config = {"responseMimeType": "application/json", "maxOutputTokens": max_tokens}
+    if schema:
+        config["responseSchema"] = schema
+    payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": config}
+    if system:
+        payload["systemInstruction"] = {"parts": [{"text": system}]}
+    response = requests.post(f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent",
+                             params={"key": os.environ["GEMINI_API_KEY"]}, json=payload, timeout=LLM_TIMEOUT_S)
+    response.raise_for_status()
+    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+
+# provider -> (complete(prompt, max_tokens, system=None, ...) -> reply text, environment variable)
+LIVE_TRANSPORTS = {
+    "gemini": (complete_gemini, "GEMINI_API_KEY"),
+    "grok": (complete_grok, "XAI_API_KEY"),
+    "groq": (complete_groq, "GROQ_API_KEY"),
+}
+
+
+class MockPromptModel:
+    """Offline stand-in for a single-stock provider, reading RSI and MACD back out of either prompt style.
+
+    Latency grows with prompt length (``per_token_s``) on top of ``latency_s``,
+    the way prefill does on a real model; the answer is prompts.mock_signal, so
+    two prompts agree exactly when they carry the same values. Its agreement
+    says nothing about how a real model reads the shorter prompt.
+    """
+    PATTERNS = {"RSI": re.compile(r"RSI(?: \(14\))?[:=] ?(-?\d+\.?\d*)"),
+                "MACD": re.compile(r"MACD[:=] ?(-?\d+\.?\d*)"),
+                "MACD_Signal": re.compile(r"(?:MACD[ _]Signal|\| Signal)[:=] ?(-?\d+\.?\d*)")}
+
+    def __init__(self, latency_s=0.005, per_token_s=0.0001):
+        self.latency_s, self.per_token_s = latency_s, per_token_s
+
+    def __call__(self, prompt, max_tokens, system=None, schema=None):
+        time.sleep(self.latency_s + self.per_token_s * prompt_tokens(system, prompt))
+        row = {name: (match.group(1) if (match := pattern.search(prompt)) else "")
+               for name, pattern in self.PATTERNS.items()}
+        signal, reason, confidence = mock_signal(row)
+        return json.dumps({"signal": signal, "reason": reason, "confidence": confidence})
+
+
+# --- Legacy Prompts & Fixtures ---
+def legacy_prompt(provider, symbol, current_price, snapshot):
+    """The hand-written (system, user) prompts the providers used before compile_prompt, kept as the baseline."""
+    latest = dict(snapshot)
+    if provider == "gemini":
+        return None, f"""
+    Analyze the stock {symbol} with the following latest data and provide a trading recommendation (BUY, SELL, or HOLD).
+    Current Price: ₹{current_price:.2f}
+
+    Technical Indicators:
+    - Last Close Price: ₹{latest.get('Close', 'N/A'):.2f}
+    - SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f}
+    - SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
+    - RSI: {latest.get('RSI', 'N/A'):.2f}
+    - MACD: {latest.get('MACD', 'N/A'):.4f}
+    - MACD Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
+    - Bollinger Bands (Upper): ₹{latest.get('BB_Upper', 'N/A'):.2f}
+    - Bollinger Bands (Middle): ₹{latest.get('BB_Middle', 'N/A'):.2f}
+    - Bollinger Bands (Lower): ₹{latest.get('BB_Lower', 'N/A'):.2f}
+    - Stochastic %K: {latest.get('%K', 'N/A'):.2f}
+    - Stochastic %D: {latest.get('%D', 'N/A'):.2f}
+
+    Consider these factors:
+    - RSI below 30 suggests oversold, above 70 suggests overbought.
+    - MACD crossover above signal line is bullish, below is bearish.
+    - Price above moving averages (SMA 20, 50) is bullish, below is bearish.
+    - Price near Bollinger Lower Band is bullish, near Upper Band is bearish.
+    - Stochastic %K and %D below 20 suggest oversold, above 80 suggest overbought.
+
+    Provide your recommendation as a JSON object with the following keys:
+    "signal": "BUY" | "SELL" | "HOLD"
+    "reason": "A brief explanation for the recommendation."
+    "confidence": 0.0 to 1.0 (float, indicating confidence in the recommendation)
+    """
+    if provider == "grok":
+        return "You are a precise Indian stock market analyst. Always respond with valid JSON only.", \
+            f"""You are an expert quantitative analyst specialising in Indian stock markets (NSE/BSE).
+Analyse {symbol} using the technical data below and give a precise trading recommendation.
+
+Current Price: ₹{current_price:.2f}
+Technical Indicators:
+- RSI (14): {latest.get('RSI', 'N/A'):.2f}
+- MACD: {latest.get('MACD', 'N/A'):.4f} | MACD Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
+- SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f} | SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
+- Bollinger Upper: ₹{latest.get('BB_Upper', 'N/A'):.2f} | Lower: ₹{latest.get('BB_Lower', 'N/A'):.2f}
+- Stochastic %K: {latest.get('%K', 'N/A'):.2f} | %D: {latest.get('%D', 'N/A'):.2f}
+
+Rules:
+- RSI < 30 = oversold (bullish), RSI > 70 = overbought (bearish)
+- MACD above signal line = bullish momentum
+- Price above SMA 20 & SMA 50 = bullish trend
+- Price below BB Lower = potential reversal up
+
+Reply ONLY with a JSON object — no extra text:
+{{"signal": "BUY" | "SELL" | "HOLD", "reason": "<one concise sentence>", "confidence": <0.0-1.0>}}"""
+    return None, f"""You are a professional stock analyst for Indian markets (NSE/BSE).
+Analyze {symbol} and give a trading recommendation.
+
+Current Price: ₹{current_price:.2f}
+Technical Indicators:
+- RSI: {latest.get('RSI', 'N/A'):.2f}
+- MACD: {latest.get('MACD', 'N/A'):.4f} | Signal: {latest.get('MACD_Signal', 'N/A'):.4f}
+- SMA 20: ₹{latest.get('SMA_20', 'N/A'):.2f} | SMA 50: ₹{latest.get('SMA_50', 'N/A'):.2f}
+- Bollinger Upper: ₹{latest.get('BB_Upper', 'N/A'):.2f} | Lower: ₹{latest.get('BB_Lower', 'N/A'):.2f}
+- Stochastic %K: {latest.get('%K', 'N/A'):.2f} | %D: {latest.get('%D', 'N/A'):.2f}
+
+Return ONLY a JSON object with keys: signal (BUY/SELL/HOLD), reason (1 sentence), confidence (0.0-1.0)
+Example: {{"signal": "BUY", "reason": "RSI oversold with MACD bullish crossover.", "confidence": 0.72}}"""
+
+
+def record_prompt_fixtures(cases, transports, path=None, max_tokens=200, budget=PROMPT_TOKEN_BUDGET):
+    """Send the legacy and the compiled prompt for every (symbol, price, snapshot) case to every provider.
+
+    Each answer becomes one record (tokens, latency, signal, confidence or the
+    error); the two variants run back to back, in alternating order, so they
+    see the same provider conditions. Records are appended to ``path`` as JSON
+    lines when it is given.
+    """
+    run = datetime.now().isoformat(timespec="microseconds")
+    records = []
+    for i, (symbol, current_price, snapshot) in enumerate(cases):
+        for provider, complete in transports.items():
+            for variant in (("legacy", "compiled") if i % 2 == 0 else ("compiled", "legacy")):
+                if variant == "legacy":
+                    system, user = legacy_prompt(provider, symbol, current_price, snapshot)
+                else:
+                    compiled = compile_prompt(provider, symbol, current_price, snapshot, budget)
+                    system, user = compiled["system"], compiled["user"]
+                extra = {"schema": GEMINI_SIGNAL_SCHEMA} if provider == "gemini" else {}
+                start = time.perf_counter()
+                try:
+                    output = json_payload(complete(user, max_tokens, system, **extra))
+                    signal, confidence, error = str(output.get("signal", "")).upper(), float(output.get("confidence", 0.5)), ""
+                except Exception as e:
+                    signal, confidence, error = None, None, str(e)[:120]
+                records.append({"run": run, "provider": provider, "variant": variant, "symbol": symbol,
+                                "snapshot": list(snapshot), "tokens": prompt_tokens(system, user),
+                                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                                "signal": signal, "confidence": confidence, "error": error})
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+    return records
+
+
+def load_prompt_fixtures(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_prompt_fixtures(records):
+    """Per-provider before/after table: prompt tokens, median latency and signal agreement on paired answers."""
+    if not records:
+        return pd.DataFrame()
+    frame = pd.DataFrame(records)
+    rows = []
+    for provider, group in frame.groupby("provider", sort=False):
+        legacy = group[group["variant"] == "legacy"].set_index(["run", "symbol"])
+        compiled = group[group["variant"] == "compiled"].set_index(["run", "symbol"])
+        pairs = legacy.join(compiled, lsuffix="_legacy", rsuffix="_compiled", how="inner")
+        pairs = pairs.dropna(subset=["signal_legacy", "signal_compiled"])
+        rows.append({
+            "Provider": provider,
+            "Pairs": len(pairs),
+            "Errors": int(group["signal"].isna().sum()),
+            "Legacy tokens": round(legacy["tokens"].mean()),
+            "Compiled tokens": round(compiled["tokens"].mean()),
+            "Token cut %": round((1 - compiled["tokens"].mean() / legacy["tokens"].mean()) * 100, 1),
+            "Legacy p50 ms": pairs["latency_ms_legacy"].median() if len(pairs) else None,
+            "Compiled p50 ms": pairs["latency_ms_compiled"].median() if len(pairs) else None,
+            "Agreement %": round((pairs["signal_legacy"] == pairs["signal_compiled"]).mean() * 100, 1) if len(pairs) else None,
+            "Mean |Δ confidence|": round((pairs["confidence_legacy"] - pairs["confidence_compiled"]).abs().mean(), 3)
+                                   if len(pairs) else None,
+        })
+    return pd.DataFrame(rows)
+
+
+# --- Cases ---
+def fetch_cases(symbols):
+    """(symbol, price, snapshot) for each symbol from yfinance daily history; symbols without data are skipped."""
+    import yfinance as yf
+
+    days = required_history(PROMPT_INDICATORS) * 2   # calendar days for enough trading bars
+    cases = []
+    for symbol in symbols:
+        history = yf.Ticker(symbol).history(period=f"{days}d", interval="1d")[OHLCV_FIELDS]
+        snapshot = feature_snapshot(compute_indicators(history, PROMPT_INDICATORS).dropna())
+        if snapshot:
+            cases.append((symbol, dict(snapshot)["Close"], snapshot))
+        else:
+            print(f"skipped {symbol}: not enough history", file=sys.stderr)
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--mock", action="store_true", help="replay both prompts against MockPromptModel (offline)")
+    mode.add_argument("--record", action="store_true", help="send both prompts to every provider with a key (paid)")
+    mode.add_argument("--compare", metavar="PATH", help="compare the fixtures recorded in PATH")
+    parser.add_argument("symbols", nargs="*", help="Yahoo Finance symbols, e.g. RELIANCE.NS")
+    parser.add_argument("--out", help="JSONL file --record appends to (required with --record)")
+    parser.add_argument("--budget", type=int, default=PROMPT_TOKEN_BUDGET, help="compiled prompt token budget")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        records = load_prompt_fixtures(args.compare)
+    else:
+        if not args.symbols:
+            parser.error("give at least one symbol")
+        if args.record:
+            if not args.out:
+                parser.error("--record needs --out")
+            if len(args.symbols) > MAX_LIVE_CASES:
+                parser.error(f"--record takes at most {MAX_LIVE_CASES} symbols per run")
+            transports = {name: fn for name, (fn, env) in LIVE_TRANSPORTS.items() if os.environ.get(env)}
+            if not transports:
+                parser.error("set GEMINI_API_KEY, XAI_API_KEY or GROQ_API_KEY to record fixtures")
+        else:
+            transports = {provider: MockPromptModel() for provider in PROMPT_STYLES}
+        cases = fetch_cases(args.symbols)
+        if args.record:
+            print(f"recording {len(cases) * len(transports) * 2} answers to {args.out}", file=sys.stderr)
+        records = record_prompt_fixtures(cases, transports, args.out if args.record else None, budget=args.budget)
+    comparison = compare_prompt_fixtures(records)
+    print(comparison.to_string(index=False) if not comparison.empty else "no fixtures")
+    if args.mock:
+        print("\nmock model only: agreement shows both prompts carry the same values, not how a real model answers")
+
+
+if __name__ == "__main__":
+    main()
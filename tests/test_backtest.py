@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import (DEFAULT_RULE_PARAMS, backtest_panel, generate_rule_signal_series, parallel_map,
+                      rule_feature_frame, rule_param_grid, rule_sma_windows, walk_forward_rank)
+from indicators import compute_indicators
+
+
+def panel(n_symbols, n_bars, seed):
+    rng = np.random.default_rng(seed)
+    fields = {}
+    for i in range(n_symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_bars)))
+        fields[("Open", f"SYM{i}")] = close * (1 + rng.normal(0, 0.003, n_bars))
+        fields[("High", f"SYM{i}")] = close * (1 + rng.uniform(0, 0.01, n_bars))
+        fields[("Low", f"SYM{i}")] = close * (1 - rng.uniform(0, 0.01, n_bars))
+        fields[("Close", f"SYM{i}")] = close
+        fields[("Volume", f"SYM{i}")] = rng.integers(1_000, 100_000, n_bars).astype(float)
+    return pd.DataFrame(fields, index=pd.bdate_range("2015-01-01", periods=n_bars)).sort_index(axis=1)
+
+
+def test_feature_frame_labels_averages_by_window():
+    data = panel(1, 400, 0).xs("SYM0", axis=1, level=1)
+    params = {**DEFAULT_RULE_PARAMS, "sma_fast": 10, "sma_slow": 100}
+    frame = rule_feature_frame(data, params)
+    assert {"SMA_10", "SMA_100"} <= set(frame.columns)
+    assert not {"SMA_20", "SMA_50"} & set(frame.columns)
+    expected = data["Close"].rolling(100).mean().loc[frame.index]
+    np.testing.assert_allclose(frame["SMA_100"], expected, rtol=1e-9)
+    signals = generate_rule_signal_series(frame, sma_windows=rule_sma_windows(params))
+    assert (signals["Buy_Score"] + signals["Sell_Score"]).gt(0).any()
+
+
+def test_default_windows_match_the_dashboard_signal():
+    data = panel(1, 400, 1).xs("SYM0", axis=1, level=1)
+    tuned = generate_rule_signal_series(rule_feature_frame(data, DEFAULT_RULE_PARAMS))
+    batch = compute_indicators(data).dropna()
+    expected = generate_rule_signal_series(batch).loc[tuned.index.intersection(batch.index[49:])]
+    assert len(expected) > 100
+    pd.testing.assert_series_equal(tuned.loc[expected.index, "Signal"], expected["Signal"])
+    pd.testing.assert_series_equal(tuned.loc[expected.index, "Score"], expected["Score"])
+
+
+def test_walk_forward_ranking_ignores_held_out_bars():
+    data = panel(8, 900, 2)
+    combos = rule_param_grid(n_random=60, seed=3)
+    ranked = walk_forward_rank(data, combos, holdout=0.3, top=5, workers=1)
+    split = int(len(data) * 0.7)
+    assert ranked.attrs["split"] == data.index[split]
+    assert ranked["Hold-out Sharpe"].head(5).notna().all()
+    assert ranked["Hold-out Sharpe"].iloc[5:].isna().all()
+    assert set(ranked.attrs["holdout_default"]) == {"Hold-out CAGR %", "Hold-out Sharpe", "Hold-out Max DD %"}
+
+    # Rewriting the held-out bars must not change the ranking, only the hold-out columns
+    shocked = data.copy()
+    shocked.iloc[split:] = shocked.iloc[split:] * np.linspace(1, 0.5, len(data) - split)[:, None]
+    again = walk_forward_rank(shocked, combos, holdout=0.3, top=5, workers=1)
+    pd.testing.assert_series_equal(ranked["Sharpe"], again["Sharpe"])
+
+
+def test_backtest_reports_a_failing_symbol():
+    data = panel(4, 300, 4)
+    data[("Close", "SYM2")] = data[("Close", "SYM2")].astype(object)
+    data.loc[data.index[100], ("Close", "SYM2")] = "bad print"
+    table, equity, summary, _ = backtest_panel(data, workers=1)
+    assert list(table.attrs["failed"]) == ["SYM2"]
+    assert sorted(table.index) == ["SYM0", "SYM1", "SYM3"]
+    assert summary and len(equity)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_map_reports_failed_items(workers):
+    results, errors, mode = parallel_map(math.sqrt, [4.0, -1.0, 9.0], workers)
+    assert results == [2.0, None, 3.0]
+    assert list(errors) == [1] and errors[1].startswith("ValueError")
+    assert mode == ("processes" if workers > 1 else "threads")
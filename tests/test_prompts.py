@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from prompts import PROMPT_STYLES, compile_prompt, json_payload, prompt_tokens
+
+SNAPSHOT = (("Close", 2456.3), ("SMA_20", 2401.12), ("SMA_50", 2350.0), ("RSI", 61.25), ("MACD", 12.3456),
+            ("MACD_Signal", 10.9876), ("BB_Upper", 2520.4), ("BB_Middle", 2401.12), ("BB_Lower", 2281.84),
+            ("%K", 74.5), ("%D", 70.25))
+
+
+def test_grok_keeps_the_json_only_instruction():
+    # the xAI request has no response_format, so the system message is all that asks for JSON
+    prompt = compile_prompt("grok", "RELIANCE.NS", 2456.3, SNAPSHOT)
+    assert "Always respond with valid JSON only" in prompt["system"]
+
+
+@pytest.mark.parametrize("provider", list(PROMPT_STYLES))
+def test_prompt_carries_every_feature_once(provider):
+    prompt = compile_prompt(provider, "RELIANCE.NS", 2456.3, SNAPSHOT)
+    assert not prompt["dropped"] and not prompt["over_budget"]
+    assert prompt["tokens"] == prompt_tokens(prompt["system"], prompt["user"])
+    assert "RSI=61.25" in prompt["user"] and "MACD_Signal=10.9876" in prompt["user"]
+    assert "BB_Middle" not in prompt["user"]
+
+
+@pytest.mark.parametrize("budget", [100, 60, 10])
+def test_budget_drops_rules_then_minor_features(budget):
+    prompt = compile_prompt("groq", "RELIANCE.NS", 2456.3, SNAPSHOT, budget=budget)
+    assert prompt["tokens"] <= budget or prompt["over_budget"]
+    assert prompt["dropped"][:1] == ("rules",)
+    for name in ("Close", "SMA_20", "RSI", "MACD", "MACD_Signal"):
+        assert f"{name}=" in prompt["user"]
+
+
+def test_missing_and_nan_features_are_skipped():
+    snapshot = dict(SNAPSHOT, **{"%K": math.nan})
+    del snapshot["%D"]
+    prompt = compile_prompt("gemini", "TCS.NS", 3900.0, tuple(snapshot.items()))
+    assert "%K=" not in prompt["user"] and "%D=" not in prompt["user"] and "SMA_50=" in prompt["user"]
+
+
+def test_json_payload_accepts_fenced_replies():
+    reply = '{"signal": "BUY", "reason": "x", "confidence": 0.7}'
+    assert json_payload(reply) == json_payload(f"```json\n{reply}\n```") == json_payload(f"```{reply}```")
+
+
+def test_prompt_names_the_bar_timeframe():
+    assert "latest daily indicators" in compile_prompt("groq", "TCS.NS", 3900.0, SNAPSHOT)["user"]
+    prompt = compile_prompt("groq", "TCS.NS", 3900.0, SNAPSHOT, timeframe="15-minute")
+    assert "latest 15-minute indicators" in prompt["user"] and "daily" not in prompt["user"]
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import rolling_max, rolling_min, rolling_std
+
+# rolling_max/min pick existing values, so they must match exactly. rolling_std sums
+# deviations in a different order than pandas and drifts by up to ~6e-11 relative.
+STD_RTOL = 1e-9
+STD_ATOL = 1e-9
+
+WINDOWS = [2, 3, 7, 14, 20, 50]
+
+
+def prices(n_rows, seed, level=100.0):
+    rng = np.random.default_rng(seed)
+    return level * np.exp(np.cumsum(rng.normal(0, 0.02, n_rows)))
+
+
+def with_nan_runs(values):
+    values = values.copy()
+    values[5] = np.nan                # a single gap
+    values[40:43] = np.nan            # a short run
+    values[120:190] = np.nan          # a run longer than every window
+    values[-1] = np.nan               # the latest bar missing
+    return values
+
+
+def expected(values, window, method):
+    return getattr(pd.DataFrame(values).rolling(window), method)().to_numpy().reshape(values.shape)
+
+
+def assert_same_nans(actual, reference):
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(reference))
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+@pytest.mark.parametrize("kernel,method", [(rolling_max, "max"), (rolling_min, "min")])
+def test_extremes_match_pandas(kernel, method, window):
+    values = with_nan_runs(prices(300, window))
+    for data in (values, np.column_stack([values, prices(300, 99), values[::-1]])):
+        reference = expected(data, window, method)
+        actual = kernel(data, window)
+        assert actual.shape == data.shape
+        np.testing.assert_array_equal(actual, reference)
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+@pytest.mark.parametrize("level", [1.0, 100.0, 50_000.0])
+def test_std_matches_pandas(window, level):
+    values = with_nan_runs(prices(300, window, level))
+    for data in (values, np.column_stack([values, prices(300, 7, level)])):
+        reference = expected(data, window, "std")
+        actual = rolling_std(data, window)
+        assert actual.shape == data.shape
+        assert_same_nans(actual, reference)
+        np.testing.assert_allclose(actual, reference, rtol=STD_RTOL, atol=STD_ATOL * level, equal_nan=True)
+
+
+def test_std_of_a_flat_run_is_zero():
+    values = prices(120, 1)
+    values[30:80] = 250.0
+    actual = rolling_std(values, 20)
+    np.testing.assert_allclose(actual, expected(values, 20, "std"), rtol=STD_RTOL, atol=STD_ATOL, equal_nan=True)
+    np.testing.assert_allclose(actual[49:80], 0.0, atol=STD_ATOL)
+
+
+@pytest.mark.parametrize("n_rows", [0, 1, 19, 20, 21, 39, 40, 41])
+@pytest.mark.parametrize("kernel,method", [(rolling_max, "max"), (rolling_min, "min"), (rolling_std, "std")])
+def test_lengths_around_the_window(kernel, method, n_rows):
+    # shorter than the window (all NaN), exactly one window, and partial trailing blocks
+    data = prices(n_rows, 3).reshape(n_rows, 1).repeat(2, axis=1)
+    actual = kernel(data, 20)
+    reference = expected(data, 20, method)
+    assert actual.shape == data.shape
+    assert_same_nans(actual, reference)
+    np.testing.assert_allclose(actual, reference, rtol=STD_RTOL, atol=STD_ATOL, equal_nan=True)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import OHLCV_FIELDS, IncrementalIndicatorEngine, compute_indicators
+
+# These are computed the same way as in pandas and must match bit for bit. The
+# running sums and EMAs behind the other columns add in a different order than
+# pandas' rolling/ewm kernels and drift by up to ~1e-9 (MACD, near zero) relative.
+EXACT_COLUMNS = OHLCV_FIELDS + ["RSI", "%K", "Volume_SMA"]
+RTOL = 1e-9
+ATOL = 1e-9
+
+
+def ohlcv(n_bars, seed, flat=None):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars)))
+    high = close * (1 + rng.uniform(0, 0.01, n_bars))
+    low = close * (1 - rng.uniform(0, 0.01, n_bars))
+    frame = pd.DataFrame({"Open": close * (1 + rng.normal(0, 0.003, n_bars)), "High": high, "Low": low,
+                          "Close": close, "Volume": rng.integers(1_000, 100_000, n_bars)},
+                         index=pd.bdate_range("2020-01-01", periods=n_bars, name="Date"))
+    if flat is not None:
+        frame.iloc[flat, :4] = 100.0
+    return frame
+
+
+def assert_matches_batch(engine_frame, data, outputs=None):
+    # compute_indicators also keeps public dependencies (EMA_12/26 for MACD); compare the engine's columns
+    expected = compute_indicators(data, outputs).dropna()[list(engine_frame.columns)]
+    exact = [name for name in engine_frame.columns if name in EXACT_COLUMNS]
+    rounded = [name for name in engine_frame.columns if name not in EXACT_COLUMNS]
+    pd.testing.assert_frame_equal(engine_frame[exact], expected[exact], check_exact=True, check_freq=False)
+    pd.testing.assert_frame_equal(engine_frame[rounded], expected[rounded], check_exact=False, rtol=RTOL, atol=ATOL,
+                                  check_freq=False)
+
+
+@pytest.mark.parametrize("n_bars", [60, 199, 200, 250, 1500])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_bulk_matches_pandas(n_bars, seed):
+    data = ohlcv(n_bars, seed)
+    assert_matches_batch(IncrementalIndicatorEngine.from_frame(data).to_frame(), data)
+
+
+def test_flat_run_matches_pandas():
+    # identical closes make gains, losses and the Bollinger std exactly zero in pandas
+    data = ohlcv(300, 3, flat=slice(100, 140))
+    assert_matches_batch(IncrementalIndicatorEngine.from_frame(data).to_frame(), data)
+
+
+def test_streaming_with_revised_last_bar():
+    data = ohlcv(400, 4)
+    engine = IncrementalIndicatorEngine.from_frame(data.iloc[:100])
+    for i in range(100, len(data)):
+        bar = data.iloc[i]
+        if i % 3 == 0:   # a provisional candle, then its final values
+            engine.update(data.index[i], (bar * 1.01).to_dict())
+        engine.update(data.index[i], bar.to_dict())
+    assert_matches_batch(engine.to_frame(), data)
+
+
+def test_extend_appends_and_detects_rewrites():
+    data = ohlcv(320, 5)
+    engine = IncrementalIndicatorEngine.from_frame(data.iloc[:300])
+    first = engine.to_frame()
+    assert engine.extend(data)
+    assert len(engine) == len(data)
+    assert_matches_batch(engine.to_frame(), data)
+    assert len(first) == len(compute_indicators(data.iloc[:300]).dropna())
+
+    rewritten = data.copy()
+    rewritten.iloc[5, rewritten.columns.get_loc("Close")] += 1
+    assert not engine.extend(rewritten)
+
+
+def test_outputs_and_cached_frames():
+    data = ohlcv(120, 6)
+    engine = IncrementalIndicatorEngine.from_frame(data)
+    outputs = ("SMA_20", "RSI", "MACD", "MACD_Signal", "SMA_200")
+    frame = engine.to_frame(outputs)
+    assert frame.attrs["skipped_indicators"] == ["SMA_200"]
+    assert {"SMA_20", "RSI", "MACD", "MACD_Signal"} <= set(frame.columns)
+    assert_matches_batch(frame, data, [name for name in outputs if name != "SMA_200"])
+
+    frame["extra"] = 1.0   # callers get their own frame
+    assert "extra" not in engine.to_frame(outputs).columns
+    assert len(IncrementalIndicatorEngine.from_frame(data.iloc[:40]).to_frame()) == 0